@@ -0,0 +1,166 @@
+#!/usr/bin/env python3
+"""
+Decoding Preset Benchmark
+Measures real-time factor (processing time / audio length) and word error rate of each
+decoding preset on reference clips.
+
+Reference clips live in one directory: every audio file needs a transcript next to it with
+the same name and a .txt extension (e.g. news01.wav + news01.txt). For Chinese/Japanese
+references the character error rate is reported instead of WER.
+
+    python benchmark_presets.py refs/ --model base
+    python benchmark_presets.py refs/ --model small --presets fast accurate --json results.json
+    python benchmark_presets.py refs/ --model small --batched   # also time batched decoding
+"""
+
+import re
+import sys
+import json
+import time
+import argparse
+import warnings
+import unicodedata
+from pathlib import Path
+
+import whisper
+import torch
+
+from decoding_presets import PRESETS, get_decode_options
+from whisper_batched import transcribe_batched, DEFAULT_BATCH_SIZE
+
+PROJECT_DIR = Path(__file__).parent
+MODELS_DIR = PROJECT_DIR / "models"
+
+AUDIO_EXTENSIONS = {'.wav', '.mp3', '.m4a', '.flac', '.ogg', '.mp4', '.mkv', '.webm'}
+CJK_RE = re.compile(r'[\u3040-\u30ff\u3400-\u4dbf\u4e00-\u9fff]')
+
+
+def normalize_tokens(text):
+    """Lower-case, strip punctuation and split into words (or characters for CJK text)"""
+    text = unicodedata.normalize('NFKC', text).lower()
+    text = ''.join(c if (c.isalnum() or c.isspace()) else ' ' for c in text)
+    if CJK_RE.search(text):
+        return [c for c in text if not c.isspace()], "CER"
+    return text.split(), "WER"
+
+
+def edit_distance(ref, hyp):
+    """Levenshtein distance between two token lists"""
+    prev = list(range(len(hyp) + 1))
+    for i, r in enumerate(ref, 1):
+        cur = [i] + [0] * len(hyp)
+        for j, h in enumerate(hyp, 1):
+            cur[j] = min(prev[j] + 1, cur[j - 1] + 1, prev[j - 1] + (r != h))
+        prev = cur
+    return prev[-1]
+
+
+def error_rate(reference, hypothesis):
+    ref, metric = normalize_tokens(reference)
+    hyp, _ = normalize_tokens(hypothesis)
+    if not ref:
+        return 0.0, 0, metric
+    return edit_distance(ref, hyp) / len(ref), len(ref), metric
+
+
+def find_clips(ref_dir):
+    clips = []
+    for path in sorted(Path(ref_dir).iterdir()):
+        if path.suffix.lower() in AUDIO_EXTENSIONS and path.with_suffix('.txt').exists():
+            clips.append(path)
+    return clips
+
+
+def run_benchmark(model, clips, presets, language=None, fp16=False, transcribe_fn=None, mode=None):
+    """
+    Transcribe every clip with every preset.
+    transcribe_fn(model, audio, decode_options) can replace model.transcribe (used for other decode
+    modes); mode names that decode mode in the results, e.g. "fast+batched".
+    Returns a list of per-preset summaries.
+    """
+    if transcribe_fn is None:
+        transcribe_fn = lambda m, audio, opts: m.transcribe(audio, verbose=None, fp16=fp16, **opts)
+    # Decode audio once up front so ffmpeg time is not counted against any preset
+    audios = {clip: whisper.load_audio(str(clip)) for clip in clips}
+    summaries = []
+    for preset in presets:
+        decode_options = get_decode_options(preset, language)
+        label = f"{preset}+{mode}" if mode else preset
+        total_audio = 0.0
+        total_time = 0.0
+        total_errors = 0.0
+        total_ref = 0
+        metric = "WER"
+        for clip in clips:
+            audio = audios[clip]
+            reference = clip.with_suffix('.txt').read_text(encoding='utf-8')
+            start = time.time()
+            with warnings.catch_warnings():
+                warnings.simplefilter("ignore")
+                result = transcribe_fn(model, audio, decode_options)
+            elapsed = time.time() - start
+            rate, ref_len, metric = error_rate(reference, result["text"])
+            duration = len(audio) / whisper.audio.SAMPLE_RATE
+            total_audio += duration
+            total_time += elapsed
+            total_errors += rate * ref_len
+            total_ref += ref_len
+            print(f"   {label:<16} {clip.name:<30} RTF {elapsed / duration:.3f}  {metric} {rate:.1%}")
+        summaries.append({
+            "preset": label,
+            "clips": len(clips),
+            "audio_seconds": round(total_audio, 1),
+            "processing_seconds": round(total_time, 1),
+            "rtf": round(total_time / total_audio, 4) if total_audio else None,
+            "metric": metric,
+            "error_rate": round(total_errors / total_ref, 4) if total_ref else None,
+        })
+    return summaries
+
+
+def print_table(summaries, model_name, device):
+    print(f"\n📊 Results ({model_name} on {device.upper()})")
+    print(f"| {'Preset':<16} | {'Clips':>5} | {'Audio (s)':>9} | {'RTF':>6} | {'WER/CER':>7} |")
+    print(f"|{'-' * 18}|{'-' * 7}|{'-' * 11}|{'-' * 8}|{'-' * 9}|")
+    for s in summaries:
+        err = f"{s['error_rate']:.1%}" if s['error_rate'] is not None else "n/a"
+        print(f"| {s['preset']:<16} | {s['clips']:>5} | {s['audio_seconds']:>9} | {s['rtf']:>6} | {err:>7} |")
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark Whisper decoding presets (RTF and WER)")
+    parser.add_argument("ref_dir", help="Directory with audio clips and matching .txt reference transcripts")
+    parser.add_argument("-m", "--model", default="base", help="Whisper model to use (default: base)")
+    parser.add_argument("--presets", nargs="+", choices=list(PRESETS), default=list(PRESETS), help="Presets to compare (default: all)")
+    parser.add_argument("--language", help="Language hint passed to every preset")
+    parser.add_argument("--cpu", action="store_true", help="Force CPU usage")
+    parser.add_argument("--batched", action="store_true", help="Also run every preset with batched decoding (whisper_batched.py)")
+    parser.add_argument("--batch-size", type=int, default=DEFAULT_BATCH_SIZE, help=f"Chunks per pass for --batched (default: {DEFAULT_BATCH_SIZE})")
+    parser.add_argument("--json", help="Also write the results to this JSON file")
+    args = parser.parse_args()
+
+    clips = find_clips(args.ref_dir)
+    if not clips:
+        print(f"❌ No clips with matching .txt references found in {args.ref_dir}")
+        return 1
+
+    device = "cuda" if torch.cuda.is_available() and not args.cpu else "cpu"
+    print(f"🎤 Loading Whisper model: {args.model} ({device})")
+    model = whisper.load_model(args.model, download_root=str(MODELS_DIR), device=device)
+    print(f"🎵 {len(clips)} reference clips, presets: {', '.join(args.presets)}")
+
+    summaries = run_benchmark(model, clips, args.presets, args.language, fp16=device == "cuda")
+    if args.batched:
+        batched = lambda m, audio, opts: transcribe_batched(m, audio, args.batch_size, fp16=device == "cuda", **opts)
+        summaries += run_benchmark(model, clips, args.presets, args.language, transcribe_fn=batched, mode="batched")
+    print_table(summaries, args.model, device)
+
+    if args.json:
+        with open(args.json, 'w', encoding='utf-8') as f:
+            json.dump({"model": args.model, "device": device, "results": summaries}, f, indent=2)
+        print(f"✅ Results saved to: {args.json}")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,75 @@
+#!/usr/bin/env python3
+"""
+Whisper Decoding Presets
+Named sets of decoding options for model.transcribe, shared by transcribe.py and the web app.
+
+- fast:     greedy decoding, no temperature fallback, no conditioning on previous text.
+            Each 30-second window is decoded exactly once.
+- balanced: Whisper's own defaults (greedy with temperature fallback). Same as before presets existed.
+- accurate: beam search (5 beams) with the full fallback schedule.
+
+Run benchmark_presets.py to measure real-time factor and WER of each preset on your own clips.
+"""
+
+# Whisper's default fallback temperatures
+FALLBACK_TEMPERATURES = (0.0, 0.2, 0.4, 0.6, 0.8, 1.0)
+
+PRESETS = {
+    "fast": {
+        "temperature": (0.0,),
+        "beam_size": None,
+        "best_of": None,
+        "condition_on_previous_text": False,
+        "compression_ratio_threshold": 2.4,
+        "logprob_threshold": -1.0,
+        "no_speech_threshold": 0.6,
+    },
+    "balanced": {
+        "temperature": FALLBACK_TEMPERATURES,
+        "beam_size": None,
+        "best_of": None,
+        "condition_on_previous_text": True,
+        "compression_ratio_threshold": 2.4,
+        "logprob_threshold": -1.0,
+        "no_speech_threshold": 0.6,
+    },
+    "accurate": {
+        "temperature": FALLBACK_TEMPERATURES,
+        "beam_size": 5,
+        "best_of": 5,
+        "patience": 1.0,
+        "condition_on_previous_text": True,
+        "compression_ratio_threshold": 2.4,
+        "logprob_threshold": -1.0,
+        "no_speech_threshold": 0.6,
+    },
+}
+
+DEFAULT_PRESET = "balanced"
+
+
+def normalize_language(language):
+    """
+    Language code for a language hint given as a code or a name ("zh", "Chinese", "mandarin"),
+    None for no hint. Raises ValueError for languages Whisper does not know, so a typo is
+    rejected when the job is submitted instead of failing at decode time.
+    """
+    if not language or not language.strip():
+        return None
+    from whisper.tokenizer import LANGUAGES, TO_LANGUAGE_CODE
+    language = language.strip().lower()
+    if language in LANGUAGES:
+        return language
+    if language in TO_LANGUAGE_CODE:
+        return TO_LANGUAGE_CODE[language]
+    raise ValueError(f"Unknown language '{language}' (use a code such as en, zh, ja or a name such as English)")
+
+
+def get_decode_options(preset=DEFAULT_PRESET, language=None):
+    """Return keyword arguments for model.transcribe for a preset, with an optional language hint"""
+    if preset not in PRESETS:
+        raise ValueError(f"Unknown decoding preset '{preset}' (choose from {', '.join(PRESETS)})")
+    options = {k: v for k, v in PRESETS[preset].items() if v is not None}
+    if language:
+        options["language"] = language
+    return options
@@ -0,0 +1,69 @@
+#!/usr/bin/env python3
+"""
+Fake Translation Server
+A local LibreTranslate-compatible endpoint for trying out transcribe.py's translation engine
+without calling a real service. Each input line comes back prefixed with "[zh] ".
+
+    python fake_translate_server.py --port 5005 --delay 0.2 --fail-rate 0.1
+    python transcribe.py audio.wav --translate-zh --translate-engine libre --translate-url http://127.0.0.1:5005
+"""
+
+import json
+import time
+import random
+import argparse
+import threading
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+
+class FakeTranslateHandler(BaseHTTPRequestHandler):
+    delay = 0.0
+    fail_rate = 0.0
+    requests_seen = 0
+    lock = threading.Lock()
+
+    def do_POST(self):
+        if self.path.rstrip("/") != "/translate":
+            self.send_error(404)
+            return
+        with FakeTranslateHandler.lock:
+            FakeTranslateHandler.requests_seen += 1
+        length = int(self.headers.get("Content-Length", 0))
+        body = json.loads(self.rfile.read(length) or b"{}")
+        time.sleep(self.delay)
+        if random.random() < self.fail_rate:
+            self.send_error(503, "Simulated failure")
+            return
+        lines = body.get("q", "").split("\n")
+        translated = "\n".join(f"[zh] {line}" for line in lines)
+        data = json.dumps({"translatedText": translated}, ensure_ascii=False).encode("utf-8")
+        self.send_response(200)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(data)))
+        self.end_headers()
+        self.wfile.write(data)
+
+    def log_message(self, format, *args):
+        pass
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Local fake LibreTranslate-compatible server")
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=5005)
+    parser.add_argument("--delay", type=float, default=0.0, help="Seconds to wait before answering each request")
+    parser.add_argument("--fail-rate", type=float, default=0.0, help="Fraction of requests answered with HTTP 503")
+    args = parser.parse_args()
+
+    FakeTranslateHandler.delay = args.delay
+    FakeTranslateHandler.fail_rate = args.fail_rate
+    server = ThreadingHTTPServer((args.host, args.port), FakeTranslateHandler)
+    print(f"🧪 Fake translation server on http://{args.host}:{args.port}/translate")
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        print(f"\n👋 Stopped after {FakeTranslateHandler.requests_seen} requests")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,125 @@
+#!/usr/bin/env python3
+"""
+Live Transcription Test Client
+Replays an audio file at real-time speed to the web app's /ws/live WebSocket, as if it were a
+live feed, and prints partial and final captions with their latency.
+
+    python live_client.py meeting.wav
+    python live_client.py radio.mp3 --opus --language zh --speed 2
+    python live_client.py talk.m4a --url ws://server:5001/ws/live --model small
+
+Latency is how far the audio being sent is past the end of a final segment when that segment
+arrives, i.e. how long a viewer waits for a caption to become final.
+"""
+
+import os
+import sys
+import json
+import time
+import argparse
+import threading
+import subprocess
+from urllib.parse import urlencode
+
+from simple_websocket import Client, ConnectionClosed
+
+SAMPLE_RATE = 16000
+# Bytes per chunk sent over the socket (100 ms of s16le mono)
+CHUNK_BYTES = SAMPLE_RATE // 10 * 2
+
+
+def format_time(seconds):
+    return f"{int(seconds // 60):02}:{seconds % 60:04.1f}"
+
+
+def ffmpeg_command(audio_file, opus, speed):
+    # -re / -readrate make ffmpeg deliver the audio at (a multiple of) real time
+    pace = ["-re"] if speed == 1 else ["-readrate", str(speed)]
+    cmd = ["ffmpeg", "-nostdin", "-loglevel", "error", *pace, "-i", audio_file, "-ac", "1", "-ar", str(SAMPLE_RATE)]
+    if opus:
+        # Short Ogg pages so packets are not held back for a whole second
+        return cmd + ["-c:a", "libopus", "-b:a", "32k", "-page_duration", "100000", "-f", "ogg", "pipe:1"]
+    return cmd + ["-f", "s16le", "-acodec", "pcm_s16le", "pipe:1"]
+
+
+def send_audio(ws, proc):
+    fd = proc.stdout.fileno()
+    try:
+        while True:
+            data = os.read(fd, CHUNK_BYTES)
+            if not data:
+                break
+            ws.send(data)
+        ws.send(json.dumps({"type": "stop"}))
+    except ConnectionClosed:
+        pass
+    finally:
+        proc.wait()
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Replay an audio file to the live transcription WebSocket")
+    parser.add_argument("audio_file", help="Audio or video file to replay")
+    parser.add_argument("--url", default="ws://localhost:5001/ws/live", help="WebSocket endpoint (default: ws://localhost:5001/ws/live)")
+    parser.add_argument("-m", "--model", help="Whisper model on the server (default: server's WHISPER_LIVE_MODEL)")
+    parser.add_argument("--language", help="Language code, skips detection (e.g. en, zh)")
+    parser.add_argument("--opus", action="store_true", help="Send Ogg/Opus instead of raw 16 kHz PCM")
+    parser.add_argument("--speed", type=float, default=1.0, help="Replay speed, 1 = real time (default: 1)")
+    args = parser.parse_args()
+
+    if not os.path.exists(args.audio_file):
+        print(f"❌ File not found: {args.audio_file}")
+        return 1
+
+    params = {"format": "opus" if args.opus else "pcm"}
+    if args.model:
+        params["model"] = args.model
+    if args.language:
+        params["language"] = args.language
+    ws = Client.connect(f"{args.url}?{urlencode(params)}")
+    ready = json.loads(ws.receive())
+    if ready.get("type") != "ready":
+        print(f"❌ Server refused the session: {ready.get('error', ready)}")
+        return 1
+    print(f"🎙️  Streaming {args.audio_file} ({params['format']}, {args.speed}x) to {args.url}")
+    print(f"🤖 Server model: {ready['model']} on {ready['device'].upper()}")
+
+    proc = subprocess.Popen(ffmpeg_command(args.audio_file, args.opus, args.speed), stdout=subprocess.PIPE)
+    start = time.time()
+    sender = threading.Thread(target=send_audio, args=(ws, proc), daemon=True)
+    sender.start()
+
+    latencies = []
+    try:
+        while True:
+            msg = json.loads(ws.receive())
+            position = (time.time() - start) * args.speed
+            if msg["type"] == "partial":
+                text = msg["text"][-100:]
+                print(f"\r\033[K… {text}", end="", flush=True)
+            elif msg["type"] == "final":
+                latency = max(position - msg["end"], 0.0)
+                latencies.append(latency)
+                print(f"\r\033[K[{format_time(msg['start'])} → {format_time(msg['end'])}] {msg['text']}  (+{latency:.1f}s)")
+            elif msg["type"] == "error":
+                print(f"\n❌ Server error: {msg['error']}")
+                return 1
+            elif msg["type"] == "done":
+                print(f"\r\033[K✅ Done: {msg['audio_seconds']}s of audio in {time.time() - start:.1f}s")
+                break
+    except (ConnectionClosed, KeyboardInterrupt):
+        print("\n⚠️  Connection closed")
+    finally:
+        proc.kill()
+        ws.close()
+
+    if latencies:
+        latencies.sort()
+        p50 = latencies[len(latencies) // 2]
+        p95 = latencies[min(int(len(latencies) * 0.95), len(latencies) - 1)]
+        print(f"📊 {len(latencies)} final segments, latency p50 {p50:.1f}s, p95 {p95:.1f}s, max {latencies[-1]:.1f}s")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
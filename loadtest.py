@@ -0,0 +1,324 @@
+#!/usr/bin/env python3
+"""
+Load Test
+Replays a mix of uploads against the web app at a target arrival rate, follows every job to
+the end through /task_status, and reports throughput, end-to-end latency percentiles, queue
+wait and error rate.
+
+Start the app with the fake model, so a run costs no model time:
+
+    WHISPER_FAKE_MODEL=1 WHISPER_FAKE_RTF=0.05 python whisper_web/app.py
+    python loadtest.py --rate 0.5 --jobs 50
+    python loadtest.py --mix mix.json --rate 2 --seconds 300 --json report.json
+
+A mix file is a JSON list of upload kinds, picked at random by weight:
+
+    [{"name": "clip", "weight": 6, "duration": 30, "format": "mp3"},
+     {"name": "lecture", "weight": 1, "duration": 3600, "format": "m4a", "bitrate": "64k", "translate": true},
+     {"name": "interview", "weight": 1, "file": "samples/interview.wav", "output": "srt", "model": "small"}]
+
+Kinds without "file" are generated once with ffmpeg: a tone of the given duration in the
+given container, "bitrate" sets the upload size. Other keys: "stream", "preset", "language", "cpu".
+Arrivals are Poisson by default (--arrival uniform for a fixed interval) and open loop: a slow
+server does not slow down the arrivals, so queueing shows up in the latencies.
+"""
+
+import os
+import sys
+import json
+import math
+import time
+import uuid
+import random
+import argparse
+import datetime
+import threading
+import subprocess
+import http.client
+from pathlib import Path
+from urllib.parse import urlsplit
+
+DEFAULT_MIX = [
+    {"name": "short", "weight": 6, "duration": 30, "format": "mp3"},
+    {"name": "medium", "weight": 3, "duration": 300, "format": "m4a"},
+    {"name": "long-zh", "weight": 1, "duration": 1200, "format": "wav", "translate": True},
+]
+DONE_STATES = ("SUCCESS", "FAILURE", "CANCELLED")
+UPLOAD_CHUNK = 256 * 1024
+
+
+def generate_media(kind, media_dir):
+    """Create (once) a tone of the kind's duration and format with ffmpeg"""
+    bitrate = kind.get("bitrate")
+    name = f"tone_{kind['duration']}s{'_' + bitrate if bitrate else ''}.{kind.get('format', 'mp3')}"
+    path = Path(media_dir) / name
+    if not path.exists():
+        path.parent.mkdir(parents=True, exist_ok=True)
+        cmd = ["ffmpeg", "-nostdin", "-loglevel", "error", "-y",
+               "-f", "lavfi", "-i", f"sine=frequency=440:duration={kind['duration']}", "-ac", "1", "-ar", "16000"]
+        if bitrate:
+            cmd += ["-b:a", bitrate]
+        tmp_path = path.with_name("tmp_" + name)
+        subprocess.run(cmd + [str(tmp_path)], check=True)
+        os.replace(tmp_path, path)
+    return path
+
+
+def load_mix(path, media_dir):
+    mix = DEFAULT_MIX
+    if path:
+        with open(path, "r", encoding="utf-8") as f:
+            mix = json.load(f)
+    kinds = []
+    for i, kind in enumerate(mix):
+        kind = dict(kind)
+        kind.setdefault("name", kind.get("file") and Path(kind["file"]).stem or f"kind{i + 1}")
+        if kind.get("file"):
+            kind["path"] = Path(kind["file"])
+        else:
+            kind["path"] = generate_media(kind, media_dir)
+        kind["size"] = kind["path"].stat().st_size
+        kinds.append(kind)
+    return kinds
+
+
+def percentile(values, p):
+    """Nearest-rank percentile of a list, None if it is empty"""
+    if not values:
+        return None
+    values = sorted(values)
+    return values[max(0, math.ceil(p / 100 * len(values)) - 1)]
+
+
+class ServiceClient:
+    def __init__(self, base_url, timeout=60):
+        parts = urlsplit(base_url)
+        self.host = parts.hostname
+        self.port = parts.port or 80
+        self.timeout = timeout
+
+    def _connection(self):
+        return http.client.HTTPConnection(self.host, self.port, timeout=self.timeout)
+
+    def upload(self, path, filename, fields):
+        """POST one file to / like the upload form; returns the job id from the redirect"""
+        boundary = uuid.uuid4().hex
+        head = b"".join(
+            f'--{boundary}\r\nContent-Disposition: form-data; name="{key}"\r\n\r\n{value}\r\n'.encode("utf-8")
+            for key, value in fields.items()
+        )
+        head += (f'--{boundary}\r\nContent-Disposition: form-data; name="file"; filename="{filename}"\r\n'
+                 f'Content-Type: application/octet-stream\r\n\r\n').encode("utf-8")
+        tail = f"\r\n--{boundary}--\r\n".encode("utf-8")
+
+        def body():
+            yield head
+            with open(path, "rb") as f:
+                while True:
+                    chunk = f.read(UPLOAD_CHUNK)
+                    if not chunk:
+                        break
+                    yield chunk
+            yield tail
+
+        conn = self._connection()
+        try:
+            # Content-Length is set, so http.client sends the chunks as they are, not chunk-encoded
+            conn.request("POST", "/", body=body(), headers={
+                "Content-Type": f"multipart/form-data; boundary={boundary}",
+                "Content-Length": str(len(head) + os.path.getsize(path) + len(tail)),
+            })
+            resp = conn.getresponse()
+            resp.read()
+            location = resp.getheader("Location") or ""
+            if resp.status not in (301, 302, 303) or "/progress/" not in location:
+                raise RuntimeError(f"upload rejected (HTTP {resp.status})")
+            return location.rstrip("/").rsplit("/", 1)[-1]
+        finally:
+            conn.close()
+
+    def status(self, job_id, etag=None):
+        """Returns (payload or None if unchanged, etag)"""
+        conn = self._connection()
+        try:
+            conn.request("GET", f"/task_status/{job_id}", headers={"If-None-Match": etag} if etag else {})
+            resp = conn.getresponse()
+            data = resp.read()
+            if resp.status == 304:
+                return None, etag
+            if resp.status != 200:
+                raise RuntimeError(f"status poll failed (HTTP {resp.status})")
+            return json.loads(data), resp.getheader("ETag")
+        finally:
+            conn.close()
+
+
+def _seconds_between(start_iso, end_iso):
+    try:
+        return (datetime.datetime.fromisoformat(end_iso) - datetime.datetime.fromisoformat(start_iso)).total_seconds()
+    except (TypeError, ValueError):
+        return None
+
+
+def run_job(client, number, kind, poll_interval, job_timeout):
+    """Upload one file and poll its job until it ends; returns the job's measurements"""
+    record = {"number": number, "kind": kind["name"], "bytes": kind["size"], "submitted": time.time()}
+    fields = {
+        "model": kind.get("model", "base"),
+        "format": kind.get("output", "txt"),
+        "output_dir": "",
+        "preset": kind.get("preset", ""),
+        "language": kind.get("language", ""),
+    }
+    for flag, form_name in (("translate", "translate_zh"), ("stream", "stream"), ("cpu", "cpu")):
+        if kind.get(flag):
+            fields[form_name] = "on"
+    try:
+        # Unique names, so concurrent uploads of the same kind do not overwrite each other
+        filename = f"lt{number:05d}_{kind['path'].name}"
+        record["job_id"] = client.upload(kind["path"], filename, fields)
+        record["upload_seconds"] = time.time() - record["submitted"]
+        etag = None
+        job = {}
+        deadline = record["submitted"] + job_timeout
+        while True:
+            payload, etag = client.status(record["job_id"], etag)
+            if payload is not None:
+                job = payload
+            if job.get("state") in DONE_STATES:
+                break
+            if time.time() > deadline:
+                raise TimeoutError(f"still {job.get('state')} after {job_timeout:.0f}s")
+            time.sleep(poll_interval)
+        record["state"] = job["state"]
+        if job["state"] == "FAILURE":
+            record["error"] = (job.get("error") or "").splitlines()[0][:200] if job.get("error") else "FAILURE"
+        record["queue_wait"] = _seconds_between(job.get("queued_at"), job.get("start_time"))
+        record["media_duration"] = job.get("media_duration")
+    except TimeoutError as e:
+        record["state"] = "TIMEOUT"
+        record["error"] = str(e)
+    except Exception as e:
+        record["state"] = "ERROR"
+        record["error"] = str(e)
+    record["finished"] = time.time()
+    record["latency"] = record["finished"] - record["submitted"]
+    return record
+
+
+def summarize(records, wall_seconds):
+    ok = [r for r in records if r["state"] == "SUCCESS"]
+    errors = [r for r in records if r["state"] != "SUCCESS"]
+
+    def dist(values):
+        values = [v for v in values if v is not None]
+        d = {f"p{p}": percentile(values, p) for p in (50, 95, 99)}
+        d["max"] = max(values) if values else None
+        return d
+
+    error_counts = {}
+    for r in errors:
+        error_counts[r["state"]] = error_counts.get(r["state"], 0) + 1
+    audio_seconds = sum(r.get("media_duration") or 0 for r in ok)
+    return {
+        "jobs": len(records),
+        "succeeded": len(ok),
+        "wall_seconds": wall_seconds,
+        "throughput_jobs_per_sec": len(ok) / wall_seconds if wall_seconds > 0 else None,
+        "audio_seconds_per_sec": audio_seconds / wall_seconds if wall_seconds > 0 else None,
+        "latency": dist([r["latency"] for r in ok]),
+        "queue_wait": dist([r.get("queue_wait") for r in ok]),
+        "upload": dist([r.get("upload_seconds") for r in records]),
+        "error_rate": len(errors) / len(records) if records else 0.0,
+        "errors": error_counts,
+    }
+
+
+def _fmt(value, unit="s"):
+    return "-" if value is None else f"{value:.1f}{unit}"
+
+
+def print_report(summary, records, rate):
+    print(f"\n📊 {summary['jobs']} jobs in {summary['wall_seconds']:.1f}s (offered {rate:.2f} jobs/s)")
+    print(f"   Throughput: {_fmt(summary['throughput_jobs_per_sec'], ' jobs/s')}, "
+          f"{_fmt(summary['audio_seconds_per_sec'], 'x')} real time")
+    for label, key in (("Latency", "latency"), ("Queue wait", "queue_wait"), ("Upload", "upload")):
+        d = summary[key]
+        print(f"   {label:<11} p50 {_fmt(d['p50']):>8}  p95 {_fmt(d['p95']):>8}  p99 {_fmt(d['p99']):>8}  max {_fmt(d['max']):>8}")
+    errors = ", ".join(f"{state} {count}" for state, count in sorted(summary["errors"].items()))
+    print(f"   Errors: {summary['jobs'] - summary['succeeded']} ({summary['error_rate']:.1%}){': ' + errors if errors else ''}")
+    print(f"\n   {'Kind':<14} {'Jobs':>5} {'OK':>5} {'p50':>8} {'p95':>8}")
+    for name in sorted({r["kind"] for r in records}):
+        latencies = [r["latency"] for r in records if r["kind"] == name and r["state"] == "SUCCESS"]
+        jobs = sum(1 for r in records if r["kind"] == name)
+        print(f"   {name:<14} {jobs:>5} {len(latencies):>5} {_fmt(percentile(latencies, 50)):>8} {_fmt(percentile(latencies, 95)):>8}")
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Load test the Whisper web app with a mix of uploads")
+    parser.add_argument("--url", default="http://127.0.0.1:5001", help="Web app address (default: %(default)s)")
+    parser.add_argument("--mix", help="JSON file with the upload mix (default: built-in short/medium/long mix)")
+    parser.add_argument("--rate", type=float, default=0.2, help="Target arrival rate in jobs per second")
+    parser.add_argument("--jobs", type=int, default=20, help="Number of jobs to submit (ignored with --seconds)")
+    parser.add_argument("--seconds", type=float, help="Submit jobs for this long instead of a fixed count")
+    parser.add_argument("--arrival", choices=["poisson", "uniform"], default="poisson")
+    parser.add_argument("--poll-interval", type=float, default=0.5, help="Seconds between status polls per job")
+    parser.add_argument("--job-timeout", type=float, default=3600, help="Give up on a job after this many seconds")
+    parser.add_argument("--media-dir", default=".loadtest_media", help="Where generated upload files are kept")
+    parser.add_argument("--seed", type=int, default=0, help="Random seed for the mix and arrival times")
+    parser.add_argument("--json", help="Also write the summary and per-job records to this file")
+    args = parser.parse_args()
+
+    kinds = load_mix(args.mix, args.media_dir)
+    print("🧪 Mix: " + ", ".join(f"{k['name']} (w={k.get('weight', 1)}, {k['size'] / 1e6:.1f} MB)" for k in kinds))
+    client = ServiceClient(args.url)
+    rng = random.Random(args.seed)
+    records = []
+    records_lock = threading.Lock()
+
+    def worker(number, kind):
+        record = run_job(client, number, kind, args.poll_interval, args.job_timeout)
+        with records_lock:
+            records.append(record)
+            icon = "✅" if record["state"] == "SUCCESS" else "❌"
+            print(f"   {icon} #{number} {record['kind']}: {record['state']} after {record['latency']:.1f}s"
+                  f"{' (' + record['error'] + ')' if record.get('error') else ''}")
+
+    print(f"🚀 Sending to {args.url} at {args.rate:.2f} jobs/s ({args.arrival} arrivals)")
+    threads = []
+    start = time.time()
+    next_arrival = start
+    number = 0
+    try:
+        while (time.time() - start < args.seconds) if args.seconds else (number < args.jobs):
+            time.sleep(max(0.0, next_arrival - time.time()))
+            number += 1
+            kind = rng.choices(kinds, weights=[k.get("weight", 1) for k in kinds])[0]
+            thread = threading.Thread(target=worker, args=(number, kind), daemon=True)
+            thread.start()
+            threads.append(thread)
+            gap = rng.expovariate(args.rate) if args.arrival == "poisson" else 1 / args.rate
+            next_arrival += gap
+        print(f"⏳ {number} jobs submitted, waiting for them to finish...")
+        for thread in threads:
+            thread.join()
+    except KeyboardInterrupt:
+        print("\n⚠️  Interrupted, reporting the jobs finished so far")
+    wall_seconds = time.time() - start
+
+    with records_lock:
+        records = sorted(records, key=lambda r: r["number"])
+    if not records:
+        print("❌ No job finished")
+        return 1
+    summary = summarize(records, wall_seconds)
+    print_report(summary, records, args.rate)
+    if args.json:
+        with open(args.json, "w", encoding="utf-8") as f:
+            json.dump({"summary": summary, "jobs": records}, f, indent=2, ensure_ascii=False)
+        print(f"\n💾 Report written to {args.json}")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
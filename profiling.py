@@ -0,0 +1,399 @@
+#!/usr/bin/env python3
+"""
+Whisper Run Profiler
+Shows where the time of one transcription goes: ffmpeg, mel spectrogram, encoder, decoder,
+temperature-fallback retries, translation, post-processing and writing the outputs.
+Used by `transcribe.py --profile` and by web jobs submitted with "Profile this job".
+
+    from profiling import Profiler, stage
+    profiler = Profiler()
+    with profiler, profiler.instrument(model):
+        result = model.transcribe("talk.mp3")
+        with stage("postprocess"):
+            ...
+    profiler.write("outputs/talk.profile")
+
+stage(name) marks a part of the run; it costs nothing when no profiler is running in the
+thread, so pipeline code can be marked unconditionally. Threads started for a profiled run
+are followed when their target is wrapped in profiler.bind(target).
+
+Artifacts written by Profiler.write(directory):
+- stages.txt       time per stage (total and self), calls and share of the run, decode counters
+- stages.json      the same as JSON
+- python.prof      cProfile stats (open with snakeviz, or pstats)
+- python.txt       the top functions by cumulative time
+- python.folded    sampled stacks in the collapsed format of flamegraph.pl, speedscope and inferno,
+                   with the stage names as the outermost frames
+- torch_trace.json operator-level trace (chrome://tracing or ui.perfetto.dev), stages labelled
+- torch_ops.txt    operator table by self time
+The torch artifacts need PyTorch; set WHISPER_PROFILE_TORCH=0 to skip them (the trace of a
+long file can be large). The torch profiler is process-wide, so when two profiled runs
+overlap only the first gets a torch trace.
+"""
+
+import io
+import os
+import sys
+import json
+import time
+import pstats
+import cProfile
+import threading
+from collections import Counter, defaultdict
+from contextlib import contextmanager
+
+PROFILE_TORCH = os.environ.get("WHISPER_PROFILE_TORCH", "1") != "0"
+# Stack sampling period for python.folded
+SAMPLE_INTERVAL = float(os.environ.get("WHISPER_PROFILE_SAMPLE_INTERVAL", "0.005"))
+# Rows in python.txt and torch_ops.txt
+TOP_ROWS = 40
+
+_local = threading.local()
+_torch_lock = threading.Lock()
+_patch_lock = threading.Lock()
+_patch_count = 0
+_patched = []
+
+
+def current():
+    """The profiler running in this thread, or None"""
+    return getattr(_local, "profiler", None)
+
+
+@contextmanager
+def stage(name):
+    """Time a stage of the run under the current thread's profiler (no-op without one)"""
+    profiler = current()
+    if profiler is None:
+        yield
+        return
+    profiler._enter(name)
+    try:
+        yield
+    finally:
+        profiler._exit(name)
+
+
+def count(name, n=1):
+    """Add to a counter of the current thread's profiler (no-op without one)"""
+    profiler = current()
+    if profiler is not None:
+        profiler.count(name, n)
+
+
+def bind(target):
+    """profiler.bind(target) for the current thread's profiler; target unchanged without one"""
+    profiler = current()
+    return profiler.bind(target) if profiler is not None else target
+
+
+def _staged(name, fn):
+    def wrapper(*args, **kwargs):
+        with stage(name):
+            return fn(*args, **kwargs)
+    wrapper.__wrapped__ = fn
+    return wrapper
+
+
+def _patch_whisper():
+    """Route whisper's ffmpeg and mel functions through stage(); shared by all profiled runs"""
+    global _patch_count
+    with _patch_lock:
+        _patch_count += 1
+        if _patch_count > 1:
+            return
+        try:
+            import whisper
+            import whisper.audio
+            import whisper.transcribe
+        except ImportError:
+            return
+        targets = [
+            (whisper.audio, "load_audio", "ffmpeg"),
+            (whisper, "load_audio", "ffmpeg"),
+            (whisper.audio, "log_mel_spectrogram", "mel"),
+            (whisper.transcribe, "log_mel_spectrogram", "mel"),
+        ]
+        for module, attr, name in targets:
+            original = getattr(module, attr, None)
+            if original is not None:
+                setattr(module, attr, _staged(name, original))
+                _patched.append((module, attr, original))
+
+
+def _unpatch_whisper():
+    global _patch_count
+    with _patch_lock:
+        _patch_count -= 1
+        if _patch_count > 0:
+            return
+        while _patched:
+            module, attr, original = _patched.pop()
+            setattr(module, attr, original)
+
+
+class Profiler:
+    """One profiled run: cProfile, a stack sampler, optional torch trace and the stage timings"""
+
+    def __init__(self, torch_trace=PROFILE_TORCH, sample_interval=SAMPLE_INTERVAL):
+        self.torch_trace = torch_trace
+        self.sample_interval = sample_interval
+        self.totals = defaultdict(float)
+        self.selfs = defaultdict(float)
+        self.calls = Counter()
+        self.counters = Counter()
+        self.samples = Counter()
+        self.wall_seconds = 0.0
+        # Time of the run's thread spent inside any stage; the rest is reported as "(other)"
+        self.staged_seconds = 0.0
+        self.notes = []
+        self._lock = threading.Lock()
+        # Per thread: stack of [name, start, child_seconds, torch range]
+        self._stacks = {}
+        self._profiles = []
+        self._main_profile = None
+        self._torch = None
+        self._cuda = False
+        self._stop = threading.Event()
+        self._sampler = None
+        self._start = None
+
+    # --- run ---
+
+    def start(self):
+        self._start = time.perf_counter()
+        self._main_ident = threading.get_ident()
+        _local.profiler = self
+        self._stacks[threading.get_ident()] = []
+        if self.torch_trace:
+            self._start_torch()
+        self._sampler = threading.Thread(target=self._sample, daemon=True)
+        self._sampler.start()
+        self._main_profile = self._enable_profile()
+        return self
+
+    def stop(self):
+        if self._main_profile is not None:
+            self._main_profile.disable()
+        self._stop.set()
+        self._sampler.join()
+        if self._torch is not None:
+            self._torch.__exit__(None, None, None)
+            _torch_lock.release()
+        self.wall_seconds = time.perf_counter() - self._start
+        _local.profiler = None
+
+    def __enter__(self):
+        return self.start()
+
+    def __exit__(self, *exc):
+        self.stop()
+        return False
+
+    def bind(self, target):
+        """Wrap a thread target so the thread's stages, calls and stacks count towards this run"""
+        def run(*args, **kwargs):
+            _local.profiler = self
+            self._stacks[threading.get_ident()] = []
+            profile = self._enable_profile()
+            try:
+                return target(*args, **kwargs)
+            finally:
+                if profile is not None:
+                    profile.disable()
+                self._stacks.pop(threading.get_ident(), None)
+                _local.profiler = None
+        return run
+
+    def _enable_profile(self):
+        """Start cProfile in this thread; None if another profiler is active (Python 3.12+ allows one per process)"""
+        profile = cProfile.Profile()
+        try:
+            profile.enable()
+        except ValueError as e:
+            self.notes.append(f"cProfile not started in thread {threading.get_ident()}: {e}")
+            return None
+        with self._lock:
+            self._profiles.append(profile)
+        return profile
+
+    def _start_torch(self):
+        try:
+            import torch
+            from torch.profiler import profile, ProfilerActivity
+        except ImportError:
+            self.notes.append("torch not installed: no operator trace")
+            return
+        if not _torch_lock.acquire(blocking=False):
+            self.notes.append("another profiled run holds the torch profiler: no operator trace")
+            return
+        self._cuda = torch.cuda.is_available()
+        activities = [ProfilerActivity.CPU] + ([ProfilerActivity.CUDA] if self._cuda else [])
+        self._torch = profile(activities=activities)
+        self._torch.__enter__()
+
+    def _sample(self):
+        """Record the Python stack of every thread of this run, prefixed with its open stages"""
+        while not self._stop.wait(self.sample_interval):
+            frames = sys._current_frames()
+            for ident, stack in list(self._stacks.items()):
+                frame = frames.get(ident)
+                if frame is None:
+                    continue
+                names = []
+                while frame is not None:
+                    code = frame.f_code
+                    names.append(f"{code.co_name} ({os.path.basename(code.co_filename)}:{code.co_firstlineno})")
+                    frame = frame.f_back
+                prefix = [f"[{entry[0]}]" for entry in list(stack)]
+                self.samples[";".join(prefix + names[::-1])] += 1
+
+    # --- stages ---
+
+    def _enter(self, name):
+        entry = [name, time.perf_counter(), 0.0, None]
+        if self._torch is not None:
+            import torch
+            entry[3] = torch.profiler.record_function(name)
+            entry[3].__enter__()
+        self._stacks.setdefault(threading.get_ident(), []).append(entry)
+
+    def _exit(self, name):
+        stack = self._stacks.get(threading.get_ident(), [])
+        if not any(entry[0] == name for entry in stack):
+            return
+        # Stages left open by an exception inside them (a forward hook that never ran) are dropped
+        while stack[-1][0] != name:
+            torch_range = stack.pop()[3]
+            if torch_range is not None:
+                torch_range.__exit__(None, None, None)
+        if self._cuda and name in ("encoder", "decoder"):
+            # Kernels run asynchronously; wait for them so the time lands in the right stage
+            import torch
+            torch.cuda.synchronize()
+        name, started, child, torch_range = stack.pop()
+        if torch_range is not None:
+            torch_range.__exit__(None, None, None)
+        elapsed = time.perf_counter() - started
+        with self._lock:
+            self.totals[name] += elapsed
+            self.selfs[name] += elapsed - child
+            self.calls[name] += 1
+        if stack:
+            stack[-1][2] += elapsed
+        elif threading.get_ident() == self._main_ident:
+            self.staged_seconds += elapsed
+
+    def count(self, name, n=1):
+        with self._lock:
+            self.counters[name] += n
+
+    @contextmanager
+    def instrument(self, model):
+        """
+        Time the parts of a loaded model for the duration of the block: whisper's ffmpeg and mel
+        calls, encoder and decoder forward passes, and every model.decode call, split into
+        first attempts ("decode") and temperature-fallback retries ("fallback").
+        """
+        original = model.__dict__.get("decode")
+        wrapped = model.decode
+
+        def decode(*args, **kwargs):
+            options = kwargs.get("options", args[1] if len(args) > 1 else None)
+            retry = (getattr(options, "temperature", 0) or 0) > 0
+            name = "fallback" if retry else "decode"
+            self.count("fallback_retries" if retry else "decode_calls")
+            with stage(name):
+                return wrapped(*args, **kwargs)
+
+        model.decode = decode
+        hooks = []
+        for part in ("encoder", "decoder"):
+            module = getattr(model, part, None)
+            if hasattr(module, "register_forward_pre_hook"):
+                hooks.append(module.register_forward_pre_hook(lambda *a, part=part: self._enter(part)))
+                hooks.append(module.register_forward_hook(lambda *a, part=part: self._exit(part)))
+        _patch_whisper()
+        try:
+            yield model
+        finally:
+            _unpatch_whisper()
+            for hook in hooks:
+                hook.remove()
+            if original is not None:
+                model.decode = original
+            else:
+                del model.decode
+
+    # --- reports ---
+
+    def stage_summary(self):
+        """Per-stage seconds (total, self), calls and share of the run, plus the counters"""
+        stages = {}
+        for name in sorted(self.totals, key=self.totals.get, reverse=True):
+            stages[name] = {
+                "calls": self.calls[name],
+                "total_seconds": round(self.totals[name], 3),
+                "self_seconds": round(self.selfs[name], 3),
+                "share": round(self.totals[name] / self.wall_seconds, 4) if self.wall_seconds else None,
+            }
+        other = max(self.wall_seconds - self.staged_seconds, 0.0)
+        stages["(other)"] = {
+            "calls": 1,
+            "total_seconds": round(other, 3),
+            "self_seconds": round(other, 3),
+            "share": round(other / self.wall_seconds, 4) if self.wall_seconds else None,
+        }
+        return {"wall_seconds": round(self.wall_seconds, 3), "stages": stages,
+                "counters": dict(self.counters), "notes": list(self.notes)}
+
+    def format_table(self):
+        summary = self.stage_summary()
+        lines = [f"Profiled run: {summary['wall_seconds']:.2f}s wall time", "",
+                 f"{'Stage':<12} {'Calls':>7} {'Total s':>10} {'Self s':>10} {'% of run':>9}",
+                 f"{'-' * 12} {'-' * 7} {'-' * 10} {'-' * 10} {'-' * 9}"]
+        for name, s in summary["stages"].items():
+            share = f"{s['share']:.1%}" if s["share"] is not None else "n/a"
+            lines.append(f"{name:<12} {s['calls']:>7} {s['total_seconds']:>10.3f} {s['self_seconds']:>10.3f} {share:>9}")
+        lines.append("")
+        lines.append("Stages nest (decode contains encoder and decoder, mel contains ffmpeg for whole-file")
+        lines.append("runs); 'Self s' excludes the nested stages. (other) is the run's time outside any stage.")
+        for name, value in sorted(summary["counters"].items()):
+            lines.append(f"{name}: {value}")
+        for note in summary["notes"]:
+            lines.append(f"note: {note}")
+        return "\n".join(lines) + "\n"
+
+    def write(self, directory):
+        """Write all artifacts into directory; returns the list of written paths"""
+        os.makedirs(directory, exist_ok=True)
+        written = []
+
+        def path(name):
+            written.append(os.path.join(directory, name))
+            return written[-1]
+
+        with open(path("stages.txt"), "w", encoding="utf-8") as f:
+            f.write(self.format_table())
+        with open(path("stages.json"), "w", encoding="utf-8") as f:
+            json.dump(self.stage_summary(), f, indent=2)
+
+        if self._profiles:
+            stats = pstats.Stats(self._profiles[0])
+            for profile in self._profiles[1:]:
+                stats.add(profile)
+            stats.dump_stats(path("python.prof"))
+            out = io.StringIO()
+            pstats.Stats(os.path.join(directory, "python.prof"), stream=out).sort_stats("cumulative").print_stats(TOP_ROWS)
+            with open(path("python.txt"), "w", encoding="utf-8") as f:
+                f.write(out.getvalue())
+        with open(path("python.folded"), "w", encoding="utf-8") as f:
+            for stack, n in self.samples.most_common():
+                f.write(f"{stack} {n}\n")
+
+        if self._torch is not None:
+            self._torch.export_chrome_trace(path("torch_trace.json"))
+            sort_by = "self_cuda_time_total" if self._cuda else "self_cpu_time_total"
+            with open(path("torch_ops.txt"), "w", encoding="utf-8") as f:
+                f.write(self._torch.key_averages().table(sort_by=sort_by, row_limit=TOP_ROWS))
+        return written
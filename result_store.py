@@ -0,0 +1,187 @@
+#!/usr/bin/env python3
+"""
+Compact Result Storage
+Writes and reads Whisper results (the dict returned by model.transcribe) in two compact forms,
+next to the regular pretty-printed JSON:
+
+- .npz: column-oriented binary container. Each numeric segment field (start, end, avg_logprob,
+  ...) is one array, all segment texts are one UTF-8 blob plus an offsets array, and word
+  timestamps (if present) are columns as well. Loads without pickle.
+- .json with compact=True: minified JSON (no indentation, no spaces) with the per-segment token
+  ids removed, which are most of the size of a pretty-printed result.
+
+Both round-trip to the same dict shape as model.transcribe:
+
+    from result_store import save_result, load_result
+    save_result(result, "talk.npz")
+    result = load_result("talk.npz")
+
+Convert an existing result file:
+
+    python result_store.py talk.json talk.npz
+"""
+
+import sys
+import json
+import numpy as np
+
+FORMAT_VERSION = 1
+
+# Segment keys in the order model.transcribe produces them
+SEGMENT_KEYS = ("id", "seek", "start", "end", "text", "tokens", "temperature",
+                "avg_logprob", "compression_ratio", "no_speech_prob", "words")
+INT_COLUMNS = ("id", "seek")
+FLOAT_COLUMNS = ("start", "end", "temperature", "avg_logprob", "compression_ratio", "no_speech_prob")
+WORD_FLOAT_COLUMNS = ("start", "end", "probability")
+
+
+def _offsets(lengths):
+    """int64 offsets (len(lengths) + 1) into a flat array of consecutive runs"""
+    offsets = np.zeros(len(lengths) + 1, np.int64)
+    offsets[1:] = np.cumsum(lengths, dtype=np.int64)
+    return offsets
+
+
+def _bytes_array(data):
+    return np.frombuffer(data, np.uint8) if data else np.zeros(0, np.uint8)
+
+
+def _pack_strings(strings):
+    """UTF-8 blob plus offsets for a list of strings"""
+    encoded = [s.encode("utf-8") for s in strings]
+    return _bytes_array(b"".join(encoded)), _offsets([len(b) for b in encoded])
+
+
+def _unpack_strings(blob, offsets):
+    data = blob.tobytes()
+    offsets = offsets.tolist()
+    return [data[offsets[i]:offsets[i + 1]].decode("utf-8") for i in range(len(offsets) - 1)]
+
+
+def _pack_ragged(lists, dtype):
+    """Flat array plus offsets for a list of lists (token ids per segment)"""
+    offsets = _offsets([len(x) for x in lists])
+    flat = np.fromiter((v for x in lists for v in x), dtype, count=int(offsets[-1]))
+    return flat, offsets
+
+
+def strip_tokens(segments):
+    """Copies of the segments without their token id arrays"""
+    return [{k: v for k, v in seg.items() if k != "tokens"} for seg in segments]
+
+
+def compact_result(result, include_tokens=False):
+    """Shallow copy of a result with the token ids dropped (unless include_tokens)"""
+    result = dict(result)
+    if not include_tokens and "segments" in result:
+        result["segments"] = strip_tokens(result["segments"])
+    return result
+
+
+def dump_json(obj, f):
+    """Minified JSON, CJK text kept as UTF-8 instead of \\u escapes"""
+    json.dump(obj, f, ensure_ascii=False, separators=(",", ":"))
+
+
+def save_json(result, path, compact=False, include_tokens=None):
+    """
+    The full result, indented, by default; compact=True writes minified JSON without the token
+    ids. include_tokens overrides whether the token ids are kept (default: only when not compact).
+    """
+    if include_tokens is None:
+        include_tokens = not compact
+    result = compact_result(result, include_tokens)
+    with open(path, "w", encoding="utf-8") as f:
+        if compact:
+            dump_json(result, f)
+        else:
+            json.dump(result, f, indent=2, ensure_ascii=False)
+
+
+def load_json(path):
+    with open(path, "r", encoding="utf-8") as f:
+        return json.load(f)
+
+
+def save_npz(result, path, include_tokens=False, compress=False):
+    """Write a result as column arrays; compress=True trades write speed for a smaller file"""
+    segments = result.get("segments", [])
+    arrays = {}
+    columns = []
+    for key in INT_COLUMNS + FLOAT_COLUMNS:
+        if segments and all(key in seg for seg in segments):
+            arrays[key] = np.array([seg[key] for seg in segments], np.int64 if key in INT_COLUMNS else np.float64)
+            columns.append(key)
+    arrays["text"], arrays["text_offsets"] = _pack_strings([seg.get("text", "") for seg in segments])
+    if include_tokens and segments and all("tokens" in seg for seg in segments):
+        arrays["tokens"], arrays["tokens_offsets"] = _pack_ragged([seg["tokens"] for seg in segments], np.int32)
+        columns.append("tokens")
+    if segments and all("words" in seg for seg in segments):
+        words = [seg["words"] for seg in segments]
+        flat_words = [w for ws in words for w in ws]
+        arrays["word_offsets"] = _offsets([len(ws) for ws in words])
+        arrays["word_text"], arrays["word_text_offsets"] = _pack_strings([w.get("word", "") for w in flat_words])
+        for key in WORD_FLOAT_COLUMNS:
+            arrays[f"word_{key}"] = np.array([w.get(key, 0.0) for w in flat_words], np.float64)
+        columns.append("words")
+    meta = {k: v for k, v in result.items() if k != "segments"}
+    meta["_format"] = FORMAT_VERSION
+    meta["_columns"] = columns
+    arrays["meta"] = _bytes_array(json.dumps(meta, ensure_ascii=False).encode("utf-8"))
+    # Writing through a file object keeps np.savez from appending its own .npz suffix
+    with open(path, "wb") as f:
+        (np.savez_compressed if compress else np.savez)(f, **arrays)
+
+
+def load_npz(path):
+    with np.load(path, allow_pickle=False) as z:
+        meta = json.loads(z["meta"].tobytes().decode("utf-8"))
+        columns = meta.pop("_columns")
+        meta.pop("_format", None)
+        texts = _unpack_strings(z["text"], z["text_offsets"])
+        values = {key: z[key].tolist() for key in columns if key in INT_COLUMNS + FLOAT_COLUMNS}
+        if "tokens" in columns:
+            flat, offsets = z["tokens"].tolist(), z["tokens_offsets"].tolist()
+            values["tokens"] = [flat[offsets[i]:offsets[i + 1]] for i in range(len(texts))]
+        if "words" in columns:
+            word_texts = _unpack_strings(z["word_text"], z["word_text_offsets"])
+            word_cols = {key: z[f"word_{key}"].tolist() for key in WORD_FLOAT_COLUMNS}
+            offsets = z["word_offsets"].tolist()
+            values["words"] = [
+                [{"word": word_texts[j], **{key: word_cols[key][j] for key in WORD_FLOAT_COLUMNS}}
+                 for j in range(offsets[i], offsets[i + 1])]
+                for i in range(len(texts))
+            ]
+    values["text"] = texts
+    segments = [{key: values[key][i] for key in SEGMENT_KEYS if key in values} for i in range(len(texts))]
+    result = dict(meta)
+    result["segments"] = segments
+    return result
+
+
+def save_result(result, path, include_tokens=False):
+    """Save as .npz or minified .json depending on the file extension"""
+    if str(path).endswith(".npz"):
+        save_npz(result, path, include_tokens)
+    else:
+        save_json(result, path, compact=True, include_tokens=include_tokens)
+
+
+def load_result(path):
+    if str(path).endswith(".npz"):
+        return load_npz(path)
+    return load_json(path)
+
+
+def main():
+    if len(sys.argv) != 3:
+        print("Usage: python result_store.py <input .json/.npz> <output .json/.npz>")
+        return 1
+    result = load_result(sys.argv[1])
+    save_result(result, sys.argv[2])
+    print(f"✅ {len(result.get('segments', []))} segments written to {sys.argv[2]}")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -17,16 +17,24 @@ import subprocess
 import argparse
 import warnings
 from pathlib import Path
-import whisper
 # ...existing code...
 import os
 import subprocess
 import argparse
 import warnings
 from pathlib import Path
-import whisper
-import json
 import torch
+import time
+from whisper_stream import transcribe_streaming, DEFAULT_WINDOW_SECONDS
+from translation import get_engine, split_sentences, ENGINES
+from decoding_presets import PRESETS, DEFAULT_PRESET, get_decode_options, normalize_language
+from watch_folder import FolderWatcher, STATE_FILENAME
+from result_store import save_json, save_npz
+from whisper_backends import ENGINES as INFERENCE_ENGINES, DEFAULT_ENGINE, DEFAULT_COMPUTE_TYPE, model_device
+from whisper_backends import load_model as load_backend_model
+from whisper_batched import BatchedModel, DEFAULT_BATCH_SIZE
+from profiling import Profiler, stage
+from contextlib import nullcontext
 print("[CUDA] transcribe.py: CUDA available:", torch.cuda.is_available())
 # ...existing code...
 # Set up paths
@@ -40,6 +48,12 @@ SUPPORTED_EXTENSIONS = {
     '.m4a', '.aac', '.ogg', '.flac', '.wma', '.3gp', '.amr'
 }
 
+# Packages each translation engine imports on first use (libre only needs the standard library)
+TRANSLATE_REQUIREMENTS = {
+    "google": "deep-translator",
+    "marian": "transformers sentencepiece opencc",
+}
+
 def get_device():
     """Detect the best available device for Whisper"""
     if torch.backends.mps.is_available():
@@ -166,29 +180,74 @@ def choose_model(models, specified_model=None):
             return None
 
 
-def transcribe_file(file_path, model_name, output_dir=None, output_format="txt", translate_zh=False):
-    """Transcribe the audio/video file, with optional Traditional Chinese translation"""
-    print(f"\n🎤 Loading Whisper model: {model_name}")
+def load_model(model_name, engine=DEFAULT_ENGINE, compute_type=DEFAULT_COMPUTE_TYPE, cpu_threads=0):
+    """
+    Load a Whisper model with the given inference engine (see whisper_backends.py) on the best
+    device, falling back to CPU; returns (model, device) or (None, device)
+    """
+    print(f"\n🎤 Loading Whisper model: {model_name}" + (f" ({engine}, {compute_type})" if engine != "openai" else ""))
 
     # Detect and display device info
     device = print_device_info()
+    options = {"engine": engine, "download_root": str(MODELS_DIR), "compute_type": compute_type, "cpu_threads": cpu_threads}
 
     try:
-        model = whisper.load_model(model_name, download_root=str(MODELS_DIR), device=device)
+        model = load_backend_model(model_name, device=device, **options)
+        device = model_device(model)
+    except FileNotFoundError as e:
+        # CTranslate2 model not converted yet
+        print(f"❌ {e}")
+        return None, device
     except Exception:
         # Hide detailed error, just show fallback message
         if device != "cpu":
             print("⚠️  Could not load model on GPU. Falling back to CPU...")
             try:
-                model = whisper.load_model(model_name, download_root=str(MODELS_DIR), device="cpu")
+                model = load_backend_model(model_name, device="cpu", **options)
                 device = "cpu"
                 print("💻 Using CPU for transcription")
             except Exception:
                 print("❌ Error loading model on CPU.")
-                return False
+                return None, device
         else:
             print("❌ Error loading model.")
+            return None, device
+    return model, device
+
+
+def make_translate_engine(translate_engine="google", translate_url=None, translate_concurrency=4, translate_rate=5.0):
+    """The translation engine for --translate-zh (see translation.py)"""
+    if translate_engine == "marian":
+        return get_engine("marian")
+    options = {"concurrency": translate_concurrency, "rate": translate_rate}
+    if translate_engine == "libre":
+        options["url"] = translate_url
+    return get_engine(translate_engine, **options)
+
+
+def transcribe_file(file_path, model_name, output_dir=None, output_format="txt", translate_zh=False,
+                    stream=False, window_seconds=DEFAULT_WINDOW_SECONDS,
+                    translate_engine="google", translate_url=None, translate_concurrency=4, translate_rate=5.0,
+                    preset=DEFAULT_PRESET, language=None, model=None, show_result=True, keep_tokens=False,
+                    compact_json=False,
+                    engine=DEFAULT_ENGINE, compute_type=DEFAULT_COMPUTE_TYPE, batch_size=None, profile=False,
+                    translator=None):
+    """
+    Transcribe the audio/video file, with optional Traditional Chinese translation.
+    model reuses an already loaded Whisper model and translator an already built translation
+    engine (watch mode); show_result=False skips printing the transcript and SRT preview.
+    compact_json writes json minified and without token ids; keep_tokens keeps the token ids in
+    compact json and npz output.
+    engine and compute_type select the inference backend when the model is loaded here.
+    batch_size decodes that many 30-second chunks at once (see whisper_batched.py).
+    profile writes a per-stage profile to <output name>.profile/ (see profiling.py).
+    """
+    if model is None:
+        model, device = load_model(model_name, engine, compute_type)
+        if model is None:
             return False
+    else:
+        device = model_device(model)
 
     print(f"🎵 Transcribing: {Path(file_path).name}")
     print("⏳ This may take a while depending on file length and model size...")
@@ -197,9 +256,12 @@ def transcribe_file(file_path, model_name, output_dir=None, output_format="txt",
     file_size = Path(file_path).stat().st_size / (1024 * 1024)
     print(f"📊 File size: {file_size:.1f} MB")
 
+    profiler = Profiler().start() if profile else None
+    # Created before the model may be wrapped for batching, so the real model is instrumented
+    instrumented = profiler.instrument(model) if profiler else nullcontext()
     try:
         # Suppress all warnings during transcription for cleaner output
-        with warnings.catch_warnings():
+        with warnings.catch_warnings(), instrumented, stage("transcribe"):
             warnings.simplefilter("ignore")
             # Additional environment setup for cleaner MPS output
             import logging
@@ -207,49 +269,51 @@ def transcribe_file(file_path, model_name, output_dir=None, output_format="txt",
 
             # Use fp16 only if using GPU (MPS or CUDA)
             fp16 = device in ["mps", "cuda"]
-            result = model.transcribe(str(file_path), verbose=False, fp16=fp16)
+            decode_options = get_decode_options(preset, language)
+            print(f"🎛️  Decoding preset: {preset}" + (f" (language: {language})" if language else ""))
+            if batch_size:
+                print(f"📦 Batched decoding, {batch_size} chunks per pass")
+                model = BatchedModel(model, batch_size)
+            if stream:
+                # Decode in fixed windows so memory does not grow with the file length
+                print(f"🌊 Streaming decode in {window_seconds:.0f}s windows")
+                result = transcribe_streaming(
+                    model, str(file_path), window_seconds,
+                    progress_callback=lambda end: print(f"   ...decoded up to {end/60:.1f} min"),
+                    verbose=False, fp16=fp16, **decode_options,
+                )
+            else:
+                result = model.transcribe(str(file_path), verbose=False, fp16=fp16, **decode_options)
 
         # If translation to Traditional Chinese is requested
         if translate_zh:
-            import time
-            import re
-            print("[INFO] Entering translation block for Traditional Chinese...")
+            print(f"[INFO] Translating to Traditional Chinese with the '{translate_engine}' engine...")
             try:
-                from deep_translator import GoogleTranslator
-                translator = GoogleTranslator(source='auto', target='zh-TW')
-                # Translate main text (split into sentences)
-                sentences = re.split(r'(?<=[.!?。！？])\s+', result["text"])
-                zh_sentences = []
-                for s in sentences:
-                    if s.strip():
-                        try:
-                            zh = translator.translate(s.strip())
-                            zh_sentences.append(zh)
-                            time.sleep(0.5)
-                        except Exception as e:
-                            print(f"[ERROR] Main text sentence translation failed: {e}\nOriginal: {s}")
-                zh_text = ' '.join(zh_sentences)
-                result["text"] = zh_text
-                print(f"[DEBUG] Main text translated: {zh_text[:40]}...")
-                # Translate each segment (split into sentences)
-                for idx, seg in enumerate(result.get("segments", [])):
-                    original = seg["text"]
-                    seg_sentences = re.split(r'(?<=[.!?。！？])\s+', original)
-                    zh_seg_sentences = []
-                    for s in seg_sentences:
-                        if s.strip():
-                            try:
-                                zh = translator.translate(s.strip())
-                                zh_seg_sentences.append(zh)
-                                time.sleep(0.5)
-                            except Exception as seg_e:
-                                print(f"[ERROR] Segment {idx+1} sentence translation failed: {seg_e}\nOriginal: {s}")
-                    translated = ' '.join(zh_seg_sentences)
-                    seg["text"] = translated
-                    print(f"[DEBUG] Segment {idx+1} translated: {translated}")
-                print("✅ Translated output to Traditional Chinese (zh-TW) using deep-translator (sentence by sentence)")
+                translation_engine = translator or make_translate_engine(translate_engine, translate_url,
+                                                                         translate_concurrency, translate_rate)
+                # Main text and every segment are split into sentences and sent as one job
+                sentences = split_sentences(result["text"])
+                segments = result.get("segments", [])
+                seg_sentences = [split_sentences(seg["text"]) for seg in segments]
+                items = sentences + [s for group in seg_sentences for s in group]
+                start = time.time()
+                with stage("translate"):
+                    translated = translation_engine.translate(items)
+                result["text"] = ' '.join(t for t in translated[:len(sentences)] if t)
+                pos = len(sentences)
+                for idx, (seg, group) in enumerate(zip(segments, seg_sentences)):
+                    seg["text"] = ' '.join(t for t in translated[pos:pos + len(group)] if t)
+                    pos += len(group)
+                    print(f"[DEBUG] Segment {idx+1} translated: {seg['text']}")
+                failed = sum(1 for t in translated if t is None)
+                print(f"✅ Translated {len(items) - failed} sentences to Traditional Chinese (zh-TW) in {time.time() - start:.1f}s"
+                      + (f" ({failed} failed and left out)" if failed else ""))
+            except ImportError as e:
+                requirements = TRANSLATE_REQUIREMENTS.get(translate_engine)
+                print(f"⚠️  Translation error: {e}"
+                      + (f"\nThe '{translate_engine}' engine needs: pip install {requirements}" if requirements else ""))
             except Exception as e:
-                print(f"⚠️  Translation error: {e}\nIf you have not installed deep-translator, run: pip install deep-translator")
+                print(f"⚠️  Translation error: {e}")
 
         # Prepare output
         input_path = Path(file_path)
@@ -261,22 +325,27 @@ def transcribe_file(file_path, model_name, output_dir=None, output_format="txt",
             output_base = input_path.parent / input_path.stem
 
         # Save transcription in requested format
-        if output_format in ["txt", "all"]:
-            txt_file = output_base.with_suffix('.txt')
-            with open(txt_file, 'w', encoding='utf-8') as f:
-                f.write(result["text"].strip())
-            print(f"✅ Text saved to: {txt_file}")
-
-        if output_format in ["json", "all"]:
-            json_file = output_base.with_suffix('.json')
-            with open(json_file, 'w', encoding='utf-8') as f:
-                json.dump(result, f, indent=2, ensure_ascii=False)
-            print(f"✅ JSON saved to: {json_file}")
-
-        if output_format in ["srt", "all"]:
-            srt_file = output_base.with_suffix('.srt')
-            write_srt(result["segments"], srt_file)
-            print(f"✅ SRT saved to: {srt_file}")
+        with stage("write"):
+            if output_format in ["txt", "all"]:
+                txt_file = output_base.with_suffix('.txt')
+                with open(txt_file, 'w', encoding='utf-8') as f:
+                    f.write(result["text"].strip())
+                print(f"✅ Text saved to: {txt_file}")
+
+            if output_format in ["json", "all"]:
+                json_file = output_base.with_suffix('.json')
+                save_json(result, json_file, compact=compact_json, include_tokens=keep_tokens or not compact_json)
+                print(f"✅ JSON saved to: {json_file}")
+
+            if output_format == "npz":
+                npz_file = output_base.with_suffix('.npz')
+                save_npz(result, npz_file, include_tokens=keep_tokens)
+                print(f"✅ Columnar result saved to: {npz_file} (load with result_store.load_result)")
+
+            if output_format in ["srt", "all"]:
+                srt_file = output_base.with_suffix('.srt')
+                write_srt(result["segments"], srt_file)
+                print(f"✅ SRT saved to: {srt_file}")
 
         # Show transcription stats
         if "segments" in result:
@@ -288,6 +357,9 @@ def transcribe_file(file_path, model_name, output_dir=None, output_format="txt",
             print(f"   Segments: {num_segments}")
             print(f"   Words: ~{len(result['text'].split())}")
 
+        if not show_result:
+            return True
+
         # Display result
         print(f"\n📝 Transcription:")
         print("=" * 60)
@@ -309,6 +381,13 @@ def transcribe_file(file_path, model_name, output_dir=None, output_format="txt",
     except Exception as e:
         print(f"❌ Error during transcription: {e}")
         return False
+    finally:
+        if profiler:
+            profiler.stop()
+            profile_dir = Path(output_dir or Path(file_path).parent) / f"{Path(file_path).stem}.profile"
+            profiler.write(profile_dir)
+            print(f"\n⏱️  Profile ({profile_dir}):")
+            print(profiler.format_table())
 
 def write_srt(segments, output_file):
     """Write segments to SRT subtitle format"""
@@ -330,18 +409,92 @@ def format_timestamp(seconds):
     millis = int((seconds % 1) * 1000)
     return f"{hours:02d}:{minutes:02d}:{secs:02d},{millis:03d}"
 
+def watch(args):
+    """Watch mode: feed new files from the watched folders to a pool of warm workers"""
+    for directory in args.watch:
+        if not Path(directory).is_dir():
+            print(f"❌ Not a directory: {directory}")
+            return 1
+    if not setup_environment():
+        return 1
+    models = list_available_models()
+    if not models:
+        return 1
+    model_name = choose_model(models, args.model or ('base' if 'base' in models else models[0]))
+    if not model_name:
+        return 1
+    cpu_threads = 0
+    if get_device() == "cpu" and args.workers > 1:
+        # Split the cores between the workers instead of every worker using all of them
+        cpu_threads = max(1, (os.cpu_count() or 1) // args.workers)
+        torch.set_num_threads(cpu_threads)
+
+    def load():
+        # Each worker keeps its model and its translation engine (e.g. MarianMT) for every file
+        model, _ = load_model(model_name, args.engine, args.compute_type, cpu_threads)
+        if model is None:
+            raise RuntimeError(f"Could not load model {model_name}")
+        translator = None
+        if args.translate_zh:
+            translator = make_translate_engine(args.translate_engine, args.translate_url,
+                                               args.translate_concurrency, args.translate_rate)
+        return model, translator
+
+    def process(path, output_dir, loaded):
+        model, translator = loaded
+        print(f"\n🎵 Transcribing: {path}")
+        return transcribe_file(path, model_name, output_dir, args.format, args.translate_zh,
+                               stream=args.stream, window_seconds=args.window_seconds,
+                               translate_engine=args.translate_engine, translate_url=args.translate_url,
+                               translate_concurrency=args.translate_concurrency, translate_rate=args.translate_rate,
+                               preset=args.preset, language=args.language, model=model, show_result=False,
+                               keep_tokens=args.keep_tokens, compact_json=args.compact_json, batch_size=args.batch_size if args.batched else None,
+                               profile=args.profile, translator=translator)
+
+    watcher = FolderWatcher(args.watch, SUPPORTED_EXTENSIONS, load, process, workers=args.workers,
+                            mirror_dir=args.mirror, state_path=args.state,
+                            settle_seconds=args.settle_seconds, poll_interval=args.poll_interval)
+    return 0 if watcher.run() else 1
+
 def main():
     parser = argparse.ArgumentParser(description="Transcribe audio/video files with Whisper")
     parser.add_argument("file_path", nargs="?", help="Path to audio/video file")
     parser.add_argument("-m", "--model", help="Whisper model to use")
     parser.add_argument("-o", "--output", help="Output directory")
-    parser.add_argument("-f", "--format", choices=["txt", "json", "srt", "all"], default="srt", help="Output format (default: srt)")
+    parser.add_argument("-f", "--format", choices=["txt", "json", "srt", "npz", "all"], default="srt", help="Output format (default: srt; npz = columnar binary result, see result_store.py)")
+    parser.add_argument("--compact-json", action="store_true", help="Write json minified and without per-segment token ids")
+    parser.add_argument("--keep-tokens", action="store_true", help="Keep per-segment token ids in --compact-json and npz output")
     parser.add_argument("--cpu", action="store_true", help="Force CPU usage (disable MPS/CUDA)")
     parser.add_argument("--preview-srt", action="store_true", help="Preview full SRT in terminal and skip transcription")
     parser.add_argument("--translate-zh", action="store_true", help="Translate output to Traditional Chinese (zh-TW)")
+    parser.add_argument("--translate-engine", choices=sorted(ENGINES), default="google", help="Translation engine for --translate-zh (default: google; marian runs offline)")
+    parser.add_argument("--translate-url", help="Base URL of a LibreTranslate-compatible server (for --translate-engine libre)")
+    parser.add_argument("--translate-concurrency", type=int, default=4, help="Parallel translation requests (default: 4)")
+    parser.add_argument("--translate-rate", type=float, default=5.0, help="Max translation requests per second (default: 5)")
+    parser.add_argument("--preset", choices=list(PRESETS), default=DEFAULT_PRESET, help=f"Decoding preset: speed vs accuracy (default: {DEFAULT_PRESET})")
+    parser.add_argument("--language", help="Language hint, e.g. en, zh, ja (default: auto-detect)")
+    parser.add_argument("--engine", choices=INFERENCE_ENGINES, default=DEFAULT_ENGINE, help=f"Inference engine (default: {DEFAULT_ENGINE}; ctranslate2 needs `whisper_models.py convert <model>` first)")
+    parser.add_argument("--compute-type", default=DEFAULT_COMPUTE_TYPE, help=f"Weight type for the ctranslate2 engine, e.g. int8, int8_float16, float16 (default: {DEFAULT_COMPUTE_TYPE})")
+    parser.add_argument("--batched", action="store_true", help="Cut the audio at pauses and decode several 30s chunks per forward pass (faster on long files; no conditioning on previous text)")
+    parser.add_argument("--batch-size", type=int, default=DEFAULT_BATCH_SIZE, help=f"Chunks per pass for --batched (default: {DEFAULT_BATCH_SIZE})")
+    parser.add_argument("--profile", action="store_true", help="Write a per-stage profile (cProfile, flamegraph stacks, torch trace) to <name>.profile/ next to the outputs")
+    parser.add_argument("--stream", action="store_true", help="Decode audio in windows with bounded memory (for very long recordings)")
+    parser.add_argument("--window-seconds", type=float, default=DEFAULT_WINDOW_SECONDS, help=f"Window length for --stream (default: {DEFAULT_WINDOW_SECONDS})")
+    parser.add_argument("--watch", nargs="+", metavar="DIR", help="Watch these directories and transcribe new files as they arrive")
+    parser.add_argument("--workers", type=int, default=1, help="Watch mode: parallel workers, each with its own loaded model (default: 1)")
+    parser.add_argument("--mirror", metavar="DIR", help="Watch mode: write outputs into this tree (mirroring the watched folders) instead of next to the inputs")
+    parser.add_argument("--state", help=f"Watch mode: state file (default: <first watched dir>/{STATE_FILENAME})")
+    parser.add_argument("--settle-seconds", type=float, default=10.0, help="Watch mode: seconds a file must stay unchanged before it is picked up (default: 10)")
+    parser.add_argument("--poll-interval", type=float, default=5.0, help="Watch mode: rescan interval without inotify (default: 5)")
 
 
     args = parser.parse_args()
+    if args.translate_engine == "libre" and not args.translate_url:
+        parser.error("--translate-engine libre needs --translate-url")
+    try:
+        args.language = normalize_language(args.language)
+    except ValueError as e:
+        parser.error(str(e))
 
     # Override device detection if --cpu flag is used
     if args.cpu:
@@ -363,6 +516,9 @@ def main():
     print("🎙️  Whisper Transcription Tool")
     print("=" * 50)
 
+    if args.watch:
+        return watch(args)
+
     # Get file path
     if args.file_path:
         file_path = args.file_path
@@ -405,7 +561,13 @@ def main():
         return 1
 
     # Transcribe
-    success = transcribe_file(file_path, model_name, args.output, args.format, args.translate_zh)
+    success = transcribe_file(file_path, model_name, args.output, args.format, args.translate_zh,
+                              stream=args.stream, window_seconds=args.window_seconds,
+                              translate_engine=args.translate_engine, translate_url=args.translate_url,
+                              translate_concurrency=args.translate_concurrency, translate_rate=args.translate_rate,
+                              preset=args.preset, language=args.language, keep_tokens=args.keep_tokens,
+                              compact_json=args.compact_json, engine=args.engine, compute_type=args.compute_type,
+                              batch_size=args.batch_size if args.batched else None, profile=args.profile)
 
     if success:
         print("\n🎉 Transcription completed successfully!")
@@ -0,0 +1,312 @@
+#!/usr/bin/env python3
+"""
+Translation Engines
+Translation to Traditional Chinese, shared by the web worker and transcribe.py.
+
+- marian: offline MarianMT + OpenCC. Sentences are bucketed by token length and batched against
+  a token budget, so short and long sentences are not padded to the same length.
+- google: Google Translate through deep-translator.
+- libre: any LibreTranslate-compatible HTTP endpoint (also used with fake_translate_server.py).
+
+The online engines pack many sentences into one request, send requests with bounded concurrency
+behind a token-bucket rate limiter, and retry failed requests with exponential backoff.
+"""
+
+import os
+import re
+import json
+import time
+import random
+import threading
+import urllib.request
+from concurrent.futures import ThreadPoolExecutor
+from pathlib import Path
+
+PROJECT_DIR = Path(__file__).parent
+MARIAN_CACHE_DIR = PROJECT_DIR / "translation_model"
+MARIAN_MODEL_NAME = "Helsinki-NLP/opus-mt-en-zh"
+
+# Max padded tokens (batch size x longest sentence) per generate() call
+DEFAULT_MAX_BATCH_TOKENS = int(os.environ.get('MARIAN_MAX_BATCH_TOKENS', '2048'))
+# 1 = greedy; unset keeps the model's own generation config (beam search)
+DEFAULT_NUM_BEAMS = int(os.environ['MARIAN_NUM_BEAMS']) if os.environ.get('MARIAN_NUM_BEAMS') else None
+
+SENTENCE_END_CHARS = '.!?。！？'
+SENTENCE_SPLIT_RE = re.compile(r'(?<=[.!?。！？])\s+')
+
+
+def split_sentences(text):
+    """Split text into sentences on Western and CJK end punctuation"""
+    return [s.strip() for s in SENTENCE_SPLIT_RE.split(text) if s.strip()]
+
+
+def ends_sentence(text):
+    """True if text ends with Western or CJK end punctuation"""
+    text = text.rstrip()
+    return bool(text) and text[-1] in SENTENCE_END_CHARS
+
+
+def make_token_batches(lengths, max_batch_tokens):
+    """
+    Group item indices into batches, shortest first, so that
+    len(batch) * longest item in batch stays within max_batch_tokens.
+    A single item longer than the budget gets a batch of its own.
+    """
+    order = sorted(range(len(lengths)), key=lambda i: lengths[i])
+    batches = []
+    batch = []
+    longest = 0
+    for i in order:
+        new_longest = max(longest, lengths[i])
+        if batch and new_longest * (len(batch) + 1) > max_batch_tokens:
+            batches.append(batch)
+            batch = []
+            new_longest = lengths[i]
+        batch.append(i)
+        longest = new_longest
+    if batch:
+        batches.append(batch)
+    return batches
+
+
+class MarianTranslator:
+    """English -> Traditional Chinese with MarianMT (simplified output converted by OpenCC)"""
+
+    def __init__(self, model_name=MARIAN_MODEL_NAME, cache_dir=MARIAN_CACHE_DIR, device="cpu",
+                 max_batch_tokens=DEFAULT_MAX_BATCH_TOKENS, num_beams=DEFAULT_NUM_BEAMS):
+        from transformers import MarianMTModel, MarianTokenizer
+        from opencc import OpenCC
+        os.makedirs(cache_dir, exist_ok=True)
+        self.cc = OpenCC('s2t')  # 簡體轉繁體
+        self.tokenizer = MarianTokenizer.from_pretrained(model_name, cache_dir=str(cache_dir))
+        self.model = MarianMTModel.from_pretrained(model_name, cache_dir=str(cache_dir)).to(device)
+        self.model.eval()
+        self.device = device
+        self.max_batch_tokens = max_batch_tokens
+        self.num_beams = num_beams
+
+    def translate(self, texts, progress_callback=None, stats=None):
+        """
+        Translate a list of strings and return the translations in the same order.
+        progress_callback(done, total) is called after each batch.
+        If a stats dict is passed, the throughput of the call is written into it (the translator
+        is shared between jobs, so nothing per call is kept on it).
+        """
+        import torch
+        start = time.time()
+        results = [""] * len(texts)
+        todo = [i for i, t in enumerate(texts) if t and t.strip()]
+        encoded = self.tokenizer([texts[i].strip() for i in todo], truncation=True)["input_ids"]
+        lengths = [len(ids) for ids in encoded]
+        batches = make_token_batches(lengths, self.max_batch_tokens)
+        generate_kwargs = {}
+        if self.num_beams is not None:
+            generate_kwargs["num_beams"] = self.num_beams
+            generate_kwargs["do_sample"] = False
+        done = 0
+        padded_tokens = 0
+        with torch.inference_mode():
+            for batch in batches:
+                padded_tokens += max(lengths[j] for j in batch) * len(batch)
+                inputs = self.tokenizer.pad({"input_ids": [encoded[j] for j in batch]}, return_tensors="pt").to(self.device)
+                generated = self.model.generate(**inputs, **generate_kwargs)
+                decoded = self.tokenizer.batch_decode(generated, skip_special_tokens=True)
+                for j, zh in zip(batch, decoded):
+                    results[todo[j]] = self.cc.convert(zh)
+                done += len(batch)
+                if progress_callback:
+                    progress_callback(done, len(todo))
+        if stats is None:
+            return results
+        seconds = time.time() - start
+        input_tokens = sum(lengths)
+        stats.update({
+            "sentences": len(todo),
+            "batches": len(batches),
+            "input_tokens": input_tokens,
+            "padding_ratio": round(1 - input_tokens / padded_tokens, 3) if padded_tokens else 0.0,
+            "seconds": round(seconds, 2),
+            "sentences_per_sec": round(len(todo) / seconds, 2) if seconds > 0 else None,
+            "tokens_per_sec": round(input_tokens / seconds, 1) if seconds > 0 else None,
+        })
+        return results
+
+
+class TokenBucket:
+    """Thread-safe token bucket: allows `rate` acquisitions per second with bursts up to `capacity`"""
+
+    def __init__(self, rate, capacity=None):
+        self.rate = rate
+        self.capacity = capacity or max(1.0, rate)
+        self.tokens = self.capacity
+        self.updated = time.monotonic()
+        self.lock = threading.Lock()
+
+    def acquire(self):
+        while True:
+            with self.lock:
+                now = time.monotonic()
+                self.tokens = min(self.capacity, self.tokens + (now - self.updated) * self.rate)
+                self.updated = now
+                if self.tokens >= 1:
+                    self.tokens -= 1
+                    return
+                wait = (1 - self.tokens) / self.rate
+            time.sleep(wait)
+
+
+class TranslationEngine:
+    """
+    Common interface: translate(texts) returns one translation per input, in order;
+    None for inputs whose translation failed
+    """
+
+    name = "base"
+
+    def translate(self, texts, progress_callback=None):
+        raise NotImplementedError
+
+
+class MarianEngine(TranslationEngine):
+    """Offline engine, same MarianMT + OpenCC path as the web worker"""
+
+    name = "marian"
+
+    def __init__(self, **kwargs):
+        self.translator = MarianTranslator(**kwargs)
+
+    def translate(self, texts, progress_callback=None):
+        return self.translator.translate(texts, progress_callback=progress_callback)
+
+
+class RemoteEngine(TranslationEngine):
+    """
+    Base for online engines. Texts are packed into newline-joined requests of up to max_chars,
+    sent by up to `concurrency` threads, at most `rate` requests per second, with retries.
+    Subclasses implement _request(text) -> translated text.
+    """
+
+    SEPARATOR = "\n"
+
+    def __init__(self, concurrency=4, rate=5.0, max_chars=4000, retries=4, backoff=1.0):
+        self.concurrency = max(1, concurrency)
+        self.limiter = TokenBucket(rate)
+        self.max_chars = max_chars
+        self.retries = retries
+        self.backoff = backoff
+
+    def _request(self, text):
+        raise NotImplementedError
+
+    def _request_with_retry(self, text):
+        for attempt in range(self.retries + 1):
+            self.limiter.acquire()
+            try:
+                return self._request(text)
+            except Exception as e:
+                if attempt == self.retries:
+                    raise
+                delay = self.backoff * (2 ** attempt) * (0.5 + random.random())
+                print(f"[WARN] {self.name} request failed ({e}), retrying in {delay:.1f}s")
+                time.sleep(delay)
+
+    def _pack(self, items):
+        """Group (index, text) items into chunks whose joined length stays under max_chars"""
+        chunks = []
+        chunk = []
+        size = 0
+        for item in items:
+            length = len(item[1]) + len(self.SEPARATOR)
+            if chunk and size + length > self.max_chars:
+                chunks.append(chunk)
+                chunk = []
+                size = 0
+            chunk.append(item)
+            size += length
+        if chunk:
+            chunks.append(chunk)
+        return chunks
+
+    def _translate_chunk(self, chunk):
+        joined = self.SEPARATOR.join(text for _, text in chunk)
+        translated = self._request_with_retry(joined)
+        lines = (translated or "").split(self.SEPARATOR)
+        if len(lines) != len(chunk):
+            # The service merged or split lines; fall back to one request per sentence
+            lines = [self._request_with_retry(text) for _, text in chunk]
+        return [(i, line.strip()) for (i, _), line in zip(chunk, lines)]
+
+    def _translate_chunk_or_none(self, chunk):
+        """A failed chunk (retries used up) only loses its own sentences: they come back as None"""
+        try:
+            return self._translate_chunk(chunk)
+        except Exception as e:
+            print(f"[ERROR] {self.name}: {len(chunk)} sentence(s) not translated: {e}")
+            return [(i, None) for i, _ in chunk]
+
+    def translate(self, texts, progress_callback=None):
+        results = [""] * len(texts)
+        items = [(i, " ".join(t.split())) for i, t in enumerate(texts) if t and t.strip()]
+        chunks = self._pack(items)
+        done = 0
+        with ThreadPoolExecutor(max_workers=self.concurrency) as pool:
+            for pairs in pool.map(self._translate_chunk_or_none, chunks):
+                for i, line in pairs:
+                    results[i] = line
+                done += len(pairs)
+                if progress_callback:
+                    progress_callback(done, len(items))
+        return results
+
+
+class GoogleEngine(RemoteEngine):
+    name = "google"
+
+    def __init__(self, target="zh-TW", **kwargs):
+        super().__init__(**kwargs)
+        from deep_translator import GoogleTranslator
+        self.translator = GoogleTranslator(source='auto', target=target)
+
+    def _request(self, text):
+        return self.translator.translate(text)
+
+
+class LibreTranslateEngine(RemoteEngine):
+    """POST {url}/translate with a LibreTranslate-style JSON body"""
+
+    name = "libre"
+
+    def __init__(self, url, target="zh-Hant", api_key=None, timeout=60, **kwargs):
+        super().__init__(**kwargs)
+        if not url:
+            raise ValueError("The libre engine needs the URL of a LibreTranslate server")
+        self.url = url.rstrip("/") + "/translate"
+        self.target = target
+        self.api_key = api_key
+        self.timeout = timeout
+
+    def _request(self, text):
+        body = {"q": text, "source": "auto", "target": self.target, "format": "text"}
+        if self.api_key:
+            body["api_key"] = self.api_key
+        req = urllib.request.Request(
+            self.url,
+            data=json.dumps(body).encode("utf-8"),
+            headers={"Content-Type": "application/json"},
+        )
+        with urllib.request.urlopen(req, timeout=self.timeout) as resp:
+            return json.loads(resp.read().decode("utf-8"))["translatedText"]
+
+
+ENGINES = {
+    "google": GoogleEngine,
+    "libre": LibreTranslateEngine,
+    "marian": MarianEngine,
+}
+
+
+def get_engine(name, **kwargs):
+    """Build a translation engine by name; kwargs go to the engine constructor"""
+    if name not in ENGINES:
+        raise ValueError(f"Unknown translation engine '{name}' (choose from {', '.join(ENGINES)})")
+    return ENGINES[name](**kwargs)
@@ -0,0 +1,280 @@
+#!/usr/bin/env python3
+"""
+Watch-Folder Ingestion
+Watches directories for new recordings and hands each finished file to a small pool of
+workers that keep their Whisper model loaded. Used by `transcribe.py --watch`.
+
+- New files are found with inotify (pip install inotify_simple) or, without it, by rescanning
+  the directories every few seconds.
+- A file is only picked up once its size and mtime have not changed for --settle-seconds, so
+  recordings still being copied into the share are left alone.
+- Files are deduplicated by SHA-256: the same recording dropped twice (or under another name)
+  is transcribed once.
+- A small JSON state file remembers size, mtime and hash of every file seen, so a restart only
+  stats the tree instead of hashing or transcribing everything again.
+"""
+
+import os
+import json
+import time
+import queue
+import hashlib
+import threading
+from pathlib import Path
+
+try:
+    from inotify_simple import INotify, flags as inotify_flags
+except ImportError:
+    INotify = None
+
+STATE_FILENAME = ".whisper_watch_state.json"
+HASH_CHUNK = 1024 * 1024
+
+
+def file_sha256(path):
+    h = hashlib.sha256()
+    with open(path, 'rb') as f:
+        for chunk in iter(lambda: f.read(HASH_CHUNK), b''):
+            h.update(chunk)
+    return h.hexdigest()
+
+
+class WatchState:
+    """
+    Persistent record of seen files: {"files": {path: {size, mtime, sha256, status}},
+    "hashes": {sha256: path of the file that was transcribed}}
+    """
+
+    def __init__(self, path):
+        self.path = Path(path)
+        self.lock = threading.Lock()
+        self.files = {}
+        self.hashes = {}
+        if self.path.exists():
+            try:
+                data = json.loads(self.path.read_text(encoding='utf-8'))
+                self.files = data.get('files', {})
+                self.hashes = data.get('hashes', {})
+            except Exception as e:
+                print(f"⚠️  Could not read watch state {self.path}: {e}")
+
+    def is_known(self, path, st):
+        """True if the file was already handled in its current version (same size and mtime)"""
+        entry = self.files.get(str(path))
+        return bool(entry) and entry['size'] == st.st_size and entry['mtime'] == st.st_mtime \
+            and entry['status'] in ('done', 'duplicate', 'failed')
+
+    def record(self, path, st, sha256, status):
+        with self.lock:
+            self.files[str(path)] = {'size': st.st_size, 'mtime': st.st_mtime, 'sha256': sha256, 'status': status}
+            if status == 'done':
+                self.hashes[sha256] = str(path)
+            self._save()
+
+    def _save(self):
+        tmp_path = self.path.with_name(self.path.name + '.tmp')
+        try:
+            tmp_path.write_text(json.dumps({'files': self.files, 'hashes': self.hashes}), encoding='utf-8')
+            os.replace(tmp_path, self.path)
+        except Exception as e:
+            print(f"⚠️  Could not save watch state {self.path}: {e}")
+
+
+class FolderWatcher:
+    """
+    load_model() is called once per worker thread; process(path, output_dir, model) transcribes
+    one file and returns True on success. If any worker cannot load its model, run() stops
+    before queueing anything and returns False.
+    """
+
+    def __init__(self, roots, extensions, load_model, process, workers=1, mirror_dir=None,
+                 state_path=None, settle_seconds=10.0, poll_interval=5.0):
+        self.roots = [Path(r).resolve() for r in roots]
+        self.extensions = extensions
+        self.load_model = load_model
+        self.process = process
+        self.workers = max(1, workers)
+        self.mirror_dir = Path(mirror_dir).resolve() if mirror_dir else None
+        self.state = WatchState(state_path or self.roots[0] / STATE_FILENAME)
+        self.settle_seconds = settle_seconds
+        self.poll_interval = poll_interval
+        # Bounded so the watcher stops hashing ahead when the workers are busy
+        self.jobs = queue.Queue(maxsize=self.workers * 2)
+        # path -> (size, mtime, time the size/mtime was first seen)
+        self.candidates = {}
+        # Paths and hashes queued or being transcribed right now
+        self.active_paths = set()
+        self.active_hashes = set()
+        self.active_lock = threading.Lock()
+        # One (worker index, load error or None) per worker once its model is loaded or failed
+        self.loaded = queue.Queue()
+
+    # --- discovery ---
+
+    def _wanted(self, path):
+        return path.suffix.lower() in self.extensions and not path.name.startswith('.')
+
+    def _consider(self, path):
+        try:
+            st = path.stat()
+        except OSError:
+            self.candidates.pop(path, None)
+            return
+        if self.state.is_known(path, st) or path in self.active_paths:
+            return
+        previous = self.candidates.get(path)
+        if previous is None or previous[:2] != (st.st_size, st.st_mtime):
+            self.candidates[path] = (st.st_size, st.st_mtime, time.time())
+
+    def scan(self):
+        """Stat every media file under the roots; only new or changed files become candidates"""
+        for root in self.roots:
+            for dirpath, dirnames, filenames in os.walk(root):
+                # Never descend into the mirror tree if it lives inside a watched folder
+                dirnames[:] = [d for d in dirnames if not d.startswith('.')
+                               and (self.mirror_dir is None or Path(dirpath, d).resolve() != self.mirror_dir)]
+                for name in filenames:
+                    path = Path(dirpath) / name
+                    if self._wanted(path):
+                        self._consider(path)
+
+    def _add_watches(self, inotify, watches, directory):
+        mask = inotify_flags.CLOSE_WRITE | inotify_flags.MOVED_TO | inotify_flags.CREATE
+        if self.mirror_dir is not None and Path(directory).resolve() == self.mirror_dir:
+            return
+        for dirpath, dirnames, _ in os.walk(directory):
+            # Pruned like in scan(), so nothing below the mirror tree is watched either
+            dirnames[:] = [d for d in dirnames if not d.startswith('.')
+                           and (self.mirror_dir is None or Path(dirpath, d).resolve() != self.mirror_dir)]
+            try:
+                watches[inotify.add_watch(dirpath, mask)] = Path(dirpath)
+            except OSError as e:
+                print(f"⚠️  Cannot watch {dirpath}: {e}")
+
+    def _check_settled(self):
+        """Queue candidates whose size and mtime have been stable for settle_seconds"""
+        now = time.time()
+        for path, (size, mtime, since) in list(self.candidates.items()):
+            try:
+                st = path.stat()
+            except OSError:
+                del self.candidates[path]
+                continue
+            if (st.st_size, st.st_mtime) != (size, mtime):
+                self.candidates[path] = (st.st_size, st.st_mtime, now)
+            elif now - since >= self.settle_seconds:
+                del self.candidates[path]
+                self._enqueue(path, st)
+
+    def _enqueue(self, path, st):
+        try:
+            sha256 = file_sha256(path)
+        except OSError as e:
+            print(f"⚠️  Cannot read {path}: {e}")
+            return
+        with self.active_lock:
+            done_path = self.state.hashes.get(sha256)
+            if done_path or sha256 in self.active_hashes:
+                print(f"🔁 Skipping {path.name}: same content as {done_path or 'a file in progress'}")
+                self.state.record(path, st, sha256, 'duplicate')
+                return
+            self.active_paths.add(path)
+            self.active_hashes.add(sha256)
+        print(f"📥 Queued: {path}")
+        self.jobs.put((path, st, sha256))
+
+    # --- workers ---
+
+    def _output_dir(self, path):
+        if self.mirror_dir is None:
+            return None
+        for root in self.roots:
+            if root in path.parents:
+                return self.mirror_dir / root.name / path.parent.relative_to(root)
+        return self.mirror_dir
+
+    def _worker(self, index):
+        try:
+            model = self.load_model()
+        except Exception as e:
+            print(f"❌ Worker {index} could not load its model: {e}")
+            self.loaded.put((index, e))
+            return
+        self.loaded.put((index, None))
+        print(f"🧵 Worker {index} ready")
+        while True:
+            item = self.jobs.get()
+            if item is None:
+                break
+            path, st, sha256 = item
+            start = time.time()
+            try:
+                ok = self.process(path, self._output_dir(path), model)
+            except Exception as e:
+                print(f"❌ {path.name}: {e}")
+                ok = False
+            self.state.record(path, st, sha256, 'done' if ok else 'failed')
+            with self.active_lock:
+                self.active_paths.discard(path)
+                self.active_hashes.discard(sha256)
+            print(f"{'✅' if ok else '❌'} {path.name} ({time.time() - start:.1f}s) [worker {index}]")
+
+    def run(self):
+        threads = [threading.Thread(target=self._worker, args=(i,), daemon=True) for i in range(1, self.workers + 1)]
+        for t in threads:
+            t.start()
+        # Nothing is queued until every worker has its model, so files never wait on a dead pool
+        failed = [index for index, error in (self.loaded.get() for _ in threads) if error is not None]
+        if failed:
+            print(f"❌ Stopping: {len(failed)} of {self.workers} worker(s) failed to start")
+            for _ in threads:
+                self.jobs.put(None)
+            for t in threads:
+                t.join()
+            return False
+        inotify = INotify() if INotify is not None else None
+        watches = {}
+        if inotify is not None:
+            for root in self.roots:
+                self._add_watches(inotify, watches, root)
+        mode = "inotify" if inotify is not None else f"polling every {self.poll_interval:.0f}s"
+        print(f"👀 Watching {', '.join(str(r) for r in self.roots)} ({mode}, {self.workers} worker(s))")
+        self.scan()
+        last_scan = time.time()
+        try:
+            while True:
+                if inotify is not None:
+                    for event in inotify.read(timeout=1000):
+                        directory = watches.get(event.wd)
+                        if directory is None or not event.name:
+                            continue
+                        path = directory / event.name
+                        if event.mask & inotify_flags.ISDIR:
+                            if event.mask & (inotify_flags.CREATE | inotify_flags.MOVED_TO):
+                                # A new subfolder may already contain files (e.g. moved in whole)
+                                self._add_watches(inotify, watches, path)
+                                for sub in path.rglob('*'):
+                                    if self._wanted(sub):
+                                        self._consider(sub)
+                        elif self._wanted(path):
+                            self._consider(path)
+                else:
+                    time.sleep(1.0)
+                    if time.time() - last_scan >= self.poll_interval:
+                        self.scan()
+                        last_scan = time.time()
+                self._check_settled()
+        except KeyboardInterrupt:
+            print("\n👋 Stopping watcher, waiting for running jobs...")
+        finally:
+            # Queued files that never started are picked up again on the next run
+            while True:
+                try:
+                    self.jobs.get_nowait()
+                except queue.Empty:
+                    break
+            for _ in threads:
+                self.jobs.put(None)
+            for t in threads:
+                t.join()
+        return True
@@ -0,0 +1,144 @@
+#!/usr/bin/env python3
+"""
+Whisper Inference Backends
+One loader for the engines that can run a Whisper model, shared by transcribe.py and the web app.
+Every backend returns an object whose transcribe(audio, **decode_options) takes the options from
+decoding_presets.py and returns the same dict as openai-whisper's model.transcribe
+({"text", "segments", "language"}, segments with the same keys).
+
+- openai:      openai-whisper on PyTorch (default).
+- ctranslate2: faster-whisper on CTranslate2 with int8 weights, several times faster on CPU.
+               Runs models converted from models/*.pt by `python whisper_models.py convert <model>`.
+
+    from whisper_backends import load_model
+    model = load_model("base", device="cpu", engine="ctranslate2")
+    result = model.transcribe("talk.wav", **get_decode_options("fast"))
+
+The engine can also be chosen with WHISPER_ENGINE, the CTranslate2 compute type with
+WHISPER_CT2_COMPUTE_TYPE (default int8; e.g. int8_float16 or float16 on a GPU).
+"""
+
+import os
+from pathlib import Path
+
+PROJECT_DIR = Path(__file__).parent
+MODELS_DIR = PROJECT_DIR / "models"
+# Converted CTranslate2 models, one directory per model name
+CT2_DIR = MODELS_DIR / "ct2"
+
+ENGINES = ("openai", "ctranslate2")
+DEFAULT_ENGINE = os.environ.get("WHISPER_ENGINE", "openai")
+DEFAULT_COMPUTE_TYPE = os.environ.get("WHISPER_CT2_COMPUTE_TYPE", "int8")
+
+
+def ct2_model_dir(model_name):
+    return CT2_DIR / model_name
+
+
+def model_device(model):
+    """Device name ('cpu', 'cuda', 'mps') of a model returned by load_model"""
+    return getattr(model.device, "type", model.device)
+
+
+def load_model(model_name, device="cpu", engine=DEFAULT_ENGINE, download_root=None,
+               compute_type=DEFAULT_COMPUTE_TYPE, cpu_threads=0):
+    """
+    Load model_name with the given engine.
+    download_root applies to openai-whisper checkpoints; compute_type and cpu_threads
+    (0 = CTranslate2's default) to the ctranslate2 engine.
+    """
+    if engine == "openai":
+        import whisper
+        return whisper.load_model(model_name, device=device, download_root=download_root)
+    if engine == "ctranslate2":
+        return CTranslate2Model(model_name, device, compute_type, cpu_threads)
+    raise ValueError(f"Unknown inference engine '{engine}' (choose from {', '.join(ENGINES)})")
+
+
+class CTranslate2Model:
+    """
+    faster-whisper model with openai-whisper's transcribe() signature and result schema.
+    decode() is called once per decoded segment; callers may shadow it on the instance to get
+    a check point between segments, as they do with openai-whisper's model.decode.
+    """
+
+    engine = "ctranslate2"
+
+    def __init__(self, model_name, device="cpu", compute_type=DEFAULT_COMPUTE_TYPE, cpu_threads=0):
+        try:
+            from faster_whisper import WhisperModel
+        except ImportError:
+            raise RuntimeError("The ctranslate2 engine needs faster-whisper (pip install faster-whisper)")
+        path = ct2_model_dir(model_name)
+        if not (path / "model.bin").exists():
+            raise FileNotFoundError(f"No CTranslate2 model in {path}; run: python whisper_models.py convert {model_name}")
+        # CTranslate2 runs on CPU or CUDA only
+        self.device = "cuda" if device == "cuda" else "cpu"
+        self.name = model_name
+        self.model = WhisperModel(str(path), device=self.device, compute_type=compute_type, cpu_threads=cpu_threads)
+
+    def share_memory(self):
+        return self
+
+    def decode(self, segment):
+        return segment
+
+    def transcribe(self, audio, verbose=None, fp16=None, language=None, initial_prompt=None,
+                   condition_on_previous_text=True, temperature=(0.0, 0.2, 0.4, 0.6, 0.8, 1.0),
+                   beam_size=None, best_of=None, patience=None, compression_ratio_threshold=2.4,
+                   logprob_threshold=-1.0, no_speech_threshold=0.6, word_timestamps=False,
+                   task="transcribe", batch_size=None, **unused):
+        """
+        Same arguments as openai-whisper's transcribe. fp16 is ignored (the compute type is fixed
+        at load time), and None for beam_size/best_of/patience means greedy decoding, as in openai-whisper.
+        With batch_size, faster-whisper's batched pipeline decodes that many VAD chunks at once.
+        """
+        if isinstance(audio, Path):
+            audio = str(audio)
+        temperatures = list(temperature) if isinstance(temperature, (list, tuple)) else [temperature]
+        if batch_size:
+            from faster_whisper import BatchedInferencePipeline
+            run = lambda audio, **kw: BatchedInferencePipeline(model=self.model).transcribe(audio, batch_size=batch_size, **kw)
+        else:
+            run = lambda audio, **kw: self.model.transcribe(audio, condition_on_previous_text=condition_on_previous_text, **kw)
+        segments, info = run(
+            audio,
+            language=language,
+            task=task,
+            beam_size=beam_size or 1,
+            best_of=best_of or 1,
+            patience=patience or 1.0,
+            temperature=temperatures,
+            compression_ratio_threshold=compression_ratio_threshold,
+            log_prob_threshold=logprob_threshold,
+            no_speech_threshold=no_speech_threshold,
+            initial_prompt=initial_prompt,
+            word_timestamps=word_timestamps,
+        )
+        results = []
+        # faster-whisper decodes lazily while its segments are iterated
+        for seg in segments:
+            seg = self.decode(seg)
+            result = {
+                "id": len(results),
+                "seek": seg.seek,
+                "start": seg.start,
+                "end": seg.end,
+                "text": seg.text,
+                "tokens": list(seg.tokens),
+                "temperature": seg.temperature,
+                "avg_logprob": seg.avg_logprob,
+                "compression_ratio": seg.compression_ratio,
+                "no_speech_prob": seg.no_speech_prob,
+            }
+            if word_timestamps:
+                result["words"] = [{"word": w.word, "start": w.start, "end": w.end, "probability": w.probability}
+                                   for w in seg.words or []]
+            if verbose:
+                print(f"[{seg.start:.2f} --> {seg.end:.2f}] {seg.text}")
+            results.append(result)
+        return {
+            "text": "".join(seg["text"] for seg in results),
+            "segments": results,
+            "language": info.language,
+        }
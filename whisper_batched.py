@@ -0,0 +1,209 @@
+#!/usr/bin/env python3
+"""
+Whisper Batched Long-Form Decoding
+model.transcribe encodes and decodes one 30-second window after the other. This module cuts the
+audio into chunks of at most 30 seconds first, at the quietest point near each chunk's end (a
+simple energy VAD, so cuts fall between words), and then encodes and decodes the chunks in
+batches: one encoder forward pass and one batched decoding loop per batch_size chunks. The
+result has the same "text", "segments" and "language" keys and segment fields as model.transcribe.
+
+    from whisper_batched import transcribe_batched
+    result = transcribe_batched(model, "lecture.mp3", batch_size=8, **get_decode_options("fast"))
+
+Differences from the sequential path: chunks are decoded independently, so
+condition_on_previous_text has no effect (initial_prompt is given to every chunk), and
+word_timestamps are not produced. The temperature fallback works as in model.transcribe,
+batched over the chunks that need it. Run benchmark_presets.py --batched to compare speed
+and WER against the sequential path on your own clips.
+
+With the ctranslate2 engine, faster-whisper's own batched pipeline is used instead.
+"""
+
+import numpy as np
+
+# Same values as whisper.audio, duplicated so this module can be imported without torch
+SAMPLE_RATE = 16000
+CHUNK_SECONDS = 30.0
+DEFAULT_BATCH_SIZE = 8
+# A chunk is cut at the quietest 30 ms frame within this many seconds before the 30-second limit
+CUT_SEARCH_SECONDS = 8.0
+FRAME_SECONDS = 0.03
+# Chunks whose loudest frames stay below this RMS are treated as silence and not decoded
+SILENCE_RMS = 1e-3
+# Whisper timestamp tokens are 20 ms apart
+TIMESTAMP_SECONDS = 0.02
+
+
+def split_chunks(audio, sr=SAMPLE_RATE, max_seconds=CHUNK_SECONDS, search_seconds=CUT_SEARCH_SECONDS):
+    """(start, end) sample ranges of at most max_seconds, cut at low-energy frames; silent chunks left out"""
+    frame = int(FRAME_SECONDS * sr)
+    n_frames = len(audio) // frame
+    energy = np.sqrt(np.mean(np.square(audio[:n_frames * frame].reshape(-1, frame)), axis=1)) if n_frames else np.zeros(0)
+    max_len = int(max_seconds * sr)
+    chunks = []
+    start = 0
+    while len(audio) - start > max_len:
+        f0 = (start + max_len - int(search_seconds * sr)) // frame
+        f1 = (start + max_len) // frame
+        cut = (f0 + int(np.argmin(energy[f0:f1]))) * frame if f1 > f0 else start + max_len
+        chunks.append((start, max(cut, start + frame)))
+        start = chunks[-1][1]
+    chunks.append((start, len(audio)))
+    voiced = []
+    for s, e in chunks:
+        frames = energy[s // frame:max(e // frame, s // frame + 1)]
+        if e > s and (not len(frames) or np.percentile(frames, 95) >= SILENCE_RMS):
+            voiced.append((s, e))
+    return voiced
+
+
+def _load_audio(audio):
+    if isinstance(audio, np.ndarray):
+        return audio.astype(np.float32, copy=False)
+    if hasattr(audio, "cpu"):
+        return audio.cpu().numpy().astype(np.float32)
+    import whisper
+    return whisper.load_audio(str(audio))
+
+
+def _needs_fallback(result, compression_ratio_threshold, logprob_threshold, no_speech_threshold):
+    """Same test as model.transcribe: repetitive or unlikely text, unless the chunk is silence anyway"""
+    needs = False
+    if compression_ratio_threshold is not None and result.compression_ratio > compression_ratio_threshold:
+        needs = True
+    if logprob_threshold is not None and result.avg_logprob < logprob_threshold:
+        needs = True
+    if no_speech_threshold is not None and result.no_speech_prob > no_speech_threshold:
+        needs = False
+    return needs
+
+
+def _split_segments(result, tokenizer, offset, duration):
+    """Turn one chunk's timestamped tokens into (start, end, tokens) segments on the file timeline"""
+    begin = tokenizer.timestamp_begin
+    tokens = [t for t in result.tokens if t < tokenizer.eot or t >= begin]
+    pieces = []
+    start = None
+    last = 0.0
+    text_tokens = []
+    for t in tokens:
+        if t >= begin:
+            last = (t - begin) * TIMESTAMP_SECONDS
+            if start is None or not text_tokens:
+                start = last
+            else:
+                pieces.append((start, last, text_tokens))
+                start, text_tokens = None, []
+        else:
+            text_tokens.append(t)
+    if text_tokens:
+        # Text after the last timestamp (or no timestamps at all) runs to the end of the chunk
+        pieces.append((start if start is not None else last, duration, text_tokens))
+    return [(offset + s, offset + min(max(e, s), duration), toks) for s, e, toks in pieces]
+
+
+def _transcribe_ctranslate2(model, audio, batch_size, decode_options):
+    return model.transcribe(audio, batch_size=batch_size, **decode_options)
+
+
+def transcribe_batched(model, audio, batch_size=DEFAULT_BATCH_SIZE, verbose=None, fp16=True, language=None,
+                       task="transcribe", temperature=(0.0, 0.2, 0.4, 0.6, 0.8, 1.0), beam_size=None, best_of=None,
+                       patience=None, initial_prompt=None, compression_ratio_threshold=2.4, logprob_threshold=-1.0,
+                       no_speech_threshold=0.6, condition_on_previous_text=True, **unused):
+    """
+    Drop-in for model.transcribe(audio, ...) that decodes batch_size chunks at once.
+    audio is a path or 16 kHz float32 samples. Models other than openai-whisper's (e.g. the
+    load-test fake) are passed through to their own transcribe().
+    """
+    decode_options = dict(language=language, task=task, temperature=temperature, beam_size=beam_size, best_of=best_of,
+                          patience=patience, initial_prompt=initial_prompt,
+                          compression_ratio_threshold=compression_ratio_threshold, logprob_threshold=logprob_threshold,
+                          no_speech_threshold=no_speech_threshold, verbose=verbose, fp16=fp16)
+    if getattr(model, "engine", None) == "ctranslate2":
+        return _transcribe_ctranslate2(model, audio, batch_size, decode_options)
+    if not hasattr(model, "dims"):
+        return model.transcribe(audio, condition_on_previous_text=condition_on_previous_text, **decode_options)
+
+    import torch
+    import whisper
+    from whisper.audio import log_mel_spectrogram, pad_or_trim, N_SAMPLES, N_FRAMES
+    from whisper.tokenizer import get_tokenizer
+    from whisper.utils import compression_ratio
+
+    if model.device == torch.device("cpu"):
+        fp16 = False
+    samples = _load_audio(audio)
+    chunks = split_chunks(samples)
+    mels = [pad_or_trim(log_mel_spectrogram(samples[s:e], model.dims.n_mels, padding=N_SAMPLES), N_FRAMES)
+            for s, e in chunks]
+    if not mels:
+        return {"text": "", "segments": [], "language": language or "en"}
+
+    if language is None:
+        if model.is_multilingual:
+            _, probs = model.detect_language(mels[0].unsqueeze(0).to(model.device))
+            language = max(probs[0], key=probs[0].get)
+        else:
+            language = "en"
+        if verbose:
+            print(f"Detected language: {whisper.tokenizer.LANGUAGES.get(language, language).title()}")
+    tokenizer = get_tokenizer(model.is_multilingual, num_languages=model.num_languages, language=language, task=task)
+    temperatures = list(temperature) if isinstance(temperature, (list, tuple)) else [temperature]
+
+    results = [None] * len(chunks)
+    for first in range(0, len(chunks), batch_size):
+        todo = list(range(first, min(first + batch_size, len(chunks))))
+        for t in temperatures:
+            options = dict(task=task, language=language, temperature=t, prompt=initial_prompt, fp16=fp16)
+            if t > 0:
+                options["best_of"] = best_of
+            else:
+                options["beam_size"] = beam_size
+                options["patience"] = patience
+            mel_batch = torch.stack([mels[i] for i in todo]).to(model.device)
+            # model.decode (not whisper.decode) so a cancellation hook on the instance sees every batch
+            decoded = model.decode(mel_batch, whisper.DecodingOptions(**options))
+            retry = []
+            for i, r in zip(todo, decoded):
+                results[i] = r
+                if t != temperatures[-1] and _needs_fallback(r, compression_ratio_threshold, logprob_threshold, no_speech_threshold):
+                    retry.append(i)
+            todo = retry
+            if not todo:
+                break
+
+    segments = []
+    for (s, e), r in zip(chunks, results):
+        if no_speech_threshold is not None and r.no_speech_prob > no_speech_threshold and \
+                (logprob_threshold is None or r.avg_logprob < logprob_threshold):
+            continue
+        duration = (e - s) / SAMPLE_RATE
+        for start, end, tokens in _split_segments(r, tokenizer, s / SAMPLE_RATE, duration):
+            text = tokenizer.decode(tokens)
+            if not text.strip():
+                continue
+            segments.append({
+                "id": len(segments), "seek": int(s / SAMPLE_RATE * 100), "start": round(start, 3), "end": round(end, 3),
+                "text": text, "tokens": tokens, "temperature": r.temperature, "avg_logprob": r.avg_logprob,
+                "compression_ratio": compression_ratio(text), "no_speech_prob": r.no_speech_prob,
+            })
+            if verbose:
+                print(f"[{start:.2f} --> {end:.2f}] {text}")
+    return {"text": "".join(seg["text"] for seg in segments), "segments": segments, "language": language}
+
+
+class BatchedModel:
+    """
+    Wraps a loaded model so that transcribe() takes the batched path; every other attribute is
+    the model's own. Lets the existing callers (streaming windows, checkpoints) use batching unchanged.
+    """
+
+    def __init__(self, model, batch_size=DEFAULT_BATCH_SIZE):
+        self.model = model
+        self.batch_size = batch_size
+
+    def transcribe(self, audio, **decode_options):
+        return transcribe_batched(self.model, audio, self.batch_size, **decode_options)
+
+    def __getattr__(self, name):
+        return getattr(self.model, name)
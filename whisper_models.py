@@ -5,10 +5,14 @@ This script helps you download and manage Whisper models in your project directo
 """
 
 import os
+import shutil
+import tempfile
 import whisper
 from pathlib import Path
 import argparse
 
+from whisper_backends import ct2_model_dir, CT2_DIR
+
 # Set up paths
 PROJECT_DIR = Path(__file__).parent
 MODELS_DIR = PROJECT_DIR / "models"
@@ -60,6 +64,13 @@ def list_downloaded_models():
     else:
         print("  No models downloaded yet")
 
+    converted = sorted(p for p in CT2_DIR.glob("*") if (p / "model.bin").exists()) if CT2_DIR.exists() else []
+    if converted:
+        print(f"\nConverted for the ctranslate2 engine ({CT2_DIR}):")
+        for path in converted:
+            size_mb = sum(f.stat().st_size for f in path.iterdir()) / (1024 * 1024)
+            print(f"  ✓ {path.name:<15} ({size_mb:.1f} MB)")
+
 def download_model(model_name):
     """Download a specific model to the project directory"""
     setup_environment()
@@ -88,6 +99,46 @@ def download_model(model_name):
         print(f"Error downloading model: {e}")
         return False
 
+def hub_model_name(model_name):
+    """Hugging Face repo with the tokenizer and feature extractor files of a Whisper model"""
+    aliases = {"large": "large-v3", "turbo": "large-v3-turbo"}
+    return f"openai/whisper-{aliases.get(model_name, model_name)}"
+
+def convert_model(model_name, quantization="int8"):
+    """Convert models/<model>.pt to a CTranslate2 model in models/ct2/<model> for the ctranslate2 engine"""
+    checkpoint = MODELS_DIR / f"{model_name}.pt"
+    if not checkpoint.exists():
+        print(f"Model '{model_name}' not found in {MODELS_DIR}; download it first: python whisper_models.py download {model_name}")
+        return False
+    try:
+        import ctranslate2
+        from transformers import WhisperProcessor
+        from transformers.models.whisper.convert_openai_to_hf import convert_openai_whisper_to_tfms
+    except ImportError:
+        print("Error: conversion needs ctranslate2 and transformers (pip install ctranslate2 transformers faster-whisper)")
+        return False
+
+    output_dir = ct2_model_dir(model_name)
+    try:
+        with tempfile.TemporaryDirectory() as hf_dir:
+            # openai-whisper checkpoint -> Transformers checkpoint -> CTranslate2 model
+            print(f"Converting {checkpoint.name} to a Transformers checkpoint...")
+            converted = convert_openai_whisper_to_tfms(str(checkpoint), hf_dir)
+            model = converted[0] if isinstance(converted, tuple) else converted
+            model.save_pretrained(hf_dir)
+            # The tokenizer and mel settings are not part of the .pt file (small download, cached afterwards)
+            WhisperProcessor.from_pretrained(hub_model_name(model_name)).save_pretrained(hf_dir)
+            print(f"Converting to CTranslate2 with {quantization} weights...")
+            converter = ctranslate2.converters.TransformersConverter(
+                hf_dir, copy_files=["tokenizer.json", "preprocessor_config.json"])
+            converter.convert(str(output_dir), quantization=quantization, force=True)
+    except Exception as e:
+        print(f"Error converting model: {e}")
+        shutil.rmtree(output_dir, ignore_errors=True)
+        return False
+    print(f"✓ Converted {model_name} to {output_dir} (use with --engine ctranslate2 or WHISPER_ENGINE=ctranslate2)")
+    return True
+
 def remove_model(model_name):
     """Remove a downloaded model"""
     model_file = MODELS_DIR / f"{model_name}.pt"
@@ -117,9 +168,11 @@ def get_disk_usage():
 
 def main():
     parser = argparse.ArgumentParser(description="Manage Whisper models in your project")
-    parser.add_argument("action", choices=["list", "download", "remove", "status"], 
+    parser.add_argument("action", choices=["list", "download", "remove", "status", "convert"], 
                        help="Action to perform")
-    parser.add_argument("model", nargs="?", help="Model name (for download/remove actions)")
+    parser.add_argument("model", nargs="?", help="Model name (for download/remove/convert actions)")
+    parser.add_argument("--quantization", choices=["int8", "int8_float16", "float16", "float32"], default="int8",
+                        help="Weight type of converted CTranslate2 models (default: int8)")
     
     args = parser.parse_args()
     
@@ -140,6 +193,12 @@ def main():
     elif args.action == "status":
         list_downloaded_models()
         get_disk_usage()
+    elif args.action == "convert":
+        if not args.model:
+            print("Error: Please specify a model name to convert")
+            list_downloaded_models()
+        else:
+            convert_model(args.model, args.quantization)
 
 if __name__ == "__main__":
     if len(os.sys.argv) == 1:
@@ -155,5 +214,6 @@ if __name__ == "__main__":
         print("  python whisper_models.py download base   # Download base model")
         print("  python whisper_models.py remove tiny     # Remove tiny model")
         print("  python whisper_models.py status          # Show current status")
+        print("  python whisper_models.py convert base    # Convert base for the ctranslate2 engine (int8)")
     else:
         main()
@@ -0,0 +1,170 @@
+#!/usr/bin/env python3
+"""
+Whisper Streaming Decode
+Reads audio from ffmpeg in fixed-size windows and transcribes them one window at a time,
+so peak memory stays constant whatever the input length.
+"""
+
+import subprocess
+from itertools import chain
+import numpy as np
+
+from profiling import stage
+
+# Same values as whisper.audio, duplicated so this module can be imported without torch
+SAMPLE_RATE = 16000
+DEFAULT_WINDOW_SECONDS = 300
+
+# Characters of already decoded text fed back as prompt for the next window
+PROMPT_CHARS = 400
+
+
+def probe_duration(file_path):
+    """Return the media duration in seconds using ffprobe, or None if it cannot be determined"""
+    cmd = [
+        "ffprobe", "-v", "error",
+        "-show_entries", "format=duration",
+        "-of", "default=noprint_wrappers=1:nokey=1",
+        str(file_path),
+    ]
+    try:
+        out = subprocess.run(cmd, capture_output=True, text=True, check=True).stdout.strip()
+        return float(out)
+    except Exception:
+        return None
+
+
+def _read_exact(stream, num_bytes):
+    """Read up to num_bytes from a pipe, looping over short reads"""
+    chunks = []
+    remaining = num_bytes
+    while remaining > 0:
+        data = stream.read(remaining)
+        if not data:
+            break
+        chunks.append(data)
+        remaining -= len(data)
+    return b"".join(chunks)
+
+
+def iter_audio_windows(file_path, window_seconds=DEFAULT_WINDOW_SECONDS, sr=SAMPLE_RATE, start=0.0):
+    """
+    Decode a media file with ffmpeg and yield (offset_seconds, float32 mono audio) windows.
+    Only one window of samples is held in memory at a time.
+    start skips the first seconds of the file (used to resume from a checkpoint).
+    """
+    cmd = ["ffmpeg", "-nostdin", "-threads", "0"]
+    if start:
+        # -ss before -i seeks in the input instead of decoding and discarding
+        cmd += ["-ss", f"{start:.3f}"]
+    cmd += [
+        "-i", str(file_path),
+        "-f", "s16le", "-ac", "1", "-acodec", "pcm_s16le", "-ar", str(sr),
+        "-",
+    ]
+    proc = subprocess.Popen(cmd, stdout=subprocess.PIPE, stderr=subprocess.DEVNULL)
+    window_bytes = int(window_seconds * sr) * 2
+    offset = float(start)
+    try:
+        while True:
+            with stage("ffmpeg"):
+                data = _read_exact(proc.stdout, window_bytes)
+            # Drop a trailing odd byte, int16 samples need two
+            data = data[:len(data) - (len(data) % 2)]
+            if not data:
+                break
+            audio = np.frombuffer(data, np.int16).astype(np.float32) / 32768.0
+            yield offset, audio
+            offset += len(audio) / sr
+    finally:
+        proc.stdout.close()
+        proc.kill()
+        proc.wait()
+
+
+def _shift_segment(seg, offset, seg_id):
+    """Copy a window-relative segment and move it onto the file timeline"""
+    seg = dict(seg)
+    seg["id"] = seg_id
+    seg["start"] = seg["start"] + offset
+    seg["end"] = seg["end"] + offset
+    if "words" in seg:
+        seg["words"] = [dict(w, start=w["start"] + offset, end=w["end"] + offset) for w in seg["words"]]
+    return seg
+
+
+def iter_transcribe_windows(model, file_path, window_seconds=DEFAULT_WINDOW_SECONDS,
+                            condition_on_previous_text=True, start=0.0, first_id=0, **decode_options):
+    """
+    Transcribe a file window by window.
+    Yields (window_end_seconds, segments, language, prompt) after each window is decoded, with
+    segment timestamps already shifted onto the file timeline. language and prompt are the
+    decoder state for the next window: passing them back as language/initial_prompt together
+    with start=window_end continues the transcription from that point.
+    The last segment of a window is usually cut off by the window's end, so it is not yielded:
+    its audio is decoded again at the start of the next window, and window_end is where it
+    began. Window boundaries thus fall between segments instead of inside words.
+    """
+    prompt = decode_options.pop("initial_prompt", None)
+    language = decode_options.pop("language", None)
+    next_id = first_id
+    window_samples = int(window_seconds * SAMPLE_RATE)
+    carry = None
+    carry_offset = None
+    # (None, None) marks the end of the file, to decode the audio still carried over
+    for offset, audio in chain(iter_audio_windows(file_path, window_seconds, start=start), [(None, None)]):
+        if audio is None:
+            if carry is None:
+                break
+            offset, audio, more = carry_offset, carry, False
+        else:
+            # A full window means the file may go on
+            more = len(audio) == window_samples
+            if carry is not None:
+                offset, audio = carry_offset, np.concatenate([carry, audio])
+        carry = None
+        result = model.transcribe(
+            audio,
+            initial_prompt=prompt,
+            language=language,
+            condition_on_previous_text=condition_on_previous_text,
+            **decode_options,
+        )
+        # Keep the language detected on the first window for the rest of the file
+        if not language:
+            language = result.get("language")
+        window_segments = result.get("segments", [])
+        window_end = offset + len(audio) / SAMPLE_RATE
+        if more and len(window_segments) > 1 and window_segments[-1]["start"] > 0:
+            cut = window_segments.pop()["start"]
+            carry = audio[int(cut * SAMPLE_RATE):]
+            carry_offset = window_end = offset + cut
+        segments = []
+        for seg in window_segments:
+            segments.append(_shift_segment(seg, offset, next_id))
+            next_id += 1
+        text = "".join(seg["text"] for seg in window_segments)
+        if condition_on_previous_text and text.strip():
+            prompt = text[-PROMPT_CHARS:]
+        del audio, result
+        yield window_end, segments, language, prompt
+
+
+def transcribe_streaming(model, file_path, window_seconds=DEFAULT_WINDOW_SECONDS,
+                         progress_callback=None, **decode_options):
+    """
+    Drop-in replacement for model.transcribe(file_path) that decodes in bounded-memory windows.
+    progress_callback(window_end_seconds) is called after each window.
+    Returns a dict with the same "text", "segments" and "language" keys as model.transcribe.
+    """
+    all_segments = []
+    language = None
+    for window_end, segments, language, _ in iter_transcribe_windows(model, file_path, window_seconds, **decode_options):
+        all_segments.extend(segments)
+        if progress_callback:
+            progress_callback(window_end)
+    return {
+        "text": "".join(seg["text"] for seg in all_segments),
+        "segments": all_segments,
+        "language": language,
+    }
@@ -3,6 +3,7 @@ import subprocess
 from flask import Flask, render_template, request, redirect, url_for, flash, jsonify, send_file
 from celery_worker import start_transcription, get_job_status
 from werkzeug.utils import secure_filename
+from decoding_presets import PRESETS, DEFAULT_PRESET, normalize_language
 
 app = Flask(__name__)
 app.secret_key = 'whisper_secret_key'
@@ -17,10 +18,18 @@ def download():
     if not file_path or not os.path.exists(file_path):
         return "File not found", 404
     return send_file(file_path, as_attachment=True)
-from flask import Flask, render_template, request, redirect, url_for, flash, jsonify
+from flask import Flask, render_template, request, redirect, url_for, flash, jsonify, make_response
 import os
 import subprocess
-from celery_worker import start_transcription, get_job_status
+import io
+import time
+import uuid
+import zipfile
+from flask import Response
+from celery_worker import start_transcription, start_batch, get_batch_outputs, get_job_status, cancel_job, get_transcript_page, resume_unfinished_jobs, get_nodes, start_prewarm, get_readiness, start_rerender
+from search_index import search
+from ingest import ingest_upload, expire_originals
+from rendering import valid_job_id
 from werkzeug.utils import secure_filename
 
 app = Flask(__name__)
@@ -28,12 +37,20 @@ app.secret_key = 'whisper_secret_key'
 UPLOAD_FOLDER = 'uploads'
 app.config['UPLOAD_FOLDER'] = UPLOAD_FOLDER
 os.makedirs(UPLOAD_FOLDER, exist_ok=True)
+# Original videos kept after audio extraction (WHISPER_KEEP_ORIGINAL_HOURS)
+ORIGINALS_FOLDER = os.path.join(UPLOAD_FOLDER, 'originals')
 
 # Path to your transcribe.py script
 TRANSCRIBE_SCRIPT = os.path.join(os.path.dirname(__file__), '../transcribe.py')
 
-MODELS = ["base", "large-v3-turbo", "large-v3", "small", "tiny"]
+# "auto" lets model_router.py pick a model from the queue, media duration and latency target
+MODELS = ["base", "large-v3-turbo", "large-v3", "small", "tiny", "auto"]
 FORMATS = ["txt", "json", "srt", "all"]
+# Files picked up from multi-file and folder uploads (other files in a folder are skipped)
+MEDIA_EXTENSIONS = {
+    '.wav', '.mp3', '.mp4', '.avi', '.mov', '.mkv', '.flv', '.webm',
+    '.m4a', '.aac', '.ogg', '.flac', '.wma', '.3gp', '.amr'
+}
 
 def run_transcribe(file_path, output_dir, model, fmt, cpu, translate_zh):
     # Deprecated: now handled by Celery
@@ -45,63 +62,265 @@ def index():
     error = None
     task_id = None
     if request.method == 'POST':
-        file = request.files.get('file')
+        files = [f for f in request.files.getlist('file') if f and f.filename]
+        file = files[0] if files else None
         output_dir = request.form.get('output_dir')
         model = request.form.get('model')
         fmt = request.form.get('format')
         cpu = request.form.get('cpu') == 'on'
         translate_zh = request.form.get('translate_zh') == 'on'
-        print(f"[LOG] Received POST: file={file.filename if file else None}, output_dir={output_dir}, model={model}, format={fmt}, cpu={cpu}, translate_zh={translate_zh}")
+        stream = request.form.get('stream') == 'on'
+        batched = request.form.get('batched') == 'on'
+        profile = request.form.get('profile') == 'on'
+        preset = request.form.get('preset') if request.form.get('preset') in PRESETS else DEFAULT_PRESET
+        try:
+            language = normalize_language(request.form.get('language'))
+            language_error = None
+        except ValueError as e:
+            language, language_error = None, str(e)
+        # Minutes in the form, seconds for the router
+        latency_target = request.form.get('latency_target', type=float)
+        latency_target = latency_target * 60 if latency_target and latency_target > 0 else None
+        print(f"[LOG] Received POST: files={len(files)}, file={file.filename if file else None}, output_dir={output_dir}, model={model}, format={fmt}, cpu={cpu}, translate_zh={translate_zh}, stream={stream}, batched={batched}, profile={profile}, preset={preset}, language={language}")
+        media_files = [f for f in files if os.path.splitext(f.filename)[1].lower() in MEDIA_EXTENSIONS]
+        expire_originals(ORIGINALS_FOLDER)
         if not file or file.filename == '':
             error = "Please select an audio/video file."
             print(f"[ERROR] {error}")
+        elif language_error:
+            error = language_error
+            print(f"[ERROR] {error}")
+        elif len(files) > 1:
+            if not media_files:
+                error = "No audio/video files found in the selection."
+                print(f"[ERROR] {error}")
+                return render_template('index.html', models=MODELS, formats=FORMATS, presets=list(PRESETS), default_preset=DEFAULT_PRESET, result=result, error=error, running=False)
+            # Multi-file / folder upload: one batch job, files kept apart from other uploads
+            batch_id = str(uuid.uuid4())
+            batch_folder = os.path.join(app.config['UPLOAD_FOLDER'], batch_id)
+            os.makedirs(batch_folder, exist_ok=True)
+            file_paths = []
+            media = []
+            names = []
+            for i, f in enumerate(media_files):
+                # Folder uploads send relative paths; secure_filename flattens them. It also drops
+                # non-ASCII characters (第一集.mp4 -> mp4), so the index keeps the saved names apart
+                stem, ext = os.path.splitext(os.path.basename(f.filename))
+                file_path = os.path.join(batch_folder, f"{i:03d}_{secure_filename(stem) or 'file'}{ext.lower()}")
+                f.save(file_path)
+                file_path, info = ingest_upload(file_path, ORIGINALS_FOLDER)
+                file_paths.append(file_path)
+                media.append(info)
+                names.append(f.filename)
+            print(f"[LOG] Saved {len(file_paths)} files to {batch_folder}")
+            start_batch(file_paths, output_dir, model, fmt, cpu, translate_zh, stream=stream, batch_id=batch_id,
+                        preset=preset, language=language, latency_target=latency_target, batched=batched,
+                        media=media, profile=profile, names=names)
+            print(f"[LOG] Started batch job: {batch_id}")
+            return redirect(url_for('batch_progress', batch_id=batch_id))
         else:
             filename = secure_filename(file.filename)
             file_path = os.path.join(app.config['UPLOAD_FOLDER'], filename)
             file.save(file_path)
             print(f"[LOG] Saved file to {file_path}")
+            # Videos are swapped for their audio stream before they are queued
+            file_path, media = ingest_upload(file_path, ORIGINALS_FOLDER)
             # Start transcription job in a background thread
-            job_id = start_transcription(file_path, output_dir, model, fmt, cpu, translate_zh)
+            job_id = start_transcription(file_path, output_dir, model, fmt, cpu, translate_zh, stream=stream,
+                                         preset=preset, language=language, latency_target=latency_target,
+                                         batched=batched, media=media, profile=profile)
             print(f"[LOG] Started transcription job: {job_id}")
             # Show progress page
             return redirect(url_for('progress', task_id=job_id))
-    return render_template('index.html', models=MODELS, formats=FORMATS, result=result, error=error, running=False)
+    return render_template('index.html', models=MODELS, formats=FORMATS, presets=list(PRESETS), default_preset=DEFAULT_PRESET, result=result, error=error, running=False)
 
 @app.route('/progress/<task_id>')
 def progress(task_id):
     return render_template('progress.html', task_id=task_id)
 
+@app.route('/batch/<batch_id>')
+def batch_progress(batch_id):
+    return render_template('batch.html', batch_id=batch_id)
+
+class _ZipStream(io.RawIOBase):
+    """Write-only sink that hands written bytes back in chunks, so a zip can be streamed"""
+    def __init__(self):
+        self.chunks = []
+    def writable(self):
+        return True
+    def write(self, b):
+        self.chunks.append(bytes(b))
+        return len(b)
+    def pop(self):
+        data = b''.join(self.chunks)
+        self.chunks = []
+        return data
+
+@app.route('/download_zip/<batch_id>')
+def download_zip(batch_id):
+    """Stream all finished outputs of a batch as one zip, file by file, without building it in memory"""
+    outputs = get_batch_outputs(batch_id)
+    if not outputs:
+        return "No finished outputs for this batch", 404
+    def generate():
+        sink = _ZipStream()
+        with zipfile.ZipFile(sink, 'w', zipfile.ZIP_DEFLATED) as zf:
+            for arcname, path in outputs:
+                with open(path, 'rb') as src, zf.open(arcname, 'w') as dest:
+                    while True:
+                        chunk = src.read(64 * 1024)
+                        if not chunk:
+                            break
+                        dest.write(chunk)
+                        yield sink.pop()
+                yield sink.pop()
+        yield sink.pop()
+    return Response(generate(), mimetype='application/zip',
+                    headers={'Content-Disposition': f'attachment; filename=whisper_batch_{batch_id[:8]}.zip'})
+
+@app.route('/cancel/<task_id>', methods=['POST'])
+def cancel(task_id):
+    cancelled = cancel_job(task_id)
+    print(f"[LOG] Cancel requested for job {task_id}: {'accepted' if cancelled else 'not running'}")
+    job = get_job_status(task_id)
+    return jsonify({'cancelled': cancelled, 'state': job.get('state') if job else 'UNKNOWN'})
+
+# Progress fields copied into the compact /task_status payload
+STATUS_FIELDS = [
+    'state', 'version', 'progress', 'transcribe_progress', 'translate_progress', 'post_progress',
+    'stage', 'start_time', 'queued_at', 'media_duration', 'expected_runtime',
+    'queue_position', 'predicted_wait', 'predicted_finish', 'model', 'model_reason', 'media',
+    'profile',
+]
+
 @app.route('/task_status/<task_id>')
 def task_status(task_id):
+    """
+    Small progress payload with a version counter. The transcript itself is not included
+    (see /transcript), and an unchanged job answers If-None-Match polls with 304.
+    """
     try:
         job = get_job_status(task_id)
-        print(f"[DEBUG] task_status called for job_id={task_id}, job={job}")
         response = {}
         if job:
+            for field in STATUS_FIELDS:
+                response[field] = job.get(field)
             response['state'] = job.get('state', 'PENDING')
-            response['progress'] = job.get('progress', 0)
-            response['transcribe_progress'] = job.get('transcribe_progress', 0)
-            response['translate_progress'] = job.get('translate_progress', 0)
-            response['post_progress'] = job.get('post_progress', 0)
-            response['stage'] = job.get('stage', '')
-            response['start_time'] = job.get('start_time', None)
             if job.get('state') == 'SUCCESS':
-                response['output'] = job.get('output', '')
-                if 'output_file' in job:
-                    response['output_file'] = job['output_file']
+                response['output_file'] = job.get('output_file')
+                response['segment_count'] = job.get('segment_count', 0)
+                if 'translate_stats' in job:
+                    response['translate_stats'] = job['translate_stats']
+                if 'translate_error' in job:
+                    response['translate_error'] = job['translate_error']
             if job.get('state') == 'FAILURE':
                 response['error'] = job.get('error', 'Unknown error')
+            if 'resources' in job:
+                response['resources'] = job['resources']
+            if 'waiting_for' in job:
+                response['waiting_for'] = job['waiting_for']
+            if job.get('kind') == 'batch':
+                for field in ('files', 'files_total', 'files_done', 'files_failed'):
+                    response[field] = job.get(field)
+            if job.get('kind') == 'rerender' and 'rerender' in job:
+                response['rerender'] = job['rerender']
         else:
             response['state'] = 'PENDING'
+            response['version'] = 0
             response['progress'] = 0
             response['transcribe_progress'] = 0
             response['translate_progress'] = 0
             response['post_progress'] = 0
-        return jsonify(response)
+        # Queue position moves without the job itself changing, so it is part of the tag
+        etag = f"{task_id}-{response.get('version', 0)}-{response.get('queue_position') or 0}"
+        if etag in request.if_none_match:
+            return '', 304
+        resp = make_response(jsonify(response))
+        resp.set_etag(etag)
+        resp.headers['Cache-Control'] = 'no-cache'
+        return resp
     except Exception as e:
         return jsonify({'state': 'FAILURE', 'progress': 100, 'error': f'Internal error: {e}'})
 
+# Live captioning needs flask-sock; without it the rest of the app still works
+try:
+    from flask_sock import Sock
+except ImportError:
+    Sock = None
+
+if Sock is not None:
+    sock = Sock(app)
+
+    @sock.route('/ws/live')
+    def live(ws):
+        """Live transcription: binary PCM/Opus chunks in, JSON partial and final segments out (see live.py)"""
+        from live import serve_live_session
+        serve_live_session(ws, request.args, allowed_models=[m for m in MODELS if m != 'auto'])
+else:
+    print("[DEBUG] flask-sock not installed, /ws/live is disabled")
+
+@app.route('/healthz')
+def healthz():
+    """Liveness: the process is up and serving requests"""
+    return jsonify({'status': 'ok'})
+
+@app.route('/readyz')
+def readyz():
+    """Readiness for the load balancer: 200 once models are warm and the queue is short, 503 otherwise"""
+    # Also starts the warm-up when the app runs under a WSGI server instead of app.run()
+    start_prewarm()
+    ready, details = get_readiness()
+    details['ready'] = ready
+    return jsonify(details), (200 if ready else 503)
+
+@app.route('/nodes')
+def nodes():
+    """Worker nodes and their last heartbeat (WHISPER_EXECUTOR=broker)"""
+    return jsonify(get_nodes())
+
+@app.route('/search')
+def search_transcripts():
+    """Segments of finished transcripts containing ?q=, with file, timestamps and <mark> highlights"""
+    query = (request.args.get('q') or '').strip()
+    if not query:
+        return jsonify({'error': 'Missing query parameter q'}), 400
+    limit = min(max(request.args.get('limit', 50, type=int), 1), 500)
+    start = time.time()
+    hits = search(query, limit)
+    return jsonify({'query': query, 'hits': hits, 'took_ms': round((time.time() - start) * 1000, 1)})
+
+@app.route('/rerender', methods=['POST'])
+def rerender():
+    """
+    Re-render stored jobs after custom_dict.txt or the formatting changed.
+    JSON body (all optional): {"job_ids": [...], "dry_run": true}; without job_ids every stored job.
+    Runs as a scheduled job: answers 202 with its id, and /task_status has the summary when done.
+    """
+    body = request.get_json(silent=True) or {}
+    job_ids = body.get('job_ids') or request.form.getlist('job_id') or None
+    if job_ids is not None and (not isinstance(job_ids, list) or not all(valid_job_id(j) for j in job_ids)):
+        return jsonify({'error': 'job_ids must be a list of job ids'}), 400
+    dry_run = bool(body.get('dry_run')) or request.form.get('dry_run') == 'on'
+    job_id = start_rerender(job_ids, dry_run=dry_run)
+    print(f"[LOG] Re-render {job_id} queued: {len(job_ids) if job_ids else 'all'} job(s), dry_run={dry_run}")
+    return jsonify({'job_id': job_id, 'status_url': url_for('task_status', task_id=job_id)}), 202
+
+@app.route('/transcript/<task_id>')
+def transcript(task_id):
+    """Finished transcript segments, paginated: ?cursor=<segment index>&limit=<count>"""
+    cursor = max(request.args.get('cursor', 0, type=int), 0)
+    limit = min(max(request.args.get('limit', 200, type=int), 1), 1000)
+    page = get_transcript_page(task_id, cursor, limit)
+    if page is None:
+        return jsonify({'error': 'Transcript not available'}), 404
+    segments, next_cursor, total = page
+    return jsonify({'segments': segments, 'next_cursor': next_cursor, 'total': total})
+
 if __name__ == '__main__':
+    # With debug=True the reloader runs the app in a child process; resume jobs only there, once
+    if os.environ.get('WERKZEUG_RUN_MAIN') == 'true':
+        start_prewarm()
+        resume_unfinished_jobs()
     app.run(debug=True, port=5001)
 
 # Install the required packages
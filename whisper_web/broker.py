@@ -0,0 +1,307 @@
+
+# message broker and shared job store for distributed worker nodes
+import os
+import json
+import time
+import socket
+from contextlib import contextmanager
+
+try:
+    import redis
+except ImportError:
+    redis = None
+
+# Nodes send a heartbeat this often (seconds)
+HEARTBEAT_INTERVAL = 5.0
+# A node whose last heartbeat is older than this is dead and its jobs are requeued
+NODE_TTL = float(os.environ.get('WHISPER_NODE_TTL', '30'))
+
+
+def default_node_id():
+    return f"{socket.gethostname()}-{os.getpid()}"
+
+
+class Broker:
+    """
+    Job queue plus shared store, used by the Flask process and the worker nodes.
+
+    Job messages are dicts {'job_id', 'task', 'args', 'attempts'}. A node claims a message,
+    which moves it to that node's in-flight list until it is acked. Nodes push job updates
+    (partial job-record fields) to the store; the Flask process consumes them in order with
+    pop_updates(). requeue_dead() puts the in-flight jobs of nodes that stopped sending
+    heartbeats back on the queue.
+    """
+
+    def publish(self, message):
+        raise NotImplementedError
+
+    def claim(self, node_id, timeout=1.0):
+        """Take the next job message for node_id, or None after timeout seconds"""
+        raise NotImplementedError
+
+    def ack(self, node_id, job_id):
+        raise NotImplementedError
+
+    def heartbeat(self, node_id, info):
+        raise NotImplementedError
+
+    def nodes(self):
+        """{node_id: last heartbeat info}"""
+        raise NotImplementedError
+
+    def requeue_dead(self, ttl=NODE_TTL, max_attempts=3):
+        """Requeue jobs of dead nodes; returns the ids of jobs that ran out of attempts"""
+        raise NotImplementedError
+
+    def push_update(self, job_id, fields):
+        raise NotImplementedError
+
+    def pop_updates(self, timeout=1.0):
+        """List of (job_id, fields) updates in the order they were pushed"""
+        raise NotImplementedError
+
+    def get_job(self, job_id):
+        raise NotImplementedError
+
+    def cancel(self, job_id):
+        raise NotImplementedError
+
+    def is_cancelled(self, job_id):
+        raise NotImplementedError
+
+
+def _requeued(message, max_attempts):
+    """Message to put back on the queue, or None if the job has used up its attempts"""
+    message = dict(message, attempts=message.get('attempts', 0) + 1)
+    return message if message['attempts'] < max_attempts else None
+
+
+class RedisBroker(Broker):
+    """Broker on a Redis server, shared by nodes on any number of machines"""
+
+    def __init__(self, url, prefix='whisper'):
+        if redis is None:
+            raise RuntimeError("The redis package is required for a redis:// broker (pip install redis)")
+        self.r = redis.Redis.from_url(url, decode_responses=True)
+        self.prefix = prefix
+        # job_id -> raw message, needed to remove it from the in-flight list on ack
+        self._claimed = {}
+
+    def _key(self, *parts):
+        return ':'.join((self.prefix,) + parts)
+
+    def publish(self, message):
+        self.r.lpush(self._key('queue'), json.dumps(message))
+
+    def claim(self, node_id, timeout=1.0):
+        raw = self.r.brpoplpush(self._key('queue'), self._key('processing', node_id), timeout=max(1, int(timeout)))
+        if raw is None:
+            return None
+        message = json.loads(raw)
+        self._claimed[message['job_id']] = raw
+        return message
+
+    def ack(self, node_id, job_id):
+        raw = self._claimed.pop(job_id, None)
+        if raw is not None:
+            self.r.lrem(self._key('processing', node_id), 1, raw)
+
+    def heartbeat(self, node_id, info):
+        self.r.hset(self._key('nodes'), node_id, json.dumps(dict(info, ts=time.time())))
+
+    def nodes(self):
+        return {node: json.loads(info) for node, info in self.r.hgetall(self._key('nodes')).items()}
+
+    def requeue_dead(self, ttl=NODE_TTL, max_attempts=3):
+        failed = []
+        now = time.time()
+        for node_id, info in self.nodes().items():
+            if now - info['ts'] <= ttl:
+                continue
+            # RPOP is atomic, so two reapers never requeue the same message twice
+            while True:
+                raw = self.r.rpop(self._key('processing', node_id))
+                if raw is None:
+                    break
+                message = json.loads(raw)
+                requeued = _requeued(message, max_attempts)
+                if requeued:
+                    self.r.rpush(self._key('queue'), json.dumps(requeued))
+                    print(f"[DEBUG] Requeued job {message['job_id']} from dead node {node_id}")
+                else:
+                    failed.append(message['job_id'])
+            self.r.hdel(self._key('nodes'), node_id)
+        return failed
+
+    def push_update(self, job_id, fields):
+        pipe = self.r.pipeline()
+        pipe.hset(self._key('job', job_id), mapping={k: json.dumps(v) for k, v in fields.items()})
+        pipe.rpush(self._key('updates'), json.dumps([job_id, fields]))
+        pipe.execute()
+
+    def pop_updates(self, timeout=1.0):
+        first = self.r.blpop(self._key('updates'), timeout=max(1, int(timeout)))
+        if first is None:
+            return []
+        raws = [first[1]]
+        while len(raws) < 500:
+            raw = self.r.lpop(self._key('updates'))
+            if raw is None:
+                break
+            raws.append(raw)
+        return [tuple(json.loads(raw)) for raw in raws]
+
+    def get_job(self, job_id):
+        return {k: json.loads(v) for k, v in self.r.hgetall(self._key('job', job_id)).items()}
+
+    def cancel(self, job_id):
+        self.r.sadd(self._key('cancelled'), job_id)
+
+    def is_cancelled(self, job_id):
+        return bool(self.r.sismember(self._key('cancelled'), job_id))
+
+
+class FileBroker(Broker):
+    """
+    Broker in a directory, for running the distributed mode on one machine (or on nodes sharing
+    a network filesystem) without Redis. Claims are atomic renames, so several node processes
+    can consume the same queue.
+    """
+
+    def __init__(self, root):
+        self.root = root
+        for sub in ('queue', 'processing', 'nodes', 'updates', 'jobs', 'cancelled'):
+            os.makedirs(os.path.join(root, sub), exist_ok=True)
+
+    def _path(self, *parts):
+        return os.path.join(self.root, *parts)
+
+    def _write(self, path, obj):
+        tmp_path = f"{path}.{os.getpid()}.tmp"
+        with open(tmp_path, 'w', encoding='utf-8') as f:
+            json.dump(obj, f, ensure_ascii=False)
+        os.replace(tmp_path, path)
+
+    def _read(self, path):
+        with open(path, 'r', encoding='utf-8') as f:
+            return json.load(f)
+
+    def _listdir(self, *parts):
+        # Names start with a nanosecond timestamp, so sorting gives FIFO order; .tmp files are half written
+        return sorted(n for n in os.listdir(self._path(*parts)) if n.endswith('.json'))
+
+    def publish(self, message):
+        self._write(self._path('queue', f"{time.time_ns()}-{message['job_id']}.json"), message)
+
+    def claim(self, node_id, timeout=1.0):
+        inflight = self._path('processing', node_id)
+        os.makedirs(inflight, exist_ok=True)
+        deadline = time.time() + timeout
+        while True:
+            for name in self._listdir('queue'):
+                try:
+                    os.rename(self._path('queue', name), os.path.join(inflight, name))
+                except FileNotFoundError:
+                    continue  # another node took it
+                return self._read(os.path.join(inflight, name))
+            if time.time() >= deadline:
+                return None
+            time.sleep(0.2)
+
+    def ack(self, node_id, job_id):
+        inflight = self._path('processing', node_id)
+        for name in os.listdir(inflight):
+            if name.endswith(f"-{job_id}.json"):
+                os.remove(os.path.join(inflight, name))
+
+    def heartbeat(self, node_id, info):
+        self._write(self._path('nodes', f"{node_id}.json"), dict(info, ts=time.time()))
+
+    def nodes(self):
+        result = {}
+        for name in self._listdir('nodes'):
+            try:
+                result[name[:-len('.json')]] = self._read(self._path('nodes', name))
+            except (OSError, ValueError):
+                pass
+        return result
+
+    def requeue_dead(self, ttl=NODE_TTL, max_attempts=3):
+        failed = []
+        now = time.time()
+        for node_id, info in self.nodes().items():
+            if now - info['ts'] <= ttl:
+                continue
+            inflight = self._path('processing', node_id)
+            for name in self._listdir('processing', node_id) if os.path.isdir(inflight) else []:
+                # Renaming first makes the requeue safe when two reapers run at once
+                reaping = os.path.join(inflight, f"{name}.reaping-{os.getpid()}")
+                try:
+                    os.rename(os.path.join(inflight, name), reaping)
+                except FileNotFoundError:
+                    continue
+                message = self._read(reaping)
+                requeued = _requeued(message, max_attempts)
+                if requeued:
+                    # Same name as before, so the job keeps its place at the front of the queue
+                    self._write(self._path('queue', name), requeued)
+                    print(f"[DEBUG] Requeued job {message['job_id']} from dead node {node_id}")
+                else:
+                    failed.append(message['job_id'])
+                os.remove(reaping)
+            try:
+                os.remove(self._path('nodes', f"{node_id}.json"))
+            except FileNotFoundError:
+                pass
+        return failed
+
+    @contextmanager
+    def _job_lock(self, job_id):
+        import fcntl
+        with open(self._path('jobs', f"{job_id}.lock"), 'w') as lock:
+            fcntl.flock(lock, fcntl.LOCK_EX)
+            yield
+
+    def push_update(self, job_id, fields):
+        path = self._path('jobs', f"{job_id}.json")
+        with self._job_lock(job_id):
+            record = self._read(path) if os.path.exists(path) else {}
+            record.update(fields)
+            self._write(path, record)
+        self._write(self._path('updates', f"{time.time_ns()}-{os.getpid()}-{job_id}.json"), [job_id, fields])
+
+    def pop_updates(self, timeout=1.0):
+        deadline = time.time() + timeout
+        while True:
+            names = self._listdir('updates')[:500]
+            if names or time.time() >= deadline:
+                break
+            time.sleep(0.1)
+        updates = []
+        for name in names:
+            path = self._path('updates', name)
+            try:
+                updates.append(tuple(self._read(path)))
+                os.remove(path)
+            except (OSError, ValueError) as e:
+                print(f"[ERROR] Could not read update {name}: {e}")
+        return updates
+
+    def get_job(self, job_id):
+        path = self._path('jobs', f"{job_id}.json")
+        return self._read(path) if os.path.exists(path) else {}
+
+    def cancel(self, job_id):
+        open(self._path('cancelled', job_id), 'w').close()
+
+    def is_cancelled(self, job_id):
+        return os.path.exists(self._path('cancelled', job_id))
+
+
+def get_broker(url):
+    """redis://host:port/db for Redis, file:///path (or a plain path) for the directory broker"""
+    if url.startswith(('redis://', 'rediss://', 'unix://')):
+        return RedisBroker(url)
+    if url.startswith('file://'):
+        url = url[len('file://'):]
+    return FileBroker(url)
@@ -1,21 +1,500 @@
 
 # threading-based background transcription worker
 import threading
+import queue
 import os
+import sys
 import subprocess
 import time
 import uuid
+import datetime
+from contextlib import contextmanager, nullcontext
+from concurrent.futures.process import BrokenProcessPool
 from pydub import AudioSegment, silence
 
+# Project root holds the modules shared with transcribe.py
+sys.path.append(os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+from whisper_stream import iter_transcribe_windows, probe_duration
+from cost_model import RTFStats
+from scheduler import JobScheduler
+from translation import MarianTranslator, split_sentences, ends_sentence
+from decoding_presets import get_decode_options, DEFAULT_PRESET
+from checkpoint import save_checkpoint, load_checkpoint, delete_checkpoint, list_checkpoints
+from resources import ResourceMonitor, release_memory, rss_bytes, server_memory_bytes, MB
+from whisper_backends import load_model, DEFAULT_ENGINE
+from model_router import route_model, AUTO_MODEL
+from search_index import index_job
+from whisper_batched import BatchedModel, DEFAULT_BATCH_SIZE
+from profiling import Profiler, stage, bind, current as current_profiler
+from rendering import load_dictionary, compile_dictionary, render, raw_record, save_raw, rerender, KEEP_RAW
+
 # Global dictionary to track job progress and results
 transcription_jobs = {}
 
-def transcribe_task(job_id, file_path, output_dir, model, fmt, cpu, translate_zh):
+# Execution backend: 'thread' runs jobs in threads of the Flask process,
+# 'process' runs them in a pool of CPU worker processes (see process_pool.py),
+# 'broker' publishes them to a broker consumed by worker nodes (see node_worker.py)
+EXECUTOR = os.environ.get('WHISPER_EXECUTOR', 'thread')
+# redis://host:6379/0, or a directory (file:///path) to run nodes on one machine without Redis
+BROKER_URL = os.environ.get('WHISPER_BROKER_URL', 'file://' + os.path.join(os.path.dirname(os.path.abspath(__file__)), 'broker_data'))
+POOL_WORKERS = int(os.environ.get('WHISPER_POOL_WORKERS', '0')) or max(1, (os.cpu_count() or 1) // 4)
+# Models loaded before the pool forks, so every worker process shares their weights
+POOL_PRELOAD_MODELS = [m for m in os.environ.get('WHISPER_POOL_PRELOAD', 'base').split(',') if m]
+# Decoded windows that may wait for translation before the decoder blocks
+PIPELINE_QUEUE_WINDOWS = 4
+# Jobs running at once; the rest wait in the scheduler queue.
+# In broker mode this caps the jobs handed to the broker; each node limits its own concurrency.
+MAX_CONCURRENT_JOBS = int(os.environ.get('WHISPER_MAX_CONCURRENT_JOBS', '0')) or \
+    {'process': POOL_WORKERS, 'broker': 64}.get(EXECUTOR, 2)
+# 'fifo' or 'sjf' (shortest expected job first)
+SCHEDULER_POLICY = os.environ.get('WHISPER_SCHEDULER', 'fifo')
+# Checkpoint single-file jobs to whisper_web/checkpoints/ so they resume after a crash or restart
+CHECKPOINTS_ENABLED = os.environ.get('WHISPER_CHECKPOINTS', '1') != '0'
+# Files longer than this (seconds) are decoded window by window even without streaming, so
+# there is a checkpoint after every window instead of only at the end. Windowed decoding can
+# change the transcript, so this is opt-in (0 = only jobs submitted with streaming are windowed)
+CHECKPOINT_MIN_DURATION = float(os.environ.get('WHISPER_CHECKPOINT_MIN_DURATION', '0'))
+# Times a job is restarted from its checkpoint after its worker process died
+CHECKPOINT_MAX_ATTEMPTS = 3
+# New jobs wait in the queue while this process plus its pool workers use more than this (MB, 0 = no limit)
+MEMORY_HIGH_WATER_MB = int(os.environ.get('WHISPER_MEMORY_HIGH_WATER_MB', '0'))
+# Recycle after this many jobs per worker, or once a worker's RSS after a job is above this (MB); 0 = never.
+# Process mode replaces the whole pool; thread mode drops the cached models and translator instead.
+RECYCLE_AFTER_JOBS = int(os.environ.get('WHISPER_RECYCLE_AFTER_JOBS', '0'))
+RECYCLE_RSS_MB = int(os.environ.get('WHISPER_RECYCLE_RSS_MB', '0'))
+# Finished jobs are dropped from memory after this many hours (their output files are kept)
+JOB_RETENTION_HOURS = float(os.environ.get('WHISPER_JOB_RETENTION_HOURS', '24'))
+# Inference engine for jobs: 'openai' (openai-whisper) or 'ctranslate2' (int8 faster-whisper, see whisper_backends.py)
+ENGINE = DEFAULT_ENGINE
+# Scheduler estimate for a re-render job (seconds); it only re-renders text, so it is short
+RERENDER_EXPECTED_RUNTIME = 30.0
+# Add finished transcripts to the full-text search index (see search_index.py)
+SEARCH_INDEX_ENABLED = os.environ.get('WHISPER_SEARCH_INDEX_ENABLED', '1') != '0'
+# Models loaded at startup and run once on a second of silence, before /readyz reports ready
+PREWARM_MODELS = [m for m in os.environ.get('WHISPER_PREWARM_MODELS', '').split(',') if m]
+# Also load the translator at startup
+PREWARM_TRANSLATOR = os.environ.get('WHISPER_PREWARM_TRANSLATOR', '0') == '1'
+# /readyz reports not ready while more than this many jobs wait in the queue (0 = no limit)
+READY_MAX_QUEUE = int(os.environ.get('WHISPER_READY_MAX_QUEUE', '0'))
+# Chunks per forward pass for jobs submitted with batched decoding (see whisper_batched.py)
+BATCH_SIZE = int(os.environ.get('WHISPER_BATCH_SIZE', str(DEFAULT_BATCH_SIZE)))
+# Replace Whisper and the translator with the deterministic fakes in fake_model.py, so the
+# service can be load tested (see loadtest.py) without spending model time
+FAKE_MODEL = os.environ.get('WHISPER_FAKE_MODEL', '0') == '1'
+
+rtf_stats = RTFStats()
+
+# Loaded Whisper models keyed by (model_name, device)
+_model_cache = {}
+_model_lock = threading.Lock()
+# Whisper installs kv-cache hooks on the model for each decode, so one model object
+# must not run two transcriptions at once; jobs on the same model take turns
+_inference_locks = {}
+_translator = None
+_translator_lock = threading.Lock()
+_pool = None
+_pool_lock = threading.Lock()
+# Pools replaced by recycling whose last jobs are still running
+_retiring_pools = []
+# Jobs finished since the cached models were last dropped (thread mode)
+_jobs_since_recycle = 0
+_broker = None
+_broker_lock = threading.Lock()
+# Startup warm-up: state is 'pending', 'warming', 'ready' or 'failed'; models maps name -> seconds taken
+_warmup = {'state': 'pending', 'models': {}, 'translator': None, 'error': None}
+_warmup_lock = threading.Lock()
+# Inside a pool worker process, job updates go through this queue to the parent
+_progress_queue = None
+# Job ids whose cancellation was requested (a manager dict shared with the pool workers in process mode)
+_cancelled = set()
+_shared_cancelled = None
+
+
+class JobCancelled(Exception):
+    pass
+
+
+def update_job(job_id, fields):
+    """Apply a partial update to a job record (forwarded to the parent when running in a pool worker)"""
+    if _progress_queue is not None:
+        _progress_queue.put((job_id, fields))
+        return
+    job = transcription_jobs.setdefault(job_id, {})
+    job.update(fields)
+    # Bumped on every change so /task_status can answer unchanged polls with 304
+    job['version'] = job.get('version', 0) + 1
+    if job.get('batch_id') in transcription_jobs:
+        batch = transcription_jobs[job['batch_id']]
+        batch['version'] = batch.get('version', 0) + 1
+
+
+def _attach_progress_queue(progress_queue, cancelled):
+    global _progress_queue, _shared_cancelled
+    _progress_queue = progress_queue
+    _shared_cancelled = cancelled
+
+
+def check_cancelled(job_id):
+    """Raise JobCancelled if the job was cancelled; called between decode windows and translation batches"""
+    if job_id in _cancelled or (_shared_cancelled is not None and job_id in _shared_cancelled):
+        raise JobCancelled(job_id)
+
+
+@contextmanager
+def cancellable_decode(model_obj, job_id):
+    """
+    Check for cancellation before every 30-second window whisper decodes.
+    model.transcribe calls model.decode once per window (and per temperature retry),
+    so shadowing it on the instance gives a check point even in whole-file mode.
+    Safe because the inference lock gives the job exclusive use of the model.
+    """
+    original = model_obj.decode
+    def decode(*args, **kwargs):
+        check_cancelled(job_id)
+        return original(*args, **kwargs)
+    model_obj.decode = decode
+    try:
+        yield
+    finally:
+        del model_obj.decode
+
+
+def get_model(model_name, device):
+    """Load a Whisper model once per process and reuse it across jobs"""
+    key = (model_name, device)
+    with _model_lock:
+        if key not in _model_cache and FAKE_MODEL:
+            from fake_model import FakeWhisperModel
+            print(f"[DEBUG] Loading fake Whisper model: {model_name} on device: {device}")
+            _model_cache[key] = FakeWhisperModel(model_name, device)
+            _inference_locks[key] = threading.Lock()
+        if key not in _model_cache:
+            print(f"[DEBUG] Loading Whisper model: {model_name} on device: {device} (engine: {ENGINE})")
+            _model_cache[key] = load_model(model_name, device=device, engine=ENGINE)
+            _inference_locks[key] = threading.Lock()
+            print(f"[DEBUG] Model loaded successfully.")
+        return _model_cache[key]
+
+
+def get_translator():
+    """Load the MarianMT translator once per process and reuse it across jobs"""
+    global _translator
+    with _translator_lock:
+        if _translator is None and FAKE_MODEL:
+            from fake_model import FakeTranslator
+            _translator = FakeTranslator()
+        if _translator is None:
+            print(f"[DEBUG] Loading MarianMT + OpenCC translator...")
+            _translator = MarianTranslator()
+        return _translator
+
+
+def inference_lock(model_name, device):
+    get_model(model_name, device)
+    return _inference_locks[(model_name, device)]
+
+
+def _get_pool():
+    global _pool
+    with _pool_lock:
+        if _pool is None:
+            from process_pool import InferencePool
+            # CTranslate2 starts its own threads, which do not survive a fork; its workers load their own copy
+            for name in (POOL_PRELOAD_MODELS if ENGINE == 'openai' else []):
+                model_obj = get_model(name, 'cpu')
+                # Keep parameters in shared memory so workers never copy them
+                model_obj.share_memory()
+            _pool = InferencePool(POOL_WORKERS, update_job, worker_init=_attach_progress_queue)
+        return _pool
+
+
+def _get_broker():
+    """Connect to the broker once and start the thread that applies updates from the nodes"""
+    global _broker
+    with _broker_lock:
+        if _broker is None:
+            from broker import get_broker
+            _broker = get_broker(BROKER_URL)
+            threading.Thread(target=_broker_listen, args=(_broker,), daemon=True).start()
+            print(f"[DEBUG] Publishing jobs to broker {BROKER_URL}")
+        return _broker
+
+
+def _broker_listen(broker):
+    """Apply job updates pushed by the nodes and requeue the jobs of nodes that died"""
+    from broker import HEARTBEAT_INTERVAL, NODE_TTL
+    last_reap = 0.0
+    while True:
+        try:
+            for job_id, fields in broker.pop_updates(timeout=1.0):
+                # Sent by the node once the task returned, in place of the executor's future
+                summary = fields.pop('run_summary', None)
+                if fields:
+                    update_job(job_id, fields)
+                if summary is not None:
+                    _on_job_done(job_id, summary)
+            if time.time() - last_reap >= HEARTBEAT_INTERVAL:
+                last_reap = time.time()
+                for job_id in broker.requeue_dead(NODE_TTL, CHECKPOINT_MAX_ATTEMPTS):
+                    update_job(job_id, {'state': 'FAILURE', 'progress': 100,
+                                        'error': f'Worker nodes died {CHECKPOINT_MAX_ATTEMPTS} times while running this job'})
+                    _on_job_done(job_id, None)
+        except Exception as e:
+            print(f"[ERROR] Broker listener: {e}")
+            time.sleep(HEARTBEAT_INTERVAL)
+
+
+def get_nodes():
+    """Worker nodes with their last heartbeat (broker mode only)"""
+    if EXECUTOR != 'broker':
+        return {}
+    return _get_broker().nodes()
+
+
+def _live_pools():
+    """The current pool plus retired pools that still have jobs running"""
+    with _pool_lock:
+        _retiring_pools[:] = [p for p in _retiring_pools if not p.closed]
+        return [p for p in [_pool] + _retiring_pools if p is not None]
+
+
+def _recycle_pool(pool, reason):
+    """Replace the pool with a fresh one for the next job; jobs still on the old pool finish there"""
+    global _pool
+    with _pool_lock:
+        if _pool is not pool:
+            return
+        _pool = None
+        _retiring_pools.append(pool)
+    print(f"[DEBUG] Recycling inference pool ({reason})")
+    pool.retire()
+
+
+def _drop_cached_models(reason):
+    """Thread-mode recycling: forget loaded models and the translator so their memory can be freed"""
+    global _translator
+    with _model_lock:
+        _model_cache.clear()
+        _inference_locks.clear()
+    with _translator_lock:
+        _translator = None
+    release_memory()
+    print(f"[DEBUG] Dropped cached models ({reason}), RSS now {rss_bytes() / MB:.0f} MB")
+
+
+def _discard_pool(pool):
+    """Drop a broken pool (a worker process died); the next job starts a fresh one"""
+    global _pool
+    with _pool_lock:
+        if _pool is not pool:
+            return
+        _pool = None
+    try:
+        pool.shutdown(wait=False)
+    except Exception as e:
+        print(f"[ERROR] Could not shut down broken pool: {e}")
+
+def _merge_translate_stats(parts):
+    """Combine the per-window stats of MarianTranslator.translate into job-level throughput"""
+    sentences = sum(p['sentences'] for p in parts)
+    tokens = sum(p['input_tokens'] for p in parts)
+    seconds = sum(p['seconds'] for p in parts)
+    return {
+        'sentences': sentences,
+        'batches': sum(p['batches'] for p in parts),
+        'input_tokens': tokens,
+        'seconds': round(seconds, 2),
+        'sentences_per_sec': round(sentences / seconds, 2) if seconds > 0 else None,
+        'tokens_per_sec': round(tokens / seconds, 1) if seconds > 0 else None,
+    }
+
+
+def _iter_windows(model_obj, file_path, checkpoint, decode_options):
+    """iter_transcribe_windows continuing from the checkpoint's offset and decoder state, if any"""
+    checkpoint = checkpoint or {}
+    options = dict(decode_options)
+    if checkpoint.get('language'):
+        options['language'] = checkpoint['language']
+    if checkpoint.get('prompt'):
+        options['initial_prompt'] = checkpoint['prompt']
+    if checkpoint.get('offset'):
+        print(f"[DEBUG] Resuming from checkpoint at {checkpoint['offset']:.1f}s ({len(checkpoint.get('segments', []))} segments done)")
+    return iter_transcribe_windows(model_obj, file_path, start=checkpoint.get('offset', 0.0),
+                                   first_id=len(checkpoint.get('segments', [])), **options)
+
+
+def transcribe_windows(job_id, model_obj, file_path, on_window, checkpoint=None, **decode_options):
+    """
+    Decode window by window with bounded memory, like transcribe_streaming, saving the
+    checkpoint (if the job has one) after every window.
+    """
+    all_segments = list((checkpoint or {}).get('segments', []))
+    language = None
+    for window_end, segments, language, prompt in _iter_windows(model_obj, file_path, checkpoint, decode_options):
+        all_segments.extend(segments)
+        if checkpoint is not None:
+            checkpoint.update(offset=window_end, prompt=prompt, language=language, segments=all_segments)
+            save_checkpoint(job_id, checkpoint)
+        on_window(window_end)
+    return {"text": "".join(seg["text"] for seg in all_segments), "segments": all_segments, "language": language}
+
+
+def transcribe_and_translate(job_id, model_obj, file_path, duration, on_window, checkpoint=None, windowed=True,
+                             **decode_options):
+    """
+    Two-stage pipeline: the calling thread decodes the file and pushes finished segments into a
+    bounded queue; a translation thread consumes them. With windowed=True the file is decoded
+    window by window (see whisper_stream.py), so translation ends shortly after the last window
+    is decoded instead of starting only then. Otherwise the whole file is decoded as in any other
+    job and translated afterwards, so the transcript does not depend on the translation.
+    The main text is translated sentence by sentence; a sentence still open at the end of a
+    window is held back and translated together with the next window.
+    The checkpoint is saved by the translation thread, so it only ever covers windows that are
+    both decoded and translated.
+    Returns a result dict like model.transcribe, with text and segments already translated.
+    If the translator cannot be loaded or a window fails to translate, the job still finishes:
+    the windows from then on keep their untranslated text and the error is stored on the job
+    as translate_error.
+    """
+    if not windowed:
+        # Only windowed runs can be resumed mid-file, so there is nothing to save per window
+        checkpoint = None
+    windows = queue.Queue(maxsize=PIPELINE_QUEUE_WINDOWS)
+    checkpoint_segments = list((checkpoint or {}).get('segments', []))
+    main_text_parts = list((checkpoint or {}).get('main_text', []))
+    stats_parts = list((checkpoint or {}).get('translate_stats', []))
+    # Start of a sentence that the previous window ended in the middle of
+    open_sentence = [(checkpoint or {}).get('open_sentence', '')]
+    errors = []
+
+    def translate_stage():
+        translator = None
+        while True:
+            item = windows.get()
+            last = item is None
+            window_end, segments, language, prompt = item or (None, [], None, None)
+            seg_texts = [seg["text"] for seg in segments]
+            text = open_sentence[0] + "".join(seg_texts)
+            if errors:
+                # Keep draining so the decoder is never blocked on a full queue
+                if text.strip():
+                    main_text_parts.append(text.strip())
+                open_sentence[0] = ''
+                if last:
+                    break
+                continue
+            sentences = split_sentences(text)
+            open_sentence[0] = ''
+            if not last and sentences and not ends_sentence(sentences[-1]):
+                open_sentence[0] = sentences.pop()
+            try:
+                if translator is None and (sentences or seg_texts):
+                    # Loaded here so a MarianMT/OpenCC failure costs the translation, not the transcript
+                    translator = get_translator()
+                window_stats = {}
+                if sentences or seg_texts:
+                    with stage('translate'):
+                        translated = translator.translate(sentences + seg_texts, progress_callback=lambda done, total: check_cancelled(job_id),
+                                                          stats=window_stats)
+                else:
+                    translated = []
+            except Exception as e:
+                print(f"[ERROR] Translation error: {e}")
+                errors.append(e)
+                untranslated = ' '.join(sentences + [open_sentence[0]]).strip()
+                if untranslated:
+                    main_text_parts.append(untranslated)
+                open_sentence[0] = ''
+                if last:
+                    break
+                continue
+            main_text_parts.extend(translated[:len(sentences)])
+            for seg, zh in zip(segments, translated[len(sentences):]):
+                seg["text"] = zh
+            if window_stats:
+                stats_parts.append(window_stats)
+            if last:
+                break
+            if checkpoint is not None:
+                checkpoint_segments.extend(segments)
+                checkpoint.update(offset=window_end, prompt=prompt, language=language, segments=checkpoint_segments,
+                                  main_text=main_text_parts, open_sentence=open_sentence[0], translate_stats=stats_parts)
+                save_checkpoint(job_id, checkpoint)
+            if duration:
+                update_job(job_id, {'translate_progress': min(int(100 * window_end / duration), 99)})
+
+    consumer = threading.Thread(target=bind(translate_stage), daemon=True)
+    consumer.start()
+    # Segments restored from the checkpoint are already translated
+    all_segments = list(checkpoint_segments)
+    language = None
+    try:
+        if windowed:
+            for window_end, segments, language, prompt in _iter_windows(model_obj, file_path, checkpoint, decode_options):
+                all_segments.extend(segments)
+                windows.put((window_end, segments, language, prompt))
+                on_window(window_end)
+        else:
+            result = model_obj.transcribe(file_path, **decode_options)
+            language = result.get("language")
+            all_segments.extend(result.get("segments", []))
+            windows.put((duration, result.get("segments", []), language, None))
+        # Decoding is done; what is left is the translation of the last windows
+        update_job(job_id, {'stage': 'translating'})
+    finally:
+        windows.put(None)
+        consumer.join()
+    for e in errors:
+        if isinstance(e, JobCancelled):
+            raise e
+
+    if errors:
+        update_job(job_id, {'translate_error': str(errors[0])})
+    if stats_parts:
+        stats = _merge_translate_stats(stats_parts)
+        print(f"[DEBUG] Translation finished (MarianMT+OpenCC): {stats}")
+        update_job(job_id, {'translate_stats': stats})
+    return {"text": ' '.join(main_text_parts), "segments": all_segments, "language": language}
+
+
+def transcribe_task(job_id, file_path, output_dir, model, fmt, cpu, translate_zh, options=None):
+    """
+    Run one job; returns a small summary ({'state', 'device', 'run_seconds', 'output_file'}) for the scheduler.
+    options holds the optional per-job settings: stream, batched, profile, batch_id, preset, language.
+    If the job has a checkpoint (see start_transcription), decoding continues from it.
+    With options['profile'] the job runs under profiling.Profiler and its artifacts are written
+    to <output name>.profile/ next to the transcript.
+    """
+    if not (options or {}).get('profile'):
+        return _run_transcribe_task(job_id, file_path, output_dir, model, fmt, cpu, translate_zh, options)
+    profiler = Profiler()
+    with profiler:
+        summary = _run_transcribe_task(job_id, file_path, output_dir, model, fmt, cpu, translate_zh, options)
+    # From the summary: in process-pool and broker mode transcription_jobs here never sees the job's updates
+    output_file = summary.get('output_file')
+    if output_file:
+        profile_dir = os.path.splitext(output_file)[0] + '.profile'
+    else:
+        profile_dir = os.path.join(os.path.dirname(__file__), 'outputs', f"{job_id}.profile")
+    try:
+        profiler.write(profile_dir)
+        print(f"[DEBUG] Profile of job {job_id} written to {profile_dir}:\n{profiler.format_table()}")
+        update_job(job_id, {'profile': dict(profiler.stage_summary(), dir=profile_dir)})
+    except Exception as e:
+        print(f"[ERROR] Could not write the profile of job {job_id}: {e}")
+    return summary
+
+
+def _run_transcribe_task(job_id, file_path, output_dir, model, fmt, cpu, translate_zh, options=None):
+    options = options or {}
+    stream = options.get('stream', False)
+    decode_options = get_decode_options(options.get('preset') or DEFAULT_PRESET, options.get('language'))
     print(f"[DEBUG] Thread started for job_id={job_id}")
-    print(f"[DEBUG] file_path={file_path}, output_dir={output_dir}, model={model}, fmt={fmt}, cpu={cpu}, translate_zh={translate_zh}")
+    run_start = time.time()
+    print(f"[DEBUG] file_path={file_path}, output_dir={output_dir}, model={model}, fmt={fmt}, cpu={cpu}, translate_zh={translate_zh}, options={options}")
     import datetime
     start_time = datetime.datetime.now().isoformat()
-    transcription_jobs[job_id] = {
+    update_job(job_id, {
         'state': 'STARTED',
         'progress': 0,
         'stage': 'transcribing',
@@ -23,198 +502,697 @@ def transcribe_task(job_id, file_path, output_dir, model, fmt, cpu, translate_zh
         'translate_progress': 0,
         'post_progress': 0,
         'start_time': start_time
-    }
+    })
     import traceback
     try:
-        import whisper
         import torch
         print("[CUDA] celery_worker.py: CUDA available:", torch.cuda.is_available())
         import warnings
-        import re
-        device = 'cuda' if torch.cuda.is_available() else 'cpu'  # Use GPU if available
-        transcription_jobs[job_id].update({'state': 'PROGRESS', 'progress': 5})
+        device = 'cuda' if not cpu and torch.cuda.is_available() else 'cpu'  # Use GPU if available
+        update_job(job_id, {'state': 'PROGRESS', 'progress': 5})
         model_name = model or 'base'
-        print(f"[DEBUG] Loading Whisper model: {model_name} on device: {device}")
-        model_obj = whisper.load_model(model_name, device=device)
-        print(f"[DEBUG] Model loaded successfully.")
-
-        # --- No chunking: transcribe the whole audio file at once ---
-        print(f"[DEBUG] No chunking, transcribing the whole audio file...")
-        transcription_jobs[job_id].update({'stage': 'transcribing', 'transcribe_progress': 0})
-        with warnings.catch_warnings():
+        model_obj = get_model(model_name, device)
+
+        checkpoint = load_checkpoint(job_id) if CHECKPOINTS_ENABLED and not options.get('batch_id') else None
+        update_job(job_id, {'stage': 'transcribing', 'transcribe_progress': 0})
+        check_cancelled(job_id)
+        instrumented = current_profiler().instrument(model_obj) if current_profiler() else nullcontext()
+        with inference_lock(model_name, device), cancellable_decode(model_obj, job_id), instrumented, \
+                stage('transcribe'), warnings.catch_warnings():
             warnings.simplefilter("ignore")
             fp16 = device in ["mps", "cuda"]
-            result = model_obj.transcribe(file_path, verbose=False, fp16=fp16)
-        transcription_jobs[job_id].update({'transcribe_progress': 100, 'progress': 50})
+            if options.get('batched'):
+                # Wrapped after cancellable_decode, so the batched decoder still goes through the cancellation hook
+                model_obj = BatchedModel(model_obj, BATCH_SIZE)
+            duration = probe_duration(file_path) if (stream or translate_zh or checkpoint is not None) else None
+            # A job resumed mid-file continues window by window; other jobs are only windowed when
+            # streaming was asked for, or when per-window checkpoints of long files are turned on
+            resuming = bool((checkpoint or {}).get('offset'))
+            windowed = stream or resuming or (checkpoint is not None and CHECKPOINT_MIN_DURATION > 0
+                                              and (duration or 0) > CHECKPOINT_MIN_DURATION)
+            def on_window(window_end):
+                if duration:
+                    percent = int(100 * window_end / duration)
+                    update_job(job_id, {'transcribe_progress': min(percent, 99)})
+            if translate_zh:
+                # --- Translation: windowed runs translate each window while the next one is decoded ---
+                print(f"[DEBUG] Transcription + MarianMT/OpenCC translation, windowed={windowed}, duration={duration}")
+                result = transcribe_and_translate(job_id, model_obj, file_path, duration, on_window, checkpoint=checkpoint,
+                                                  windowed=windowed, verbose=False, fp16=fp16, **decode_options)
+            elif windowed:
+                # --- Streaming: decode window by window with bounded memory, checkpointing each window ---
+                print(f"[DEBUG] Windowed decode, duration={duration}")
+                result = transcribe_windows(job_id, model_obj, file_path, on_window, checkpoint=checkpoint,
+                                            verbose=False, fp16=fp16, **decode_options)
+            else:
+                # --- No chunking: transcribe the whole audio file at once ---
+                print(f"[DEBUG] No chunking, transcribing the whole audio file...")
+                result = model_obj.transcribe(file_path, verbose=False, fp16=fp16, **decode_options)
+        check_cancelled(job_id)
+        update_job(job_id, {'transcribe_progress': 100, 'progress': 50})
         if translate_zh:
-            transcription_jobs[job_id].update({'stage': 'translating', 'translate_progress': 0})
-            print(f"[DEBUG] Starting local MarianMT + OpenCC translation to Traditional Chinese...")
-            try:
-                from transformers import MarianMTModel, MarianTokenizer
-                from opencc import OpenCC
-                cc = OpenCC('s2t')  # 簡體轉繁體
-                model_dir = os.path.join(os.path.dirname(__file__), '../translation_model')
-                os.makedirs(model_dir, exist_ok=True)
-                model_name = "Helsinki-NLP/opus-mt-en-zh"
-                tokenizer = MarianTokenizer.from_pretrained(model_name, cache_dir=model_dir)
-                model = MarianMTModel.from_pretrained(model_name, cache_dir=model_dir)
-                # 分批翻譯主文本
-                sentences = [s.strip() for s in re.split(r'(?<=[.!?。！？])\s+', result["text"]) if s.strip()]
-                batch_size = 8
-                zh_sents_trad = []
-                for i in range(0, len(sentences), batch_size):
-                    batch_sents = sentences[i:i+batch_size]
-                    batch = tokenizer(batch_sents, return_tensors="pt", padding=True, truncation=True)
-                    translated = model.generate(**batch)
-                    zh_sents = [tokenizer.decode(t, skip_special_tokens=True) for t in translated]
-                    zh_sents_trad.extend([cc.convert(s) for s in zh_sents])
-                    # 進度回報
-                    percent = int(100 * (i + batch_size) / max(len(sentences), 1))
-                    transcription_jobs[job_id].update({'translate_progress': min(percent, 99)})
-                zh_text = ' '.join(zh_sents_trad)
-                result["text"] = zh_text
-                print(f"[DEBUG] Main text batch translated (MarianMT+OpenCC)。")
-                # 分批翻譯 segments
-                segments = result.get("segments", [])
-                seg_texts = [seg["text"] for seg in segments]
-                zh_seg_sents_trad = []
-                if seg_texts:
-                    for i in range(0, len(seg_texts), batch_size):
-                        batch_sents = seg_texts[i:i+batch_size]
-                        seg_batch = tokenizer(batch_sents, return_tensors="pt", padding=True, truncation=True)
-                        seg_translated = model.generate(**seg_batch)
-                        zh_seg_sents = [tokenizer.decode(t, skip_special_tokens=True) for t in seg_translated]
-                        zh_seg_sents_trad.extend([cc.convert(s) for s in zh_seg_sents])
-                        # 進度回報
-                        percent = int(100 * (i + batch_size) / max(len(seg_texts), 1))
-                        transcription_jobs[job_id].update({'translate_progress': min(percent, 99)})
-                    # 對齊 segment 數量
-                    for i, seg in enumerate(segments):
-                        if i < len(zh_seg_sents_trad):
-                            seg["text"] = zh_seg_sents_trad[i]
-                        else:
-                            seg["text"] = ""
-                print(f"[DEBUG] Segments batch translated (MarianMT+OpenCC)。")
-                # Debug: 印出每個 segment 翻譯前後內容
-                for i, seg in enumerate(segments):
-                    orig = seg_texts[i] if i < len(seg_texts) else ""
-                    print(f"[DEBUG] seg[{i}] before translation: {orig}")
-                    print(f"[DEBUG] seg[{i}] after translation:  {seg['text']}")
-            except Exception as e:
-                print(f"[ERROR] Translation error: {e}")
-                result["text"] += f"\n[Translation Error: {e}]"
-            transcription_jobs[job_id].update({'translate_progress': 100, 'progress': 75})
-        transcription_jobs[job_id].update({'stage': 'postprocessing', 'post_progress': 50})
+            update_job(job_id, {'translate_progress': 100, 'progress': 75})
+        update_job(job_id, {'stage': 'postprocessing', 'post_progress': 50})
         time.sleep(0.5)
-        transcription_jobs[job_id].update({'post_progress': 100, 'progress': 100})
+        update_job(job_id, {'post_progress': 100, 'progress': 100})
         time.sleep(0.5)
-        output_text = result["text"].strip()
-        output_file_path = None
-        print(f"[DEBUG] Transcription output prepared.")
-        custom_dict_path = os.path.join(os.path.dirname(__file__), 'custom_dict.txt')
-        replacements = []
-        if os.path.exists(custom_dict_path):
-            print(f"[DEBUG] Applying custom dictionary replacements from {custom_dict_path}")
-            try:
-                with open(custom_dict_path, 'r', encoding='utf-8') as f:
-                    for line in f:
-                        line = line.strip()
-                        if '=' in line and not line.startswith('#'):
-                            src, tgt = line.split('=', 1)
-                            src = src.strip()
-                            tgt = tgt.strip()
-                            replacements.append((src, tgt))
-                print(f"[DEBUG] Custom dictionary loaded: {replacements}")
-            except Exception as e:
-                print(f"[ERROR] Custom Dictionary Error: {e}")
-        # Apply replacements to output_text，忽略所有空白（半形、全形）
-        def make_space_insensitive_pattern(src):
-            # 將 src 轉為 pattern，忽略所有空白（半形、全形）
-            import re
-            chars = [c for c in src if not c.isspace()]
-            # [\s\u3000]* 代表可有可無的半形或全形空白
-            return r''.join([re.escape(c) + r'[\s\u3000]*' for c in chars])
-
-        for src, tgt in replacements:
-            pattern = make_space_insensitive_pattern(src)
-            output_text = re.sub(pattern, tgt, output_text, flags=re.IGNORECASE)
-
-        # Save output to file using input file's base name
-        # 在輸出前，自動合併所有中文之間多餘的空白
-        import re as _re
-        def merge_chinese_spaces(text):
-            # 合併所有「中文+空白+中文」為「中文中文」
-            return _re.sub(r'([\u4e00-\u9fff])\s+([\u4e00-\u9fff])', r'\1\2', text)
-
-        input_base = os.path.splitext(os.path.basename(file_path))[0]
-        outputs_dir = os.path.join(os.path.dirname(__file__), 'outputs')
-        os.makedirs(outputs_dir, exist_ok=True)
-        if fmt == 'srt':
-            srt_filename = f"{input_base}.srt"
-            srt_path = os.path.join(outputs_dir, srt_filename)
-            # Generate SRT from segments and apply replacements
-            def format_timestamp(seconds):
-                ms = int((seconds - int(seconds)) * 1000)
-                h = int(seconds // 3600)
-                m = int((seconds % 3600) // 60)
-                s = int(seconds % 60)
-                return f"{h:02}:{m:02}:{s:02},{ms:03}"
-            # 先依 start 時間排序，避免 SRT 時間錯亂
-            segments = sorted(result.get("segments", []), key=lambda seg: seg["start"])
-            srt_lines = []
-            import unicodedata
-            def normalize_text(text):
-                # 移除所有空白、全形空白，並轉半形
-                text = ''.join(text.split())
-                text = unicodedata.normalize('NFKC', text)
-                return text
-            for idx, seg in enumerate(segments, 1):
-                seg_text = seg["text"]
-                orig_text = seg_text
-                for src, tgt in replacements:
-                    pattern = make_space_insensitive_pattern(src)
-                    seg_text_new = re.sub(pattern, tgt, seg_text, flags=re.IGNORECASE)
-                    if seg_text_new != seg_text:
-                        seg_text = seg_text_new
-                # 合併中文間多餘空白
-                seg_text = merge_chinese_spaces(seg_text)
-                if orig_text != seg_text:
-                    print(f"[DEBUG] SRT seg[{idx}] before dict: {orig_text}")
-                    print(f"[DEBUG] SRT seg[{idx}] after dict:  {seg_text}")
-                srt_lines.append(str(idx))
-                srt_lines.append(f"{format_timestamp(seg['start'])} --> {format_timestamp(seg['end'])}")
-                srt_lines.append(seg_text)
-                srt_lines.append("")
-            srt_content = "\n".join(srt_lines)
-            with open(srt_path, "w", encoding="utf-8") as f:
-                f.write(srt_content)
-            output_text = srt_content
-            output_file_path = srt_path
-        else:
-            # Save TXT output for download
-            # 合併中文間多餘空白
-            output_text = merge_chinese_spaces(output_text)
-            txt_filename = f"{input_base}.txt"
-            txt_path = os.path.join(outputs_dir, txt_filename)
-            with open(txt_path, "w", encoding="utf-8") as f:
+        with stage('postprocess'):
+            print(f"[DEBUG] Transcription output prepared.")
+            rules = compile_dictionary(load_dictionary())
+            # Save output to file using input file's base name
+            input_base = os.path.splitext(os.path.basename(file_path))[0]
+            outputs_dir = os.path.join(os.path.dirname(__file__), 'outputs')
+            if options.get('batch_id'):
+                # Files of one batch are kept together so they can be zipped
+                outputs_dir = os.path.join(outputs_dir, options['batch_id'])
+            os.makedirs(outputs_dir, exist_ok=True)
+            output_file_path = os.path.join(outputs_dir, f"{input_base}.{'srt' if fmt == 'srt' else 'txt'}")
+            # The raw segments are kept so the output can be re-rendered when the dictionary changes
+            raw = raw_record(job_id, result, fmt, output_file_path)
+            # Dictionary, Chinese space merging and SRT/TXT formatting (rendering.py);
+            # transcript_segments are served page by page by /transcript
+            output_text, transcript_segments = render(raw, rules, verbose=True)
+        with stage('write'):
+            with open(output_file_path, "w", encoding="utf-8") as f:
                 f.write(output_text)
-            output_file_path = txt_path
+            if KEEP_RAW:
+                try:
+                    save_raw(raw)
+                except Exception as e:
+                    print(f"[ERROR] Could not save raw segments of job {job_id}: {e}")
 
         print(f"[DEBUG] Job {job_id} completed successfully.")
-        transcription_jobs[job_id].update({'state': 'SUCCESS', 'progress': 100, 'output': output_text, 'output_file': output_file_path})
+        update_job(job_id, {'state': 'SUCCESS', 'progress': 100, 'output': output_text, 'output_file': output_file_path,
+                            'segments': transcript_segments, 'segment_count': len(transcript_segments)})
+        delete_checkpoint(job_id)
+        return {'state': 'SUCCESS', 'device': device, 'run_seconds': time.time() - run_start,
+                'output_file': output_file_path}
+    except JobCancelled:
+        print(f"[DEBUG] Job {job_id} cancelled.")
+        update_job(job_id, {'state': 'CANCELLED', 'stage': 'cancelled'})
+        _cleanup_cancelled(job_id, file_path)
+        return {'state': 'CANCELLED'}
     except Exception as e:
         print(f"[ERROR] Exception in job {job_id}: {e}")
         import traceback
         error_msg = f"{str(e)}\n{traceback.format_exc()}"
-        transcription_jobs[job_id].update({'state': 'FAILURE', 'progress': 100, 'error': error_msg})
+        update_job(job_id, {'state': 'FAILURE', 'progress': 100, 'error': error_msg})
+        delete_checkpoint(job_id)
+        return {'state': 'FAILURE'}
+
+def _cleanup_cancelled(job_id, file_path):
+    """Remove the uploaded file and checkpoint of a cancelled job and release cached allocator memory"""
+    _cancelled.discard(job_id)
+    delete_checkpoint(job_id)
+    if _shared_cancelled is not None:
+        _shared_cancelled.pop(job_id, None)
+    try:
+        if file_path and os.path.exists(file_path):
+            os.remove(file_path)
+            print(f"[DEBUG] Removed upload of cancelled job {job_id}: {file_path}")
+    except OSError as e:
+        print(f"[ERROR] Could not remove {file_path}: {e}")
+    import gc
+    gc.collect()
+
+
+def cancel_job(job_id):
+    """
+    Request cancellation. A queued job is dropped immediately; a running job stops at its
+    next check point (the next decode window or translation batch) and frees its slot then.
+    Returns False if the job is unknown or already finished.
+    """
+    job = transcription_jobs.get(job_id)
+    if not job or job.get('state') in ('SUCCESS', 'FAILURE', 'CANCELLED'):
+        return False
+    # Cancelling a batch cancels every sub-job that has not finished
+    targets = [job_id] + [sub_id for sub_id in job.get('subjobs', [])
+                          if transcription_jobs.get(sub_id, {}).get('state') not in ('SUCCESS', 'FAILURE', 'CANCELLED')]
+    if scheduler.cancel(job_id):
+        for target in targets:
+            # Never started, so _on_job_done never stamps it; without finished_at it would never be pruned
+            update_job(target, {'state': 'CANCELLED', 'stage': 'cancelled', 'finished_at': time.time()})
+            _cleanup_cancelled(target, transcription_jobs.get(target, {}).get('file_path'))
+        return True
+    for target in targets:
+        _cancelled.add(target)
+        for pool in _live_pools():
+            pool.cancelled[target] = True
+        if EXECUTOR == 'broker':
+            _get_broker().cancel(target)
+    update_job(job_id, {'stage': 'cancelling'})
+    return True
+
+
+def _rtf_model(model):
+    """Model name under which RTFs are kept; other engines run the same model at a different speed"""
+    return model if ENGINE == 'openai' else f"{model}@{ENGINE}"
+
+
+def _predict_device(cpu):
+    if cpu or EXECUTOR == 'process':
+        return 'cpu'
+    try:
+        import torch
+        return 'cuda' if torch.cuda.is_available() else 'cpu'
+    except ImportError:
+        return 'cpu'
+
+
+def _dispatch_job(job_id, payload):
+    """Called by the scheduler when a slot frees up; payload is (task function, args)"""
+    task_fn, args = payload
+    if task_fn is rerender_task:
+        # Works on this server's outputs and raw segments, and starts its own process pool
+        threading.Thread(target=_run_in_thread, args=(job_id, task_fn, args)).start()
+    elif EXECUTOR == 'process':
+        pool = _get_pool()
+        future = pool.submit(run_job, task_fn, job_id, *args)
+        future.add_done_callback(lambda f: _on_pool_job_done(job_id, f, pool))
+    elif EXECUTOR == 'broker':
+        # Arguments are plain values, so the task is sent by name and run by whichever node claims it
+        _get_broker().publish({'job_id': job_id, 'task': task_fn.__name__, 'args': list(args), 'attempts': 0})
+    else:
+        thread = threading.Thread(target=_run_in_thread, args=(job_id, task_fn, args))
+        thread.start()
+
+
+def run_job(task_fn, job_id, *args):
+    """
+    Run a task under a ResourceMonitor, store its CPU time and memory use in the job record
+    as 'resources', and release freed memory afterwards.
+    """
+    with ResourceMonitor() as monitor:
+        summary = task_fn(job_id, *args)
+    resources = monitor.stats()
+    release_memory()
+    resources['rss_after_cleanup_mb'] = round(rss_bytes() / MB, 1)
+    print(f"[DEBUG] Job {job_id} resources: {resources}")
+    update_job(job_id, {'resources': resources})
+    return dict(summary or {}, resources=resources)
+
+
+def _run_in_thread(job_id, task_fn, args):
+    summary = None
+    try:
+        summary = run_job(task_fn, job_id, *args)
     except Exception as e:
-        transcription_jobs[job_id].update({'state': 'FAILURE', 'progress': 100, 'error': str(e)})
+        # The task records its own failures; this is the monitoring and cleanup around it
+        print(f"[ERROR] Job {job_id} thread failed: {e}")
+        if transcription_jobs.get(job_id, {}).get('state') not in ('SUCCESS', 'FAILURE', 'CANCELLED'):
+            update_job(job_id, {'state': 'FAILURE', 'progress': 100, 'error': str(e)})
+    finally:
+        _on_job_done(job_id, summary)
+
+
+def _on_pool_job_done(job_id, future, pool):
+    exc = future.exception()
+    if exc is not None:
+        print(f"[ERROR] Pool worker failed for job {job_id}: {exc}")
+        if isinstance(exc, BrokenProcessPool):
+            # A worker process was killed (e.g. out of memory); every job on the pool fails with it
+            _discard_pool(pool)
+            scheduler.release(job_id)
+            if resume_job(job_id):
+                return
+        delete_checkpoint(job_id)
+        update_job(job_id, {'state': 'FAILURE', 'progress': 100, 'error': f'Worker process failed: {exc}'})
+        _on_job_done(job_id, None)
+    else:
+        summary = future.result()
+        pool.jobs_done += 1
+        rss_mb = summary.get('resources', {}).get('rss_after_cleanup_mb', 0)
+        if RECYCLE_AFTER_JOBS and pool.jobs_done >= RECYCLE_AFTER_JOBS * pool.num_workers:
+            _recycle_pool(pool, f"{pool.jobs_done} jobs done")
+        elif RECYCLE_RSS_MB and rss_mb > RECYCLE_RSS_MB:
+            _recycle_pool(pool, f"worker RSS {rss_mb:.0f} MB > {RECYCLE_RSS_MB} MB")
+        _on_job_done(job_id, summary)
+
+
+def _maybe_drop_cached_models(summary):
+    """Thread-mode counterpart of pool recycling, done only while no other job is running"""
+    global _jobs_since_recycle
+    _jobs_since_recycle += 1
+    if len(scheduler.running) > 1:
+        return
+    rss_mb = (summary or {}).get('resources', {}).get('rss_after_cleanup_mb', 0)
+    if RECYCLE_AFTER_JOBS and _jobs_since_recycle >= RECYCLE_AFTER_JOBS:
+        reason = f"{_jobs_since_recycle} jobs done"
+    elif RECYCLE_RSS_MB and rss_mb > RECYCLE_RSS_MB:
+        reason = f"RSS {rss_mb:.0f} MB > {RECYCLE_RSS_MB} MB"
+    else:
+        return
+    _jobs_since_recycle = 0
+    _drop_cached_models(reason)
+
+
+def admit_job():
+    """Scheduler admission check: hold queued jobs while memory is above the high-water mark"""
+    if not MEMORY_HIGH_WATER_MB:
+        return True
+    used_mb = server_memory_bytes() / MB
+    if used_mb > MEMORY_HIGH_WATER_MB:
+        print(f"[DEBUG] Memory {used_mb:.0f} MB above high-water mark {MEMORY_HIGH_WATER_MB} MB, holding queued jobs")
+        return False
+    return True
+
 
-def start_transcription(file_path, output_dir, model, fmt, cpu, translate_zh):
+def _prune_finished_jobs():
+    """Drop finished job records (and their transcripts) older than JOB_RETENTION_HOURS"""
+    cutoff = time.time() - JOB_RETENTION_HOURS * 3600
+    for job_id, job in list(transcription_jobs.items()):
+        if job.get('finished_at', cutoff) < cutoff:
+            for sub_id in job.get('subjobs', []):
+                transcription_jobs.pop(sub_id, None)
+            transcription_jobs.pop(job_id, None)
+
+
+def _index_finished(job_id):
+    """Add the transcript of a finished job (or of each finished file of a batch) to the search index"""
+    job = transcription_jobs.get(job_id, {})
+    for done_id in [job_id] + job.get('subjobs', []):
+        done = transcription_jobs.get(done_id, {})
+        if done.get('state') == 'SUCCESS' and done.get('output_file') and done.get('segments'):
+            try:
+                index_job(done_id, done['output_file'], done['segments'])
+            except Exception as e:
+                print(f"[ERROR] Could not index job {done_id} for search: {e}")
+
+
+def rerender_outputs(job_ids=None, dry_run=False):
+    """
+    Re-render stored jobs with the current dictionary and formatting (see rendering.py).
+    Changed outputs are re-indexed for search, and jobs still held in memory get the new
+    transcript, so /transcript and /task_status serve it right away.
+    """
+    def on_changed(job_id, output_file, segments):
+        job = transcription_jobs.get(job_id)
+        if job and job.get('state') == 'SUCCESS':
+            with open(output_file, 'r', encoding='utf-8') as f:
+                update_job(job_id, {'output': f.read(), 'segments': segments, 'segment_count': len(segments)})
+        if SEARCH_INDEX_ENABLED:
+            try:
+                index_job(job_id, output_file, segments)
+            except Exception as e:
+                print(f"[ERROR] Could not re-index job {job_id}: {e}")
+    summary = rerender(job_ids, dry_run=dry_run, on_changed=on_changed)
+    print(f"[DEBUG] Re-render: {summary['changed']} changed, {summary['unchanged']} unchanged, "
+          f"{summary['missing']} missing, {summary['error']} failed in {summary['seconds']}s")
+    return summary
+
+
+def rerender_task(job_id, job_ids=None, dry_run=False):
+    """Scheduled re-render job; the summary of rerender_outputs() is stored as the job's 'rerender'"""
+    update_job(job_id, {'state': 'PROGRESS', 'start_time': datetime.datetime.now().isoformat()})
+    try:
+        summary = rerender_outputs(job_ids, dry_run=dry_run)
+    except Exception as e:
+        print(f"[ERROR] Re-render job {job_id} failed: {e}")
+        update_job(job_id, {'state': 'FAILURE', 'progress': 100, 'error': str(e)})
+        return None
+    update_job(job_id, {'state': 'SUCCESS', 'progress': 100, 'rerender': summary})
+    return {'kind': 'rerender'}
+
+
+def start_rerender(job_ids=None, dry_run=False):
+    """
+    Queue a re-render of stored jobs (default: all) and return its job id. It takes a scheduler
+    slot like a transcription, so it never competes with more running jobs than allowed.
+    """
     job_id = str(uuid.uuid4())
-    thread = threading.Thread(target=transcribe_task, args=(job_id, file_path, output_dir, model, fmt, cpu, translate_zh))
-    thread.start()
+    update_job(job_id, {
+        'kind': 'rerender',
+        'state': 'PENDING',
+        'progress': 0,
+        'queued_at': datetime.datetime.now().isoformat(),
+    })
+    scheduler.submit(job_id, RERENDER_EXPECTED_RUNTIME, (rerender_task, (job_ids, dry_run)))
     return job_id
 
+
+def _on_job_done(job_id, summary):
+    """Free the scheduler slot and feed the measured runtime back into the cost model"""
+    try:
+        if EXECUTOR == 'thread':
+            _maybe_drop_cached_models(summary)
+        update_job(job_id, {'finished_at': time.time()})
+        if SEARCH_INDEX_ENABLED:
+            _index_finished(job_id)
+        _prune_finished_jobs()
+    finally:
+        # Whatever failed above, the slot must not leak
+        scheduler.release(job_id)
+    job = transcription_jobs.get(job_id, {})
+    for done_id in [job_id] + job.get('subjobs', []):
+        _cancelled.discard(done_id)
+    # A resumed run only covers part of the file, so its runtime says nothing about the RTF
+    if summary and summary.get('state') == 'SUCCESS' and not job.get('resumed_from'):
+        rtf_stats.observe(_rtf_model(job.get('model')), summary['device'], job.get('translate_zh'),
+                          job.get('media_duration'), summary['run_seconds'])
+
+
+def _on_dispatch_error(job_id, error):
+    """A job that could not be started (pool or broker unavailable) fails instead of staying PENDING"""
+    job = transcription_jobs.get(job_id, {})
+    for failed_id in [job_id] + job.get('subjobs', []):
+        update_job(failed_id, {'state': 'FAILURE', 'progress': 100, 'error': f"Could not start job: {error}",
+                               'finished_at': time.time()})
+    delete_checkpoint(job_id)
+
+
+scheduler = JobScheduler(MAX_CONCURRENT_JOBS, _dispatch_job, policy=SCHEDULER_POLICY, admit_fn=admit_job,
+                         on_dispatch_error=_on_dispatch_error)
+
+
+def _route_auto_model(duration, device, translate_zh, latency_target):
+    """Resolve model 'auto' for a job of this media duration; returns (model, reason)"""
+    model, reason = route_model(
+        lambda m: rtf_stats.expected_runtime(duration, _rtf_model(m), device, translate_zh),
+        scheduler.predicted_wait_for_new_job(), scheduler.queue_depth(), latency_target)
+    print(f"[DEBUG] Auto model routing: {reason}")
+    return model, reason
+
+
+def start_transcription(file_path, output_dir, model, fmt, cpu, translate_zh, stream=False, preset=None, language=None,
+                        latency_target=None, batched=False, media=None, profile=False):
+    """
+    latency_target (seconds) only matters for model 'auto'.
+    media is the metadata recorded at upload (see ingest.py); its duration saves probing the file again.
+    """
+    job_id = str(uuid.uuid4())
+    model = model or 'base'
+    if EXECUTOR == 'process':
+        # The pool is a CPU backend: forked workers must not touch CUDA
+        cpu = True
+    duration = (media or {}).get('duration') or probe_duration(file_path)
+    routing = {}
+    if model == AUTO_MODEL:
+        model, reason = _route_auto_model(duration, _predict_device(cpu), translate_zh, latency_target)
+        routing = {'model_requested': AUTO_MODEL, 'model_reason': reason}
+    expected = rtf_stats.expected_runtime(duration, _rtf_model(model), _predict_device(cpu), translate_zh)
+    print(f"[DEBUG] Job {job_id}: media_duration={duration}, expected_runtime={expected:.1f}s")
+    update_job(job_id, {
+        **routing,
+        'state': 'PENDING',
+        'progress': 0,
+        'model': model,
+        'translate_zh': translate_zh,
+        'media_duration': duration,
+        'expected_runtime': expected,
+        'queued_at': datetime.datetime.now().isoformat(),
+        'file_path': file_path,
+        'media': media,
+    })
+    options = {'stream': stream, 'batched': batched, 'profile': profile, 'preset': preset, 'language': language}
+    task_args = (file_path, output_dir, model, fmt, cpu, translate_zh, options)
+    if CHECKPOINTS_ENABLED:
+        # Written before the job is queued, so a restart also picks up jobs that never started
+        save_checkpoint(job_id, {
+            'job_id': job_id,
+            'created_at': time.time(),
+            'task': list(task_args),
+            'job': {key: transcription_jobs[job_id][key] for key in ('model', 'translate_zh', 'media_duration', 'queued_at', 'file_path', 'media')},
+            'attempts': 0,
+            'offset': 0.0,
+            'prompt': None,
+            'language': None,
+            'segments': [],
+        })
+    scheduler.submit(job_id, expected, (transcribe_task, task_args))
+    return job_id
+
+
+def resume_job(job_id):
+    """
+    Queue a job again from its checkpoint. Returns False if it has no checkpoint, its upload
+    is gone, or it already failed CHECKPOINT_MAX_ATTEMPTS times.
+    """
+    checkpoint = load_checkpoint(job_id)
+    if not checkpoint:
+        return False
+    file_path = checkpoint['task'][0]
+    if not os.path.exists(file_path):
+        print(f"[ERROR] Cannot resume job {job_id}: {file_path} no longer exists")
+        delete_checkpoint(job_id)
+        return False
+    if checkpoint.get('attempts', 0) >= CHECKPOINT_MAX_ATTEMPTS:
+        print(f"[ERROR] Not resuming job {job_id}: gave up after {checkpoint['attempts']} attempts")
+        delete_checkpoint(job_id)
+        return False
+    checkpoint['attempts'] = checkpoint.get('attempts', 0) + 1
+    save_checkpoint(job_id, checkpoint)
+    job = checkpoint['job']
+    offset = checkpoint.get('offset', 0.0)
+    remaining = max((job.get('media_duration') or 0.0) - offset, 0.0) or None
+    translate_zh = job.get('translate_zh')
+    expected = rtf_stats.expected_runtime(remaining, _rtf_model(job.get('model')), _predict_device(checkpoint['task'][4]), translate_zh)
+    update_job(job_id, dict(job, state='PENDING', progress=0, expected_runtime=expected, resumed_from=offset,
+                            resume_attempt=checkpoint['attempts']))
+    print(f"[DEBUG] Job {job_id} resumed from checkpoint at {offset:.1f}s (attempt {checkpoint['attempts']})")
+    scheduler.submit(job_id, expected, (transcribe_task, tuple(checkpoint['task'])))
+    return True
+
+
+def resume_unfinished_jobs():
+    """Queue every job that still has a checkpoint; call once when the server starts"""
+    if EXECUTOR == 'broker':
+        # The broker keeps its own queue and redelivers jobs of dead nodes; just start listening
+        _get_broker()
+        return []
+    if not CHECKPOINTS_ENABLED:
+        return []
+    resumed = []
+    for checkpoint in list_checkpoints():
+        job_id = checkpoint.get('job_id')
+        if job_id and job_id not in transcription_jobs and resume_job(job_id):
+            resumed.append(job_id)
+    if resumed:
+        print(f"[DEBUG] Resumed {len(resumed)} unfinished job(s) from checkpoints")
+    return resumed
+
+
+def warm_model(model_name, device):
+    """Load a model and run one short inference, so the first job pays neither; returns the seconds taken"""
+    import numpy as np
+    start = time.time()
+    model_obj = get_model(model_name, device)
+    with inference_lock(model_name, device):
+        model_obj.transcribe(np.zeros(16000, np.float32), language='en', temperature=0.0,
+                             condition_on_previous_text=False, fp16=device == 'cuda', verbose=None)
+    return round(time.time() - start, 1)
+
+
+def prewarm(models=None, translator=None):
+    """Warm the configured models (WHISPER_PREWARM_MODELS) and translator; /readyz is ready afterwards"""
+    models = PREWARM_MODELS if models is None else models
+    translator = PREWARM_TRANSLATOR if translator is None else translator
+    _warmup['state'] = 'warming'
+    device = _predict_device(False)
+    try:
+        for name in models:
+            _warmup['models'][name] = warm_model(name, device)
+            print(f"[DEBUG] Prewarmed model {name} on {device} in {_warmup['models'][name]}s")
+        if translator:
+            start = time.time()
+            get_translator().translate(["Warming up the translator."])
+            _warmup['translator'] = round(time.time() - start, 1)
+            print(f"[DEBUG] Prewarmed translator in {_warmup['translator']}s")
+        if EXECUTOR == 'process':
+            # Created after the warm-up, so the forked workers start with the warm models
+            _get_pool()
+        _warmup['state'] = 'ready'
+    except Exception as e:
+        print(f"[ERROR] Prewarm failed: {e}")
+        _warmup.update(state='failed', error=str(e))
+
+
+def start_prewarm():
+    """Start prewarm() in the background once, so /healthz answers while models load"""
+    with _warmup_lock:
+        if _warmup['state'] != 'pending':
+            return
+        if EXECUTOR == 'broker':
+            # Models live on the nodes, which warm up before claiming jobs
+            _warmup['state'] = 'ready'
+            return
+        _warmup['state'] = 'warming'
+    threading.Thread(target=prewarm, daemon=True).start()
+
+
+def get_readiness():
+    """(ready, details) for /readyz: warm-up finished and the queue not longer than WHISPER_READY_MAX_QUEUE"""
+    queue_depth = scheduler.queue_depth()
+    details = {'warmup': dict(_warmup, models=dict(_warmup['models'])), 'queue_depth': queue_depth, 'reasons': []}
+    if _warmup['state'] != 'ready':
+        details['reasons'].append(f"warm-up {_warmup['state']}")
+    if READY_MAX_QUEUE and queue_depth > READY_MAX_QUEUE:
+        details['reasons'].append(f"{queue_depth} jobs queued (limit {READY_MAX_QUEUE})")
+    if EXECUTOR == 'broker':
+        from broker import NODE_TTL
+        now = time.time()
+        ready_nodes = [node for node, info in get_nodes().items() if now - info['ts'] <= NODE_TTL and info.get('ready', True)]
+        details['ready_nodes'] = len(ready_nodes)
+        if not ready_nodes:
+            details['reasons'].append('no worker node ready')
+    return not details['reasons'], details
+
+
+def batch_task(batch_id, subjobs, output_dir, model, fmt, cpu, translate_zh, options=None):
+    """
+    Run the files of a batch one after another in the same worker, so they all use
+    the one model loaded in this process. subjobs is a list of (sub_job_id, file_path).
+    """
+    options = dict(options or {}, batch_id=batch_id)
+    run_start = time.time()
+    update_job(batch_id, {'state': 'PROGRESS', 'start_time': datetime.datetime.now().isoformat()})
+    succeeded = 0
+    device = None
+    for sub_id, file_path in subjobs:
+        try:
+            check_cancelled(batch_id)
+        except JobCancelled:
+            update_job(sub_id, {'state': 'CANCELLED', 'stage': 'cancelled'})
+            _cleanup_cancelled(sub_id, file_path)
+            continue
+        summary = transcribe_task(sub_id, file_path, output_dir, model, fmt, cpu, translate_zh, options)
+        if summary.get('state') == 'SUCCESS':
+            succeeded += 1
+            device = summary['device']
+    try:
+        check_cancelled(batch_id)
+        state = 'SUCCESS' if succeeded else 'FAILURE'
+    except JobCancelled:
+        state = 'CANCELLED'
+        _cleanup_cancelled(batch_id, None)
+    update_job(batch_id, {'state': state, 'progress': 100})
+    print(f"[DEBUG] Batch {batch_id} finished: {succeeded}/{len(subjobs)} files succeeded")
+    if state == 'SUCCESS' and succeeded == len(subjobs):
+        return {'state': 'SUCCESS', 'device': device, 'run_seconds': time.time() - run_start}
+    return {'state': state}
+
+
+def start_batch(file_paths, output_dir, model, fmt, cpu, translate_zh, stream=False, batch_id=None, preset=None, language=None,
+                latency_target=None, batched=False, media=None, profile=False, names=None):
+    """
+    Create one batch job with a sub-job per file; the batch takes a single scheduler slot.
+    Model 'auto' picks one model for the whole batch from its total duration.
+    media, if given, holds each file's upload metadata (see start_transcription), and names
+    the original file names, shown for the sub-jobs and used in the batch zip.
+    """
+    batch_id = batch_id or str(uuid.uuid4())
+    model = model or 'base'
+    if EXECUTOR == 'process':
+        cpu = True
+    device = _predict_device(cpu)
+    media = media or [None] * len(file_paths)
+    names = names or [os.path.basename(file_path) for file_path in file_paths]
+    durations = [(info or {}).get('duration') or probe_duration(file_path) for file_path, info in zip(file_paths, media)]
+    routing = {}
+    if model == AUTO_MODEL:
+        model, reason = _route_auto_model(sum(d or 0.0 for d in durations) or None, device, translate_zh, latency_target)
+        routing = {'model_requested': AUTO_MODEL, 'model_reason': reason}
+    subjobs = []
+    total_duration = 0.0
+    total_expected = 0.0
+    now = datetime.datetime.now().isoformat()
+    for file_path, duration, info, name in zip(file_paths, durations, media, names):
+        sub_id = str(uuid.uuid4())
+        expected = rtf_stats.expected_runtime(duration, _rtf_model(model), device, translate_zh)
+        total_duration += duration or 0.0
+        total_expected += expected
+        update_job(sub_id, {
+            'state': 'PENDING',
+            'progress': 0,
+            'batch_id': batch_id,
+            'name': name,
+            'model': model,
+            'translate_zh': translate_zh,
+            'media_duration': duration,
+            'expected_runtime': expected,
+            'queued_at': now,
+            'file_path': file_path,
+            'media': info,
+        })
+        subjobs.append((sub_id, file_path))
+    update_job(batch_id, {
+        **routing,
+        'state': 'PENDING',
+        'kind': 'batch',
+        'progress': 0,
+        'subjobs': [sub_id for sub_id, _ in subjobs],
+        'model': model,
+        'translate_zh': translate_zh,
+        'media_duration': total_duration,
+        'expected_runtime': total_expected,
+        'queued_at': now,
+    })
+    print(f"[DEBUG] Batch {batch_id}: {len(subjobs)} files, expected_runtime={total_expected:.1f}s")
+    options = {'stream': stream, 'batched': batched, 'profile': profile, 'preset': preset, 'language': language}
+    scheduler.submit(batch_id, total_expected, (batch_task, (subjobs, output_dir, model, fmt, cpu, translate_zh, options)))
+    return batch_id
+
+
+def get_batch_outputs(batch_id):
+    """
+    List (arcname, path) of the output files of a batch's finished sub-jobs. Arcnames follow the
+    original upload names (the saved files carry an index prefix), numbered when two clash.
+    """
+    batch = transcription_jobs.get(batch_id)
+    if not batch or batch.get('kind') != 'batch':
+        return None
+    outputs = []
+    used = set()
+    for sub_id in batch['subjobs']:
+        job = transcription_jobs.get(sub_id, {})
+        path = job.get('output_file')
+        if path and os.path.exists(path):
+            stem = os.path.splitext(os.path.basename(job.get('name') or path))[0]
+            ext = os.path.splitext(path)[1]
+            arcname = f"{stem}{ext}"
+            n = 2
+            while arcname in used:
+                arcname = f"{stem} ({n}){ext}"
+                n += 1
+            used.add(arcname)
+            outputs.append((arcname, path))
+    return outputs
+
+
+def get_transcript_page(job_id, cursor=0, limit=200):
+    """Return (segments[cursor:cursor+limit], next_cursor or None, total) for a finished job"""
+    job = transcription_jobs.get(job_id)
+    if not job or 'segments' not in job:
+        return None
+    segments = job['segments']
+    page = [dict(seg, index=i, text=seg['text'].strip()) for i, seg in enumerate(segments[cursor:cursor + limit], cursor)]
+    next_cursor = cursor + limit if cursor + limit < len(segments) else None
+    return page, next_cursor, len(segments)
+
+
 def get_job_status(job_id):
-    return transcription_jobs.get(job_id, None)
+    job = transcription_jobs.get(job_id, None)
+    if job is None and EXECUTOR == 'broker':
+        # Jobs from before a restart of this process are still in the broker's store
+        job = _get_broker().get_job(job_id) or None
+    if job is None:
+        return None
+    job = dict(job)
+    estimate = scheduler.estimates().get(job_id)
+    if estimate:
+        job['queue_position'] = estimate['queue_position']
+        job['predicted_wait'] = round(estimate['predicted_wait'], 1)
+        job['predicted_finish'] = datetime.datetime.fromtimestamp(estimate['predicted_finish']).isoformat()
+        if estimate['queue_position'] and scheduler.held:
+            job['waiting_for'] = 'memory'
+    if job.get('kind') == 'batch':
+        files = []
+        for sub_id in job['subjobs']:
+            sub = transcription_jobs.get(sub_id, {})
+            files.append({'id': sub_id, 'name': sub.get('name'), 'state': sub.get('state'), 'progress': sub.get('progress', 0)})
+        job['files'] = files
+        job['files_total'] = len(files)
+        job['files_done'] = sum(1 for f in files if f['state'] == 'SUCCESS')
+        job['files_failed'] = sum(1 for f in files if f['state'] in ('FAILURE', 'CANCELLED'))
+        if job.get('state') not in ('SUCCESS', 'FAILURE', 'CANCELLED'):
+            job['progress'] = int(sum(f['progress'] or 0 for f in files) / max(len(files), 1))
+    return job
@@ -0,0 +1,68 @@
+
+# on-disk job checkpoints so long jobs survive a crash or restart
+import os
+import json
+import time
+
+from result_store import dump_json, strip_tokens
+
+CHECKPOINT_DIR = os.path.join(os.path.dirname(__file__), 'checkpoints')
+
+
+def _path(job_id):
+    return os.path.join(CHECKPOINT_DIR, f"{job_id}.json")
+
+
+def save_checkpoint(job_id, state):
+    """
+    Write a job's checkpoint atomically (temp file + rename), so a crash while writing
+    leaves the previous checkpoint intact.
+    state holds the job parameters plus the decoder state: last processed offset, prompt,
+    language and the segments finished so far. Written as minified JSON without token ids,
+    since it is rewritten after every window.
+    """
+    os.makedirs(CHECKPOINT_DIR, exist_ok=True)
+    state['updated_at'] = time.time()
+    path = _path(job_id)
+    tmp_path = path + '.tmp'
+    try:
+        with open(tmp_path, 'w', encoding='utf-8') as f:
+            dump_json(dict(state, segments=strip_tokens(state.get('segments', []))), f)
+        os.replace(tmp_path, path)
+    except Exception as e:
+        print(f"[ERROR] Could not save checkpoint for job {job_id}: {e}")
+
+
+def load_checkpoint(job_id):
+    """Return the job's checkpoint, or None if it has none (or it cannot be read)"""
+    path = _path(job_id)
+    if not os.path.exists(path):
+        return None
+    try:
+        with open(path, 'r', encoding='utf-8') as f:
+            return json.load(f)
+    except Exception as e:
+        print(f"[ERROR] Could not read checkpoint {path}: {e}")
+        return None
+
+
+def delete_checkpoint(job_id):
+    try:
+        os.remove(_path(job_id))
+    except FileNotFoundError:
+        pass
+    except OSError as e:
+        print(f"[ERROR] Could not remove checkpoint for job {job_id}: {e}")
+
+
+def list_checkpoints():
+    """All readable checkpoints, oldest first"""
+    if not os.path.isdir(CHECKPOINT_DIR):
+        return []
+    states = []
+    for name in os.listdir(CHECKPOINT_DIR):
+        if name.endswith('.json'):
+            state = load_checkpoint(name[:-len('.json')])
+            if state:
+                states.append(state)
+    return sorted(states, key=lambda s: s.get('created_at', 0))
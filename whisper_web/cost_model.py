@@ -0,0 +1,92 @@
+
+# rolling real-time-factor statistics used to predict job runtimes
+import os
+import json
+import threading
+
+STATS_PATH = os.path.join(os.path.dirname(__file__), 'rtf_stats.json')
+
+# Weight of the newest observation in the exponential moving average
+EWMA_ALPHA = 0.3
+
+# Rough CPU real-time factors (processing seconds per media second) used until a
+# (model, device, translate) combination has been observed on this machine
+DEFAULT_CPU_RTF = {
+    'tiny': 0.05,
+    'base': 0.1,
+    'small': 0.3,
+    'medium': 0.8,
+    'large-v3-turbo': 0.5,
+    'turbo': 0.5,
+    'large': 1.5,
+}
+GPU_SPEEDUP = 8.0
+TRANSLATE_RTF = 0.05
+# Assumed media length when ffprobe cannot read the file
+UNKNOWN_DURATION = 600.0
+
+
+def _key(model, device, translate):
+    return f"{model}|{device}|{'translate' if translate else 'plain'}"
+
+
+def _prior_rtf(model, device, translate):
+    # 'small@ctranslate2' starts from the same prior as 'small'
+    base = model.split('@')[0].split('.')[0]
+    rtf = DEFAULT_CPU_RTF.get(base)
+    if rtf is None:
+        rtf = DEFAULT_CPU_RTF['large'] if base.startswith('large') else DEFAULT_CPU_RTF['base']
+    if device != 'cpu':
+        rtf /= GPU_SPEEDUP
+    if translate:
+        rtf += TRANSLATE_RTF
+    return rtf
+
+
+class RTFStats:
+    """Per (model, device, translate) moving average of observed real-time factors, persisted as JSON"""
+
+    def __init__(self, path=STATS_PATH):
+        self.path = path
+        self.lock = threading.Lock()
+        self.stats = {}
+        if os.path.exists(path):
+            try:
+                with open(path, 'r', encoding='utf-8') as f:
+                    self.stats = json.load(f)
+            except Exception as e:
+                print(f"[ERROR] Could not read RTF stats from {path}: {e}")
+
+    def rtf(self, model, device, translate):
+        entry = self.stats.get(_key(model, device, translate))
+        if entry:
+            return entry['rtf']
+        return _prior_rtf(model, device, translate)
+
+    def expected_runtime(self, duration, model, device, translate):
+        """Predicted processing seconds for a file of the given media duration"""
+        if not duration:
+            duration = UNKNOWN_DURATION
+        return duration * self.rtf(model, device, translate)
+
+    def observe(self, model, device, translate, duration, run_seconds):
+        """Fold one finished job into the moving average"""
+        if not duration or not run_seconds or duration <= 0:
+            return
+        rtf = run_seconds / duration
+        key = _key(model, device, translate)
+        with self.lock:
+            entry = self.stats.get(key)
+            if entry:
+                entry['rtf'] = (1 - EWMA_ALPHA) * entry['rtf'] + EWMA_ALPHA * rtf
+                entry['count'] += 1
+            else:
+                self.stats[key] = {'rtf': rtf, 'count': 1}
+            try:
+                tmp_path = self.path + '.tmp'
+                with open(tmp_path, 'w', encoding='utf-8') as f:
+                    json.dump(self.stats, f, indent=2)
+                os.replace(tmp_path, self.path)
+            except Exception as e:
+                print(f"[ERROR] Could not save RTF stats to {self.path}: {e}")
+        print(f"[DEBUG] RTF observed for {key}: {rtf:.3f} (avg {self.stats[key]['rtf']:.3f})")
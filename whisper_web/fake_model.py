@@ -0,0 +1,89 @@
+
+# deterministic stand-ins for Whisper and the translator, for load testing (WHISPER_FAKE_MODEL=1)
+import os
+import time
+
+from whisper_stream import probe_duration, SAMPLE_RATE
+
+# Seconds of processing per second of audio
+FAKE_RTF = float(os.environ.get('WHISPER_FAKE_RTF', '0.05'))
+# Simulated model load time, so model caching shows up in load tests
+FAKE_LOAD_SECONDS = float(os.environ.get('WHISPER_FAKE_LOAD_SECONDS', '0'))
+# Simulated translation time per sentence
+FAKE_TRANSLATE_SECONDS = float(os.environ.get('WHISPER_FAKE_TRANSLATE_SECONDS', '0.002'))
+# One fake segment per this many seconds of audio
+SEGMENT_SECONDS = 5.0
+# Whisper decodes 30-second windows; the fake spends its time in one decode() call per window
+DECODE_WINDOW_SECONDS = 30.0
+
+
+class FakeWhisperModel:
+    """
+    Answers model.transcribe like Whisper, without any model: the segments depend only on the
+    audio length, and the call takes audio length * rtf seconds. The time is spent in decode(),
+    once per 30-second window, so cancellable_decode still gets its check points.
+    """
+
+    def __init__(self, name, device='cpu', rtf=FAKE_RTF):
+        self.name = name
+        self.device = device
+        self.rtf = rtf
+        time.sleep(FAKE_LOAD_SECONDS)
+
+    def share_memory(self):
+        return self
+
+    def decode(self, seconds):
+        time.sleep(seconds * self.rtf)
+
+    def _audio_seconds(self, audio):
+        if isinstance(audio, (str, os.PathLike)):
+            duration = probe_duration(audio)
+            # Without ffprobe, guess from the file size at 128 kbit/s
+            return duration if duration is not None else os.path.getsize(audio) / 16000
+        return len(audio) / SAMPLE_RATE
+
+    def transcribe(self, audio, language=None, **decode_options):
+        total = self._audio_seconds(audio)
+        done = 0.0
+        while done < total:
+            window = min(DECODE_WINDOW_SECONDS, total - done)
+            self.decode(window)
+            done += window
+        segments = []
+        start = 0.0
+        while start < total:
+            end = min(start + SEGMENT_SECONDS, total)
+            segments.append({
+                'id': len(segments), 'seek': int(start * 100), 'start': start, 'end': end,
+                'text': f" Fake segment {len(segments) + 1} of {self.name}.", 'tokens': [],
+                'temperature': 0.0, 'avg_logprob': -0.2, 'compression_ratio': 1.0, 'no_speech_prob': 0.0,
+            })
+            start = end
+        return {'text': ''.join(seg['text'] for seg in segments), 'segments': segments, 'language': language or 'en'}
+
+
+class FakeTranslator:
+    """Same interface as MarianTranslator; prefixes every text with [zh]"""
+
+    def translate(self, texts, progress_callback=None, stats=None):
+        start = time.time()
+        todo = [t for t in texts if t and t.strip()]
+        time.sleep(len(todo) * FAKE_TRANSLATE_SECONDS)
+        if progress_callback:
+            progress_callback(len(todo), len(todo))
+        results = [f"[zh] {t.strip()}" if t and t.strip() else "" for t in texts]
+        if stats is None:
+            return results
+        seconds = time.time() - start
+        tokens = sum(len(t.split()) for t in todo)
+        stats.update({
+            'sentences': len(todo),
+            'batches': 1 if todo else 0,
+            'input_tokens': tokens,
+            'padding_ratio': 0.0,
+            'seconds': round(seconds, 2),
+            'sentences_per_sec': round(len(todo) / seconds, 2) if seconds > 0 else None,
+            'tokens_per_sec': round(tokens / seconds, 1) if seconds > 0 else None,
+        })
+        return results
@@ -0,0 +1,141 @@
+
+# upload ingestion: keep only the audio stream of uploaded videos and record media metadata
+import os
+import json
+import time
+import subprocess
+
+# Extract the audio of uploaded videos right after upload (0 = keep uploads as they are)
+EXTRACT_AUDIO = os.environ.get('WHISPER_EXTRACT_AUDIO', '1') != '0'
+# Hours to keep the original video after extraction; 0 deletes it as soon as the audio is out
+KEEP_ORIGINAL_HOURS = float(os.environ.get('WHISPER_KEEP_ORIGINAL_HOURS', '0'))
+# Audio codecs copied as they are (no re-encode), with the container they go in
+COPY_CONTAINERS = {
+    'aac': '.m4a',
+    'alac': '.m4a',
+    'mp3': '.mp3',
+    'opus': '.opus',
+    'vorbis': '.ogg',
+    'flac': '.flac',
+}
+# Everything else (AC-3, DTS, PCM, WMA, ...) is re-encoded to FLAC at Whisper's own rate:
+# lossless for transcription and still far smaller than the container it came from
+TRANSCODE_ARGS = ['-ac', '1', '-ar', '16000', '-c:a', 'flac']
+TRANSCODE_EXT = '.flac'
+
+
+def probe_media(file_path):
+    """
+    Media metadata from ffprobe: duration, has_video and the first audio stream's codec,
+    sample_rate, channels and bit_rate. Cover art (an attached picture, as in most .mp3 and
+    .m4a files) does not count as video. Returns None if the file cannot be probed.
+    """
+    cmd = ['ffprobe', '-v', 'error', '-show_entries',
+           'format=duration:stream=codec_type,codec_name,sample_rate,channels,bit_rate:stream_disposition=attached_pic',
+           '-of', 'json', str(file_path)]
+    try:
+        info = json.loads(subprocess.run(cmd, capture_output=True, text=True, check=True).stdout)
+    except Exception as e:
+        print(f"[ERROR] ffprobe failed for {file_path}: {e}")
+        return None
+    streams = info.get('streams', [])
+    audio = next((s for s in streams if s.get('codec_type') == 'audio'), {})
+    fmt = info.get('format', {})
+    def number(value, kind=float):
+        try:
+            return kind(value)
+        except (TypeError, ValueError):
+            return None
+    return {
+        'duration': number(fmt.get('duration')),
+        'has_video': any(s.get('codec_type') == 'video' and not s.get('disposition', {}).get('attached_pic')
+                         for s in streams),
+        'has_audio': bool(audio),
+        'codec': audio.get('codec_name'),
+        'sample_rate': number(audio.get('sample_rate'), int),
+        'channels': number(audio.get('channels'), int),
+        'bit_rate': number(audio.get('bit_rate'), int),
+    }
+
+
+def extract_audio(file_path, media):
+    """
+    Write the first audio stream of file_path next to it, copying the stream when its codec
+    fits an audio container and re-encoding to FLAC otherwise. Returns (new path, copied).
+    """
+    base = os.path.splitext(file_path)[0]
+    copy_ext = COPY_CONTAINERS.get(media.get('codec'))
+    attempts = []
+    if copy_ext:
+        attempts.append((base + copy_ext, ['-c:a', 'copy'], True))
+    attempts.append((base + TRANSCODE_EXT, TRANSCODE_ARGS, False))
+    for out_path, codec_args, copied in attempts:
+        if os.path.abspath(out_path) == os.path.abspath(file_path):
+            out_path = base + '.audio' + os.path.splitext(out_path)[1]
+        cmd = ['ffmpeg', '-v', 'error', '-y', '-i', str(file_path), '-map', '0:a:0', '-vn', '-sn', '-dn',
+               *codec_args, out_path]
+        result = subprocess.run(cmd, capture_output=True, text=True)
+        if result.returncode == 0 and os.path.exists(out_path) and os.path.getsize(out_path) > 0:
+            return out_path, copied
+        # Some streams cannot be copied into the target container (odd AAC profiles, ...): re-encode
+        print(f"[ERROR] ffmpeg {' '.join(codec_args)} failed for {file_path}: {result.stderr.strip()[-300:]}")
+        if os.path.exists(out_path):
+            os.remove(out_path)
+    raise RuntimeError(f"Could not extract audio from {file_path}")
+
+
+def _retire_original(file_path, originals_dir):
+    """Delete the original upload, or move it to originals_dir until expire_originals removes it"""
+    if KEEP_ORIGINAL_HOURS <= 0 or not originals_dir:
+        os.remove(file_path)
+        return
+    os.makedirs(originals_dir, exist_ok=True)
+    os.replace(file_path, os.path.join(originals_dir, f"{int(time.time())}_{os.path.basename(file_path)}"))
+
+
+def expire_originals(originals_dir):
+    """Remove kept original uploads older than KEEP_ORIGINAL_HOURS"""
+    if not originals_dir or not os.path.isdir(originals_dir):
+        return
+    cutoff = time.time() - KEEP_ORIGINAL_HOURS * 3600
+    for name in os.listdir(originals_dir):
+        path = os.path.join(originals_dir, name)
+        try:
+            if os.path.getmtime(path) < cutoff:
+                os.remove(path)
+                print(f"[DEBUG] Expired original upload {path}")
+        except OSError as e:
+            print(f"[ERROR] Could not expire {path}: {e}")
+
+
+def ingest_upload(file_path, originals_dir=None):
+    """
+    Prepare a freshly saved upload for transcription.
+    Videos are replaced by their audio stream (the original is deleted, or kept in
+    originals_dir for KEEP_ORIGINAL_HOURS); audio files are left as they are.
+    Returns (path to transcribe, media metadata or None). On any failure the original
+    upload is kept and used, so ingestion can only save work, never lose a job.
+    """
+    media = probe_media(file_path)
+    if not EXTRACT_AUDIO or not media or not media['has_video'] or not media['has_audio']:
+        return file_path, media
+    original_size = os.path.getsize(file_path)
+    start = time.time()
+    try:
+        audio_path, copied = extract_audio(file_path, media)
+    except Exception as e:
+        print(f"[ERROR] Audio extraction failed, keeping the original upload: {e}")
+        return file_path, media
+    audio_size = os.path.getsize(audio_path)
+    media = dict(media, original_file=os.path.basename(file_path), original_size=original_size,
+                 audio_size=audio_size, copied=copied)
+    if not copied:
+        # Re-encoded: describe the file that is actually transcribed
+        media.update(codec='flac', sample_rate=16000, channels=1, bit_rate=None)
+    try:
+        _retire_original(file_path, originals_dir)
+    except OSError as e:
+        print(f"[ERROR] Could not remove original upload {file_path}: {e}")
+    print(f"[DEBUG] Extracted audio {os.path.basename(audio_path)} in {time.time() - start:.1f}s: "
+          f"{original_size / 1e6:.1f} MB -> {audio_size / 1e6:.1f} MB")
+    return audio_path, media
@@ -0,0 +1,306 @@
+
+# live captioning over WebSocket: sliding-window decoding with a local-agreement policy
+import os
+import json
+import time
+import threading
+import subprocess
+import numpy as np
+
+SAMPLE_RATE = 16000
+# Model used when the client does not ask for one
+LIVE_MODEL = os.environ.get('WHISPER_LIVE_MODEL', 'base')
+# Seconds of new audio collected before the buffer is decoded again (lower = less latency, more compute)
+LIVE_MIN_CHUNK = float(os.environ.get('WHISPER_LIVE_MIN_CHUNK', '1.0'))
+# Once the buffer is longer than this, audio up to the last confirmed word is dropped
+LIVE_BUFFER_TRIM = float(os.environ.get('WHISPER_LIVE_BUFFER_TRIM', '15'))
+# Whisper sees at most 30 seconds; past this everything pending is confirmed and dropped
+MAX_BUFFER_SECONDS = 28.0
+# Characters of confirmed text (already out of the buffer) fed back as prompt
+PROMPT_CHARS = 200
+
+# Warm models for live sessions, kept apart from the job worker's models so a live session
+# never waits behind a long file transcription: (model_name, device) -> (model, lock)
+_live_models = {}
+_live_models_lock = threading.Lock()
+
+
+def get_live_model(model_name):
+    """Load a model for live sessions once; sessions on the same model take turns per decode"""
+    import torch
+    device = 'cuda' if torch.cuda.is_available() else 'cpu'
+    key = (model_name, device)
+    with _live_models_lock:
+        if key not in _live_models:
+            from whisper_backends import load_model
+            print(f"[DEBUG] Loading live model: {model_name} on device: {device}")
+            _live_models[key] = (load_model(model_name, device=device), threading.Lock())
+        model, lock = _live_models[key]
+    return model, lock, device
+
+
+class PcmDecoder:
+    """Raw s16le mono 16 kHz input; an odd trailing byte is kept for the next chunk"""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._carry = b''
+        self._chunks = []
+
+    def feed(self, data):
+        with self._lock:
+            data = self._carry + data
+            cut = len(data) - (len(data) % 2)
+            self._carry = data[cut:]
+            self._chunks.append(data[:cut])
+
+    def read(self):
+        """Return the samples decoded since the last read as float32"""
+        with self._lock:
+            data = b''.join(self._chunks)
+            self._chunks = []
+        return np.frombuffer(data, np.int16).astype(np.float32) / 32768.0
+
+    def close(self):
+        pass
+
+
+class FfmpegDecoder(PcmDecoder):
+    """
+    Pipes the incoming bytes through ffmpeg to 16 kHz mono PCM. Used for Opus (in an Ogg or
+    WebM container, as sent by MediaRecorder) and for PCM at other rates or channel counts.
+    """
+
+    def __init__(self, input_args):
+        super().__init__()
+        cmd = ["ffmpeg", "-nostdin", "-loglevel", "error",
+               # Small probe so decoding starts after the first packets, not after megabytes
+               "-probesize", "32768", "-analyzeduration", "0", "-fflags", "nobuffer",
+               *input_args, "-i", "pipe:0",
+               "-f", "s16le", "-ac", "1", "-ar", str(SAMPLE_RATE), "pipe:1"]
+        self.proc = subprocess.Popen(cmd, stdin=subprocess.PIPE, stdout=subprocess.PIPE, stderr=subprocess.DEVNULL)
+        self._reader = threading.Thread(target=self._read_output, daemon=True)
+        self._reader.start()
+
+    def _read_output(self):
+        fd = self.proc.stdout.fileno()
+        while True:
+            data = os.read(fd, 65536)
+            if not data:
+                break
+            super().feed(data)
+
+    def feed(self, data):
+        try:
+            self.proc.stdin.write(data)
+            self.proc.stdin.flush()
+        except (BrokenPipeError, ValueError):
+            print(f"[ERROR] Live ffmpeg decoder exited (code {self.proc.poll()})")
+
+    def close(self):
+        """Flush ffmpeg; samples still in the pipe become available to read()"""
+        try:
+            self.proc.stdin.close()
+        except BrokenPipeError:
+            pass
+        self._reader.join(timeout=5)
+        self.proc.kill()
+        self.proc.wait()
+
+
+def make_decoder(fmt, sample_rate=SAMPLE_RATE, channels=1):
+    if fmt == 'opus':
+        return FfmpegDecoder([])
+    if fmt == 'pcm':
+        if sample_rate == SAMPLE_RATE and channels == 1:
+            return PcmDecoder()
+        return FfmpegDecoder(["-f", "s16le", "-ar", str(sample_rate), "-ac", str(channels)])
+    raise ValueError(f"Unsupported live audio format '{fmt}' (use pcm or opus)")
+
+
+def _norm(word):
+    return word.strip().lower().strip('.,!?;:"\'。，！？、')
+
+
+class LiveTranscriber:
+    """
+    LocalAgreement-2 streaming policy: the audio buffer is decoded again every time
+    LIVE_MIN_CHUNK seconds of new audio have arrived, and the words two consecutive
+    hypotheses agree on (their common prefix) are confirmed. Confirmed words are final and
+    never revised; the rest of the latest hypothesis is the partial result.
+    Times are seconds since the start of the stream.
+    """
+
+    def __init__(self, model, lock, language=None, fp16=False,
+                 min_chunk=LIVE_MIN_CHUNK, buffer_trim=LIVE_BUFFER_TRIM):
+        self.model = model
+        self.lock = lock
+        self.language = language
+        self.fp16 = fp16
+        self.min_chunk = min_chunk
+        self.buffer_trim = buffer_trim
+        self.audio = np.zeros(0, np.float32)
+        # Stream time of self.audio[0]
+        self.buffer_offset = 0.0
+        self.new_samples = 0
+        # Confirmed words as (start, end, text)
+        self.committed = []
+        # Unconfirmed words of the previous hypothesis
+        self.previous = []
+
+    @property
+    def committed_end(self):
+        return self.committed[-1][1] if self.committed else 0.0
+
+    def insert_audio(self, samples):
+        if len(samples):
+            self.audio = np.concatenate([self.audio, samples])
+            self.new_samples += len(samples)
+
+    def ready(self):
+        return self.new_samples >= self.min_chunk * SAMPLE_RATE
+
+    def _prompt(self):
+        # Words still inside the buffer are decoded again, so only older ones go in the prompt
+        text = ''.join(w for s, e, w in self.committed if e <= self.buffer_offset)
+        return text[-PROMPT_CHARS:] or None
+
+    def _hypothesis(self):
+        with self.lock:
+            result = self.model.transcribe(
+                self.audio, language=self.language, initial_prompt=self._prompt(),
+                word_timestamps=True, condition_on_previous_text=False,
+                temperature=0.0, fp16=self.fp16, verbose=None,
+            )
+        if not self.language:
+            self.language = result.get('language')
+        words = []
+        for seg in result.get('segments', []):
+            for w in seg.get('words', []):
+                start = self.buffer_offset + w['start']
+                # Skip words that were already confirmed (with a little slack for timestamp jitter)
+                if start >= self.committed_end - 0.1:
+                    words.append((start, self.buffer_offset + w['end'], w['word']))
+        # The buffer may still hold the last confirmed words; drop a repeated n-gram at the head
+        tail = [_norm(w) for _, _, w in self.committed[-5:]]
+        for n in range(min(len(tail), len(words)), 0, -1):
+            if tail[-n:] == [_norm(w) for _, _, w in words[:n]]:
+                words = words[n:]
+                break
+        return words
+
+    def process(self):
+        """Decode the buffer; returns (newly confirmed words, partial words)"""
+        self.new_samples = 0
+        words = self._hypothesis()
+        confirmed = []
+        while words and self.previous and _norm(words[0][2]) == _norm(self.previous[0][2]):
+            confirmed.append(words.pop(0))
+            self.previous.pop(0)
+        self.previous = words
+        if len(self.audio) / SAMPLE_RATE > MAX_BUFFER_SECONDS:
+            # Nothing agreed for a whole window (e.g. noise); take the hypothesis as it is
+            confirmed.extend(self.previous)
+            self.previous = []
+        self.committed.extend(confirmed)
+        self._trim()
+        return confirmed, self.previous
+
+    def _trim(self):
+        buffer_end = self.buffer_offset + len(self.audio) / SAMPLE_RATE
+        if buffer_end - self.buffer_offset <= self.buffer_trim:
+            return
+        cut_at = self.committed_end
+        if buffer_end - cut_at > MAX_BUFFER_SECONDS:
+            # No words at all in a whole window (silence or noise); keep only the recent audio
+            cut_at = buffer_end - self.buffer_trim
+        cut = int((cut_at - self.buffer_offset) * SAMPLE_RATE)
+        if cut > 0:
+            self.audio = self.audio[cut:]
+            self.buffer_offset += cut / SAMPLE_RATE
+
+    def finish(self):
+        """Confirm whatever is left at the end of the stream"""
+        confirmed = []
+        if self.new_samples:
+            self.previous = self._hypothesis()
+        confirmed.extend(self.previous)
+        self.previous = []
+        self.committed.extend(confirmed)
+        return confirmed
+
+
+def _segment_message(kind, words):
+    return json.dumps({
+        'type': kind,
+        'start': round(words[0][0], 2) if words else None,
+        'end': round(words[-1][1], 2) if words else None,
+        'text': ''.join(w for _, _, w in words).strip(),
+    }, ensure_ascii=False)
+
+
+def serve_live_session(ws, args, allowed_models=()):
+    """
+    One live captioning session on a flask-sock WebSocket.
+    Query args: format=pcm|opus, sample_rate and channels (pcm only), model, language.
+    model must be LIVE_MODEL or one of allowed_models, so clients cannot make the server
+    download and keep arbitrary models.
+    The client sends binary audio chunks and finally the text message {"type": "stop"}.
+    The server answers with JSON messages: ready, partial (unconfirmed tail, replaced by the
+    next partial), final (confirmed text, never revised), error and done.
+    """
+    from simple_websocket import ConnectionClosed
+    fmt = args.get('format', 'pcm')
+    model_name = args.get('model') or LIVE_MODEL
+    if model_name != LIVE_MODEL and model_name not in allowed_models:
+        ws.send(json.dumps({'type': 'error', 'error': f"Model not available for live sessions: {model_name}"}))
+        return
+    decoder = None
+    try:
+        decoder = make_decoder(fmt, int(args.get('sample_rate', SAMPLE_RATE)), int(args.get('channels', 1)))
+        model, lock, device = get_live_model(model_name)
+    except Exception as e:
+        if decoder is not None:
+            decoder.close()
+        ws.send(json.dumps({'type': 'error', 'error': str(e)}))
+        return
+    transcriber = LiveTranscriber(model, lock, language=args.get('language') or None, fp16=device == 'cuda')
+    ws.send(json.dumps({'type': 'ready', 'model': model_name, 'device': device, 'sample_rate': SAMPLE_RATE}))
+    print(f"[DEBUG] Live session started: format={fmt}, model={model_name}, device={device}")
+    session_start = time.time()
+    stopped = False
+    try:
+        while True:
+            message = ws.receive(timeout=0.1)
+            if isinstance(message, str):
+                try:
+                    stopped = json.loads(message).get('type') == 'stop'
+                except (ValueError, AttributeError):
+                    # Not JSON, or not an object: tell the client and ignore the frame
+                    ws.send(json.dumps({'type': 'error', 'error': 'Malformed control message'}))
+                if stopped:
+                    break
+            elif message:
+                decoder.feed(message)
+            transcriber.insert_audio(decoder.read())
+            if transcriber.ready():
+                confirmed, partial = transcriber.process()
+                if confirmed:
+                    ws.send(_segment_message('final', confirmed))
+                ws.send(_segment_message('partial', partial))
+    except ConnectionClosed:
+        pass
+    finally:
+        # Also on decode or protocol errors, so the ffmpeg subprocess never outlives the session
+        decoder.close()
+    if stopped:
+        try:
+            # Samples flushed out of the decoder by close()
+            transcriber.insert_audio(decoder.read())
+            confirmed = transcriber.finish()
+            if confirmed:
+                ws.send(_segment_message('final', confirmed))
+            ws.send(json.dumps({'type': 'done', 'audio_seconds': round(transcriber.buffer_offset + len(transcriber.audio) / SAMPLE_RATE, 2)}))
+        except ConnectionClosed:
+            pass
+    print(f"[DEBUG] Live session ended after {time.time() - session_start:.1f}s")
@@ -0,0 +1,35 @@
+
+# "auto" model choice: the largest model whose predicted finish time meets the job's latency target
+import os
+
+AUTO_MODEL = 'auto'
+# Models "auto" may pick, most accurate first
+AUTO_CANDIDATES = [m for m in os.environ.get('WHISPER_AUTO_MODELS', 'large-v3,large-v3-turbo,small,base,tiny').split(',') if m]
+# Seconds from upload to finished transcript that "auto" aims for, unless the job sets its own
+AUTO_LATENCY_TARGET = float(os.environ.get('WHISPER_AUTO_LATENCY_TARGET', '600'))
+# Every this many queued jobs, the largest remaining candidate is taken out of the running,
+# so a long queue is worked off with smaller models even when one big job alone would fit
+AUTO_PRESSURE_DEPTH = int(os.environ.get('WHISPER_AUTO_PRESSURE_DEPTH', '10'))
+
+
+def route_model(expected_runtime, queue_wait, queue_depth, target=None, candidates=None):
+    """
+    Pick a model for one job.
+    expected_runtime(model) is the predicted processing time of this job on that model (from
+    the observed real-time factors); queue_wait is the predicted wait before it starts.
+    Returns (model, reason) with a one-line explanation for the job status.
+    """
+    target = target or AUTO_LATENCY_TARGET
+    candidates = list(candidates or AUTO_CANDIDATES)
+    dropped = min(queue_depth // AUTO_PRESSURE_DEPTH, len(candidates) - 1) if AUTO_PRESSURE_DEPTH > 0 else 0
+    pressure = f", {queue_depth} jobs queued so {', '.join(candidates[:dropped])} skipped" if dropped else ''
+    candidates = candidates[dropped:]
+    for model in candidates:
+        predicted = queue_wait + expected_runtime(model)
+        if predicted <= target:
+            return model, (f"{model}: predicted {predicted:.0f}s (wait {queue_wait:.0f}s + run "
+                           f"{predicted - queue_wait:.0f}s) within the {target:.0f}s target{pressure}")
+    # Nothing meets the target: the fastest candidate finishes soonest
+    model = min(candidates, key=expected_runtime)
+    predicted = queue_wait + expected_runtime(model)
+    return model, (f"{model}: fastest model, predicted {predicted:.0f}s misses the {target:.0f}s target{pressure}")
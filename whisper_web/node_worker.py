@@ -0,0 +1,168 @@
+
+# distributed worker node: runs jobs claimed from the broker (WHISPER_EXECUTOR=broker)
+"""
+Start one or more nodes next to (or away from) the web app, all pointing at the same broker:
+
+    export WHISPER_EXECUTOR=broker
+    export WHISPER_BROKER_URL=redis://queue-host:6379/0
+    python whisper_web/node_worker.py --concurrency 2
+
+Uploads and outputs are passed around as paths, so nodes on other machines need the
+whisper_web/uploads and whisper_web/outputs directories on shared storage at the same path.
+Without Redis, WHISPER_BROKER_URL=file:///some/dir runs the same protocol on one machine.
+"""
+import os
+import sys
+import time
+import argparse
+import threading
+
+import celery_worker as worker
+from broker import get_broker, default_node_id, HEARTBEAT_INTERVAL, NODE_TTL
+
+TASKS = {
+    'transcribe_task': worker.transcribe_task,
+    'batch_task': worker.batch_task,
+}
+
+
+class BrokerUpdates:
+    """Stands in for the pool's progress queue: update_job() on this node goes to the broker"""
+
+    def __init__(self, broker):
+        self.broker = broker
+
+    def put(self, item):
+        job_id, fields = item
+        try:
+            self.broker.push_update(job_id, fields)
+        except Exception as e:
+            print(f"[ERROR] Could not push update for job {job_id}: {e}")
+
+
+class Node:
+    def __init__(self, broker, node_id, concurrency):
+        self.broker = broker
+        self.node_id = node_id
+        self.concurrency = max(1, concurrency)
+        self.running = {}
+        self.running_lock = threading.Lock()
+        self.stopping = threading.Event()
+        self.jobs_done = 0
+        # False until the warm-up (WHISPER_PREWARM_MODELS) is done; the node claims no jobs before
+        self.ready = False
+
+    def _run(self, message):
+        job_id = message['job_id']
+        task_fn = TASKS.get(message['task'])
+        if task_fn is None:
+            worker.update_job(job_id, {'state': 'FAILURE', 'progress': 100, 'error': f"Unknown task {message['task']}"})
+            return {'state': 'FAILURE'}
+        if self.broker.is_cancelled(job_id):
+            worker.update_job(job_id, {'state': 'CANCELLED', 'stage': 'cancelled'})
+            return {'state': 'CANCELLED'}
+        if message.get('attempts'):
+            print(f"[DEBUG] Job {job_id} redelivered (attempt {message['attempts'] + 1})")
+        return worker.run_job(task_fn, job_id, *message['args'])
+
+    def _consume(self, slot):
+        while not self.stopping.is_set():
+            try:
+                message = self.broker.claim(self.node_id, timeout=HEARTBEAT_INTERVAL)
+            except Exception as e:
+                print(f"[ERROR] Could not claim a job: {e}")
+                time.sleep(HEARTBEAT_INTERVAL)
+                continue
+            if message is None:
+                continue
+            job_id = message['job_id']
+            with self.running_lock:
+                self.running[job_id] = time.time()
+            print(f"[DEBUG] Node {self.node_id} slot {slot}: starting job {job_id} ({message['task']})")
+            try:
+                summary = self._run(message)
+            except Exception as e:
+                print(f"[ERROR] Job {job_id} crashed: {e}")
+                worker.update_job(job_id, {'state': 'FAILURE', 'progress': 100, 'error': f'Node {self.node_id}: {e}'})
+                summary = {'state': 'FAILURE'}
+            # Tells the web app the job is over, like a finished future in the other backends
+            worker.update_job(job_id, {'run_summary': summary})
+            self.broker.ack(self.node_id, job_id)
+            with self.running_lock:
+                self.running.pop(job_id, None)
+                self.jobs_done += 1
+            worker._cancelled.discard(job_id)
+
+    def _heartbeat(self):
+        with self.running_lock:
+            running = list(self.running)
+        self.broker.heartbeat(self.node_id, {
+            'host': os.uname().nodename if hasattr(os, 'uname') else '',
+            'pid': os.getpid(),
+            'concurrency': self.concurrency,
+            'running': running,
+            'jobs_done': self.jobs_done,
+            'ready': self.ready,
+        })
+        # Cancellation requested in the web app reaches the running job's check points
+        for job_id in running:
+            if self.broker.is_cancelled(job_id):
+                worker._cancelled.add(job_id)
+
+    def run(self):
+        worker._progress_queue = BrokerUpdates(self.broker)
+        self._heartbeat()
+        # Heartbeats continue during a long warm-up, so the node is not taken for dead
+        warmup = threading.Thread(target=worker.prewarm, daemon=True)
+        warmup.start()
+        while warmup.is_alive():
+            warmup.join(HEARTBEAT_INTERVAL)
+            self._heartbeat()
+        if worker._warmup['state'] != 'ready':
+            print(f"[ERROR] Node {self.node_id} could not warm up: {worker._warmup['error']}")
+            return 1
+        self.ready = True
+        self._heartbeat()
+        threads = [threading.Thread(target=self._consume, args=(i,), daemon=True) for i in range(1, self.concurrency + 1)]
+        for t in threads:
+            t.start()
+        print(f"[DEBUG] Node {self.node_id} started with {self.concurrency} slot(s)")
+        try:
+            while True:
+                time.sleep(HEARTBEAT_INTERVAL)
+                self._heartbeat()
+                for job_id in self.broker.requeue_dead(NODE_TTL, worker.CHECKPOINT_MAX_ATTEMPTS):
+                    worker.update_job(job_id, {'state': 'FAILURE', 'progress': 100,
+                                               'error': f'Worker nodes died {worker.CHECKPOINT_MAX_ATTEMPTS} times while running this job'})
+                    worker.update_job(job_id, {'run_summary': {'state': 'FAILURE'}})
+        except KeyboardInterrupt:
+            # Stop claiming; running jobs finish (heartbeats continue so they are not requeued)
+            print(f"\n[DEBUG] Node {self.node_id} stopping, waiting for running jobs (Ctrl-C again to abort)")
+            self.stopping.set()
+            while any(t.is_alive() for t in threads):
+                time.sleep(1.0)
+                self._heartbeat()
+        return 0
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Run transcription jobs from the broker on this machine")
+    parser.add_argument("--broker", default=worker.BROKER_URL, help="Broker URL (default: WHISPER_BROKER_URL)")
+    parser.add_argument("--concurrency", type=int, default=int(os.environ.get('WHISPER_NODE_CONCURRENCY', '1')),
+                        help="Jobs this node runs at once (default: WHISPER_NODE_CONCURRENCY or 1)")
+    parser.add_argument("--node-id", default=default_node_id(), help="Name of this node (default: host-pid)")
+    parser.add_argument("--status", action="store_true", help="Show the nodes known to the broker and exit")
+    args = parser.parse_args()
+
+    broker = get_broker(args.broker)
+    if args.status:
+        now = time.time()
+        for node_id, info in sorted(broker.nodes().items()):
+            state = 'dead' if now - info['ts'] > NODE_TTL else ('alive' if info.get('ready', True) else 'warming')
+            print(f"{node_id:<30} {state:<7}  slots={info['concurrency']}  running={len(info['running'])}  done={info['jobs_done']}")
+        return 0
+    return Node(broker, args.node_id, args.concurrency).run()
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,101 @@
+
+# multi-process CPU inference pool for the web worker
+import os
+import sys
+import threading
+import multiprocessing
+from concurrent.futures import ProcessPoolExecutor
+
+# Set by the pool initializer inside each worker process
+_worker_index = None
+
+
+def _cpu_list():
+    if hasattr(os, 'sched_getaffinity'):
+        return sorted(os.sched_getaffinity(0))
+    return list(range(os.cpu_count() or 1))
+
+
+def _init_worker(counter, num_workers, progress_queue, cancelled, worker_init):
+    """Pin this worker to its share of the cores and size torch's intra-op pool to match"""
+    global _worker_index
+    with counter.get_lock():
+        _worker_index = counter.value
+        counter.value += 1
+    cores = _cpu_list()
+    share = max(1, len(cores) // num_workers)
+    # Workers beyond the first round (after a crash/restart) wrap around onto the same slices
+    slot = _worker_index % num_workers
+    my_cores = cores[slot * share:(slot + 1) * share] or cores
+    if hasattr(os, 'sched_setaffinity'):
+        try:
+            os.sched_setaffinity(0, my_cores)
+        except OSError as e:
+            print(f"[ERROR] Could not pin worker {_worker_index} to cores {my_cores}: {e}")
+    os.environ['OMP_NUM_THREADS'] = str(len(my_cores))
+    os.environ['MKL_NUM_THREADS'] = str(len(my_cores))
+    try:
+        import torch
+        torch.set_num_threads(len(my_cores))
+    except ImportError:
+        pass
+    print(f"[DEBUG] Pool worker {_worker_index} (pid={os.getpid()}) pinned to cores {my_cores}")
+    if worker_init:
+        worker_init(progress_queue, cancelled)
+
+
+class InferencePool:
+    """
+    Runs jobs in a pool of worker processes.
+    Models loaded in the parent before the pool starts are inherited by the workers through fork,
+    so the weights are shared read-only (copy-on-write) instead of being loaded once per process.
+    Workers send job updates back through a queue, applied in the parent by apply_update(job_id, fields).
+    Job ids added to self.cancelled (a manager dict shared with the workers) are seen by running jobs.
+    """
+
+    def __init__(self, num_workers, apply_update, worker_init=None):
+        # fork is what lets workers share the parent's preloaded weights; fall back to spawn elsewhere
+        method = 'fork' if 'fork' in multiprocessing.get_all_start_methods() and sys.platform != 'darwin' else 'spawn'
+        self.ctx = multiprocessing.get_context(method)
+        self.num_workers = num_workers
+        self.apply_update = apply_update
+        # Jobs finished on this pool, for the recycle-after-N-jobs policy
+        self.jobs_done = 0
+        self.closed = False
+        self.progress_queue = self.ctx.Queue()
+        self._counter = self.ctx.Value('i', 0)
+        self._manager = self.ctx.Manager()
+        self.cancelled = self._manager.dict()
+        self._listener = threading.Thread(target=self._listen, daemon=True)
+        self._listener.start()
+        self.executor = ProcessPoolExecutor(
+            max_workers=num_workers,
+            mp_context=self.ctx,
+            initializer=_init_worker,
+            initargs=(self._counter, num_workers, self.progress_queue, self.cancelled, worker_init),
+        )
+        print(f"[DEBUG] Inference pool started: {num_workers} processes ({method})")
+
+    def _listen(self):
+        while True:
+            item = self.progress_queue.get()
+            if item is None:
+                break
+            job_id, fields = item
+            try:
+                self.apply_update(job_id, fields)
+            except Exception as e:
+                print(f"[ERROR] Could not apply update for job {job_id}: {e}")
+
+    def submit(self, fn, *args):
+        return self.executor.submit(fn, *args)
+
+    def shutdown(self, wait=True):
+        self.executor.shutdown(wait=wait)
+        self.progress_queue.put(None)
+        self._manager.shutdown()
+        self.closed = True
+
+    def retire(self):
+        """Stop using this pool: running jobs finish in the background, then its processes exit"""
+        threading.Thread(target=self.shutdown, daemon=True).start()
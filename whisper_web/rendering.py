@@ -0,0 +1,312 @@
+
+# rendering of a job's raw Whisper segments into its output file, and bulk re-rendering of finished jobs
+"""
+The worker keeps each finished job's raw segments (start, end and text as decoded, or as
+translated) in raw_segments/<job_id>.json, together with the output file they were rendered to.
+When custom_dict.txt or the formatting rules change, old outputs can be brought up to date
+without transcribing again:
+
+    python whisper_web/rendering.py rerender              # every stored job, all cores
+    python whisper_web/rendering.py rerender --dry-run    # only report what would change
+    python whisper_web/rendering.py rerender JOB_ID ...   # selected jobs
+
+or with POST /rerender on the web app, which queues a re-render job and answers with its id
+(GET /task_status/<id> has the summary once it finished). Only output files whose rendered text differs are
+rewritten (and re-indexed for search); the others are not touched. When several jobs wrote the
+same output file (the same file name uploaded again), only the newest of them is rendered.
+"""
+import os
+import re
+import sys
+import json
+import time
+import argparse
+import multiprocessing
+from concurrent.futures import ProcessPoolExecutor
+
+CUSTOM_DICT_PATH = os.path.join(os.path.dirname(__file__), 'custom_dict.txt')
+RAW_DIR = os.environ.get('WHISPER_RAW_DIR', os.path.join(os.path.dirname(os.path.abspath(__file__)), 'raw_segments'))
+# Keep raw segments of finished jobs so they can be re-rendered (0 = don't)
+KEEP_RAW = os.environ.get('WHISPER_KEEP_RAW', '1') != '0'
+# Processes for bulk re-rendering (0 = one per core)
+RERENDER_WORKERS = int(os.environ.get('WHISPER_RERENDER_WORKERS', '0')) or (os.cpu_count() or 1)
+# Jobs handed to a re-render process at a time
+RERENDER_CHUNK = 64
+
+CHINESE_SPACE_RE = re.compile(r'([\u4e00-\u9fff])\s+([\u4e00-\u9fff])')
+# Job ids are uuid4 strings; anything else never reaches a path
+JOB_ID_RE = re.compile(r'^[0-9a-f]{8}-[0-9a-f]{4}-[0-9a-f]{4}-[0-9a-f]{4}-[0-9a-f]{12}$')
+
+
+def load_dictionary(path=CUSTOM_DICT_PATH):
+    """(source, target) pairs from custom_dict.txt ('source=target' lines, '#' comments)"""
+    replacements = []
+    if not os.path.exists(path):
+        return replacements
+    print(f"[DEBUG] Applying custom dictionary replacements from {path}")
+    try:
+        with open(path, 'r', encoding='utf-8') as f:
+            for line in f:
+                line = line.strip()
+                if '=' in line and not line.startswith('#'):
+                    src, tgt = line.split('=', 1)
+                    replacements.append((src.strip(), tgt.strip()))
+        print(f"[DEBUG] Custom dictionary loaded: {replacements}")
+    except Exception as e:
+        print(f"[ERROR] Custom Dictionary Error: {e}")
+    return replacements
+
+
+def make_space_insensitive_pattern(src):
+    # 將 src 轉為 pattern，忽略所有空白（半形、全形）
+    chars = [c for c in src if not c.isspace()]
+    # [\s\u3000]* 代表可有可無的半形或全形空白
+    return r''.join([re.escape(c) + r'[\s\u3000]*' for c in chars])
+
+
+def compile_dictionary(replacements):
+    """Compiled (pattern, target) rules, so a dictionary is compiled once and not per segment"""
+    return [(re.compile(make_space_insensitive_pattern(src), re.IGNORECASE), tgt) for src, tgt in replacements]
+
+
+def apply_dictionary(text, rules):
+    for pattern, tgt in rules:
+        text = pattern.sub(tgt, text)
+    return text
+
+
+def merge_chinese_spaces(text):
+    # 合併所有「中文+空白+中文」為「中文中文」
+    return CHINESE_SPACE_RE.sub(r'\1\2', text)
+
+
+def format_timestamp(seconds):
+    ms = int((seconds - int(seconds)) * 1000)
+    h = int(seconds // 3600)
+    m = int((seconds % 3600) // 60)
+    s = int(seconds % 60)
+    return f"{h:02}:{m:02}:{s:02},{ms:03}"
+
+
+def render_segments(segments, rules, verbose=False):
+    """
+    Segments sorted by start, with the dictionary and space merging applied (served by /transcript).
+    The text is not stripped: the SRT keeps each segment's text as Whisper decoded it.
+    """
+    rendered = []
+    # 先依 start 時間排序，避免 SRT 時間錯亂
+    for idx, seg in enumerate(sorted(segments, key=lambda seg: seg['start']), 1):
+        seg_text = merge_chinese_spaces(apply_dictionary(seg['text'], rules))
+        if verbose and seg_text != seg['text']:
+            print(f"[DEBUG] SRT seg[{idx}] before dict: {seg['text']}")
+            print(f"[DEBUG] SRT seg[{idx}] after dict:  {seg_text}")
+        rendered.append({'start': seg['start'], 'end': seg['end'], 'text': seg_text})
+    return rendered
+
+
+def render_srt(segments):
+    srt_lines = []
+    for idx, seg in enumerate(segments, 1):
+        srt_lines.append(str(idx))
+        srt_lines.append(f"{format_timestamp(seg['start'])} --> {format_timestamp(seg['end'])}")
+        srt_lines.append(seg['text'])
+        srt_lines.append("")
+    return "\n".join(srt_lines)
+
+
+def render(raw, rules, verbose=False):
+    """
+    (output file content, rendered segments) of a raw record: an SRT for fmt 'srt', otherwise
+    the full text with the dictionary and space merging applied.
+    """
+    segments = render_segments(raw['segments'], rules, verbose)
+    if raw['fmt'] == 'srt':
+        return render_srt(segments), segments
+    return merge_chinese_spaces(apply_dictionary(raw['text'].strip(), rules)), segments
+
+
+def raw_record(job_id, result, fmt, output_file):
+    """What has to be kept of a finished job to render its output again"""
+    return {
+        'job_id': job_id,
+        'created_at': time.time(),
+        'fmt': 'srt' if fmt == 'srt' else 'txt',
+        'output_file': output_file,
+        'language': result.get('language'),
+        'text': result['text'],
+        'segments': [{'start': seg['start'], 'end': seg['end'], 'text': seg['text']} for seg in result.get('segments', [])],
+    }
+
+
+def valid_job_id(job_id):
+    return isinstance(job_id, str) and bool(JOB_ID_RE.match(job_id))
+
+
+def _raw_path(job_id):
+    if not valid_job_id(job_id):
+        raise ValueError(f"Invalid job id: {job_id!r}")
+    return os.path.join(RAW_DIR, f"{job_id}.json")
+
+
+def save_raw(raw):
+    os.makedirs(RAW_DIR, exist_ok=True)
+    path = _raw_path(raw['job_id'])
+    tmp_path = path + '.tmp'
+    with open(tmp_path, 'w', encoding='utf-8') as f:
+        json.dump(raw, f, ensure_ascii=False, separators=(',', ':'))
+    os.replace(tmp_path, path)
+
+
+def load_raw(job_id):
+    with open(_raw_path(job_id), 'r', encoding='utf-8') as f:
+        return json.load(f)
+
+
+def list_raw():
+    if not os.path.isdir(RAW_DIR):
+        return []
+    return sorted(name[:-len('.json')] for name in os.listdir(RAW_DIR)
+                  if name.endswith('.json') and valid_job_id(name[:-len('.json')]))
+
+
+def write_if_changed(path, content):
+    """Write content to path (atomically) unless the file already holds exactly that; True if written"""
+    try:
+        with open(path, 'r', encoding='utf-8') as f:
+            if f.read() == content:
+                return False
+    except FileNotFoundError:
+        pass
+    tmp_path = path + '.tmp'
+    with open(tmp_path, 'w', encoding='utf-8') as f:
+        f.write(content)
+    os.replace(tmp_path, path)
+    return True
+
+
+_rules = None
+
+
+def _init_worker(replacements):
+    global _rules
+    _rules = compile_dictionary(replacements)
+
+
+def _rerender_one(job_id, dry_run=False):
+    """('changed' | 'unchanged' | 'missing' | 'error', job_id, output_file, rendered segments or error)"""
+    try:
+        raw = load_raw(job_id)
+        output_file = raw['output_file']
+        if not os.path.exists(output_file):
+            # Output deleted on purpose: don't bring it back
+            return 'missing', job_id, output_file, None
+        content, segments = render(raw, _rules)
+        if dry_run:
+            with open(output_file, 'r', encoding='utf-8') as f:
+                changed = f.read() != content
+        else:
+            changed = write_if_changed(output_file, content)
+        return ('changed' if changed else 'unchanged'), job_id, output_file, segments
+    except Exception as e:
+        return 'error', job_id, None, str(e)
+
+
+def _rerender_dry(job_id):
+    return _rerender_one(job_id, dry_run=True)
+
+
+def _raw_owner(job_id):
+    """(job_id, output file, created_at), or (job_id, None, error) if the record cannot be read"""
+    try:
+        raw = load_raw(job_id)
+        return job_id, os.path.abspath(raw['output_file']), raw.get('created_at', 0)
+    except Exception as e:
+        return job_id, None, str(e)
+
+
+def _run(task, job_ids, workers, replacements):
+    if workers > 1 and len(job_ids) > RERENDER_CHUNK:
+        # Spawned, not forked: the web app calls this from a thread of a multi-threaded process
+        context = multiprocessing.get_context('spawn')
+        with ProcessPoolExecutor(max_workers=workers, mp_context=context, initializer=_init_worker,
+                                 initargs=(replacements,)) as pool:
+            return list(pool.map(task, job_ids, chunksize=RERENDER_CHUNK))
+    _init_worker(replacements)
+    return [task(job_id) for job_id in job_ids]
+
+
+def rerender(job_ids=None, workers=RERENDER_WORKERS, dry_run=False, on_changed=None):
+    """
+    Render the stored raw segments of job_ids (default: all stored jobs) again with the current
+    dictionary and rules, rewriting only outputs whose content changes. Of the stored jobs that
+    share an output file only the newest is rendered; the others count as 'superseded'.
+    on_changed(job_id, output_file, segments) is called in this process for every rewritten output.
+    Returns a summary with the counts per outcome, the changed job ids and the errors.
+    Raises ValueError for job ids that are not uuids.
+    """
+    start = time.time()
+    stored = list_raw()
+    if job_ids:
+        job_ids = list(job_ids)
+        invalid = [job_id for job_id in job_ids if not valid_job_id(job_id)]
+        if invalid:
+            raise ValueError(f"Invalid job id(s): {', '.join(map(repr, invalid[:5]))}")
+    else:
+        job_ids = stored
+    replacements = load_dictionary()
+    # Which job last wrote each output file, over all stored jobs (not only the requested ones)
+    output_of = {}
+    newest = {}
+    for job_id, output_file, created_at in _run(_raw_owner, stored, workers, replacements):
+        if output_file is not None:
+            output_of[job_id] = output_file
+            if (created_at, job_id) > newest.get(output_file, (-1, '')):
+                newest[output_file] = (created_at, job_id)
+    superseded = {job_id for job_id, output_file in output_of.items() if newest[output_file][1] != job_id}
+    todo = [job_id for job_id in job_ids if job_id not in superseded]
+    superseded = [job_id for job_id in job_ids if job_id in superseded]
+    outcomes = _run(_rerender_dry if dry_run else _rerender_one, todo, workers, replacements)
+    summary = {'jobs': len(job_ids), 'changed': 0, 'unchanged': 0, 'missing': 0, 'superseded': len(superseded),
+               'error': 0, 'changed_jobs': [], 'errors': {}, 'dry_run': dry_run}
+    for outcome, job_id, output_file, detail in outcomes:
+        summary[outcome] += 1
+        if outcome == 'changed':
+            summary['changed_jobs'].append(job_id)
+            if on_changed and not dry_run:
+                on_changed(job_id, output_file, detail)
+        elif outcome == 'error':
+            summary['errors'][job_id] = detail
+    summary['seconds'] = round(time.time() - start, 2)
+    return summary
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Re-render finished jobs from their stored raw segments")
+    sub = parser.add_subparsers(dest='command', required=True)
+    p_rerender = sub.add_parser('rerender', help="Apply the current dictionary and formatting to stored jobs")
+    p_rerender.add_argument('job_ids', nargs='*', help="Jobs to re-render (default: all stored jobs)")
+    p_rerender.add_argument('--workers', type=int, default=RERENDER_WORKERS, help=f"Processes (default: {RERENDER_WORKERS})")
+    p_rerender.add_argument('--dry-run', action='store_true', help="Only count the outputs that would change")
+    p_rerender.add_argument('--no-index', action='store_true', help="Don't update the search index for changed outputs")
+    args = parser.parse_args()
+
+    on_changed = None
+    if not args.no_index:
+        from search_index import index_job
+        on_changed = index_job
+    try:
+        summary = rerender(args.job_ids, args.workers, args.dry_run, on_changed)
+    except ValueError as e:
+        print(f"[ERROR] {e}")
+        return 2
+    verb = "would change" if args.dry_run else "changed"
+    print(f"{summary['jobs']} job(s): {summary['changed']} {verb}, {summary['unchanged']} unchanged, "
+          f"{summary['missing']} without output file, {summary['superseded']} superseded by a newer job, "
+          f"{summary['error']} failed, in {summary['seconds']}s")
+    for job_id, error in summary['errors'].items():
+        print(f"[ERROR] {job_id}: {error}")
+    return 1 if summary['error'] else 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,111 @@
+
+# per-job CPU/memory accounting and memory housekeeping for the worker
+import os
+import gc
+import sys
+import time
+import ctypes
+import threading
+import multiprocessing
+
+MB = 1024 * 1024
+
+
+def rss_bytes(pid=None):
+    """Resident set size of a process (this one by default); 0 if it cannot be read"""
+    try:
+        with open(f"/proc/{pid or 'self'}/statm") as f:
+            return int(f.read().split()[1]) * os.sysconf('SC_PAGE_SIZE')
+    except (OSError, ValueError, IndexError):
+        pass
+    try:
+        import psutil
+        return psutil.Process(pid).memory_info().rss
+    except Exception:
+        pass
+    if pid is None:
+        # No /proc and no psutil (macOS): the peak is the best available number
+        import resource
+        peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+        return peak if sys.platform == 'darwin' else peak * 1024
+    return 0
+
+
+def _pss_bytes(pid):
+    """
+    Proportional set size: pages shared between processes (the model weights the pool workers
+    inherit through fork) are split between them instead of being counted in full by each.
+    """
+    try:
+        with open(f"/proc/{pid}/smaps_rollup") as f:
+            for line in f:
+                if line.startswith('Pss:'):
+                    return int(line.split()[1]) * 1024
+    except (OSError, ValueError):
+        pass
+    return rss_bytes(pid)
+
+
+def server_memory_bytes():
+    """Memory held by this process and its children (pool workers)"""
+    total = _pss_bytes(os.getpid())
+    for child in multiprocessing.active_children():
+        total += _pss_bytes(child.pid)
+    return total
+
+
+def release_memory():
+    """Hand freed memory back: collect garbage, empty the CUDA cache and trim the C heap"""
+    gc.collect()
+    torch = sys.modules.get('torch')
+    if torch is not None and torch.cuda.is_available():
+        torch.cuda.empty_cache()
+    if sys.platform.startswith('linux'):
+        # glibc keeps freed arenas mapped; malloc_trim returns them to the OS
+        try:
+            ctypes.CDLL('libc.so.6').malloc_trim(0)
+        except (OSError, AttributeError):
+            pass
+
+
+class ResourceMonitor:
+    """
+    Measures CPU time and samples RSS in a background thread while a job runs.
+    Both are per process: exact for a pool worker running one job, shared with any
+    concurrent jobs in thread mode.
+    """
+
+    def __init__(self, interval=0.5):
+        self.interval = interval
+        self._stop = threading.Event()
+        self._thread = None
+
+    def _sample(self):
+        while not self._stop.wait(self.interval):
+            self.peak_rss = max(self.peak_rss, rss_bytes())
+
+    def __enter__(self):
+        self.cpu_start = time.process_time()
+        self.wall_start = time.time()
+        self.rss_start = self.peak_rss = rss_bytes()
+        self._thread = threading.Thread(target=self._sample, daemon=True)
+        self._thread.start()
+        return self
+
+    def __exit__(self, *exc):
+        self._stop.set()
+        self._thread.join()
+        self.cpu_seconds = time.process_time() - self.cpu_start
+        self.wall_seconds = time.time() - self.wall_start
+        self.rss_end = rss_bytes()
+        self.peak_rss = max(self.peak_rss, self.rss_end)
+        return False
+
+    def stats(self):
+        return {
+            'cpu_seconds': round(self.cpu_seconds, 1),
+            'wall_seconds': round(self.wall_seconds, 1),
+            'rss_start_mb': round(self.rss_start / MB, 1),
+            'peak_rss_mb': round(self.peak_rss / MB, 1),
+            'rss_end_mb': round(self.rss_end / MB, 1),
+        }
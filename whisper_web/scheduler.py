@@ -0,0 +1,140 @@
+
+# bounded-concurrency job scheduler with FIFO or shortest-expected-job-first ordering
+import time
+import heapq
+import threading
+
+
+class JobScheduler:
+    """
+    Holds submitted jobs until a slot is free, then hands them to dispatch_fn(job_id, payload).
+    The caller must call release(job_id) when a dispatched job finishes.
+
+    policy 'fifo' starts jobs in submission order. policy 'sjf' starts the job with the
+    smallest expected runtime first; waiting time is subtracted (times aging) so long jobs
+    are not starved forever.
+
+    admit_fn() (optional) is asked before a job starts while others are running; when it
+    returns False the job stays queued until a running job is released. With nothing
+    running a job always starts, so the queue cannot stall.
+
+    on_dispatch_error(job_id, error) (optional) is called when dispatch_fn raises, so the
+    caller can mark the job failed; its slot is released either way.
+    """
+
+    def __init__(self, max_concurrent, dispatch_fn, policy='fifo', aging=1.0, admit_fn=None, on_dispatch_error=None):
+        self.max_concurrent = max(1, max_concurrent)
+        self.dispatch_fn = dispatch_fn
+        self.policy = policy
+        self.aging = aging
+        self.admit_fn = admit_fn
+        self.on_dispatch_error = on_dispatch_error
+        # True while queued jobs are held back by admit_fn
+        self.held = False
+        self.lock = threading.Lock()
+        # job_id -> {'expected': seconds, 'submitted': ts, 'payload': ...}
+        self.pending = {}
+        # job_id -> {'expected': seconds, 'started': ts}
+        self.running = {}
+        self._seq = 0
+
+    def _priority(self, job_id, now):
+        job = self.pending[job_id]
+        if self.policy == 'sjf':
+            return (job['expected'] - self.aging * (now - job['submitted']), job['seq'])
+        return (job['seq'],)
+
+    def _ordered_pending(self, now):
+        return sorted(self.pending, key=lambda job_id: self._priority(job_id, now))
+
+    def submit(self, job_id, expected_seconds, payload):
+        with self.lock:
+            self._seq += 1
+            self.pending[job_id] = {
+                'expected': expected_seconds,
+                'submitted': time.time(),
+                'seq': self._seq,
+                'payload': payload,
+            }
+        self._dispatch()
+
+    def cancel(self, job_id):
+        """Drop a job that has not started yet; returns True if it was still waiting"""
+        with self.lock:
+            return self.pending.pop(job_id, None) is not None
+
+    def release(self, job_id):
+        with self.lock:
+            self.running.pop(job_id, None)
+            self.pending.pop(job_id, None)
+        self._dispatch()
+
+    def _dispatch(self):
+        to_start = []
+        with self.lock:
+            now = time.time()
+            admit = None
+            self.held = False
+            for job_id in self._ordered_pending(now):
+                if len(self.running) >= self.max_concurrent:
+                    break
+                if self.running and self.admit_fn is not None:
+                    if admit is None:
+                        admit = self.admit_fn()
+                    if not admit:
+                        self.held = True
+                        break
+                job = self.pending.pop(job_id)
+                self.running[job_id] = {'expected': job['expected'], 'started': now}
+                to_start.append((job_id, job['payload']))
+        for job_id, payload in to_start:
+            try:
+                self.dispatch_fn(job_id, payload)
+            except Exception as e:
+                print(f"[ERROR] Could not dispatch job {job_id}: {e}")
+                if self.on_dispatch_error is not None:
+                    try:
+                        self.on_dispatch_error(job_id, e)
+                    except Exception as cb_e:
+                        print(f"[ERROR] Dispatch error handler failed for job {job_id}: {cb_e}")
+                self.release(job_id)
+
+    def queue_depth(self):
+        with self.lock:
+            return len(self.pending)
+
+    def predicted_wait_for_new_job(self):
+        """Seconds until a job submitted now would start, if it queued behind every pending job"""
+        with self.lock:
+            now = time.time()
+            slots = [max(job['expected'] - (now - job['started']), 0.0) for job in self.running.values()]
+            slots.extend([0.0] * (self.max_concurrent - len(slots)))
+            heapq.heapify(slots)
+            for job_id in self._ordered_pending(now):
+                heapq.heappush(slots, heapq.heappop(slots) + self.pending[job_id]['expected'])
+            return slots[0]
+
+    def estimates(self):
+        """
+        Predict wait and finish times for every known job by simulating the slots:
+        running jobs free their slot after their remaining expected time, pending jobs
+        take the earliest free slot in policy order.
+        Returns {job_id: {'queue_position', 'predicted_wait', 'predicted_finish'}} with
+        predicted_finish as a unix timestamp.
+        """
+        with self.lock:
+            now = time.time()
+            result = {}
+            slots = []
+            for job_id, job in self.running.items():
+                remaining = max(job['expected'] - (now - job['started']), 0.0)
+                slots.append(remaining)
+                result[job_id] = {'queue_position': 0, 'predicted_wait': 0.0, 'predicted_finish': now + remaining}
+            slots.extend([0.0] * (self.max_concurrent - len(slots)))
+            heapq.heapify(slots)
+            for position, job_id in enumerate(self._ordered_pending(now), 1):
+                free_at = heapq.heappop(slots)
+                finish = free_at + self.pending[job_id]['expected']
+                heapq.heappush(slots, finish)
+                result[job_id] = {'queue_position': position, 'predicted_wait': free_at, 'predicted_finish': now + finish}
+            return result
@@ -0,0 +1,304 @@
+
+# full-text search over finished transcripts: SQLite FTS5 index with CJK bigram tokenization
+"""
+Each indexed segment is stored with its file, job id and start/end time. Text is tokenized
+before it reaches FTS5: Latin words and digits are lower-cased words, runs of CJK characters
+become overlapping bigrams (中文字幕 -> 中文 文字 字幕), and every CJK character is also indexed
+on its own so single-character queries work. Candidates from the index are then checked against
+the segment text, so a hit always contains the query as typed (case and spaces ignored).
+
+Jobs are indexed when they finish (celery_worker._on_job_done). Files already in outputs/
+are picked up incrementally by the CLI:
+
+    python whisper_web/search_index.py reindex            # new or changed .srt/.txt files only
+    python whisper_web/search_index.py search "機器學習 model"
+"""
+import os
+import re
+import sys
+import html
+import time
+import sqlite3
+import argparse
+import unicodedata
+
+INDEX_PATH = os.environ.get('WHISPER_SEARCH_INDEX', os.path.join(os.path.dirname(os.path.abspath(__file__)), 'search_index.db'))
+OUTPUTS_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'outputs')
+# Candidates fetched from the index per requested hit; the rest are dropped by the exact check
+CANDIDATE_FACTOR = 5
+
+CJK = '\u3040-\u30ff\u3400-\u4dbf\u4e00-\u9fff\uf900-\ufaff\uac00-\ud7af'
+TOKEN_RE = re.compile(f'([{CJK}]+)|((?:(?![{CJK}])[^\\W_])+)')
+SRT_TIME_RE = re.compile(r'(\d+):(\d+):(\d+)[,.](\d+)\s*-->\s*(\d+):(\d+):(\d+)[,.](\d+)')
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS files (
+    id INTEGER PRIMARY KEY, path TEXT UNIQUE, job_id TEXT, mtime REAL, size INTEGER, indexed_at REAL
+);
+CREATE TABLE IF NOT EXISTS segments (
+    id INTEGER PRIMARY KEY, file_id INTEGER, seq INTEGER, start REAL, end REAL, text TEXT
+);
+CREATE INDEX IF NOT EXISTS segments_file ON segments(file_id, seq);
+CREATE VIRTUAL TABLE IF NOT EXISTS segments_fts USING fts5(terms, chars, tokenize='unicode61');
+"""
+
+
+def tokenize(text):
+    """(terms, chars): words and CJK bigrams in text order, and the single CJK characters"""
+    terms = []
+    chars = []
+    for cjk, word in TOKEN_RE.findall(unicodedata.normalize('NFKC', text).lower()):
+        if word:
+            terms.append(word)
+        elif len(cjk) == 1:
+            terms.append(cjk)
+            chars.append(cjk)
+        else:
+            terms.extend(cjk[i:i + 2] for i in range(len(cjk) - 1))
+            chars.extend(cjk)
+    return terms, chars
+
+
+def _quote(token):
+    return '"' + token.replace('"', '""') + '"'
+
+
+def _match_expression(query):
+    """FTS5 expression requiring every token of the query; None if the query has no tokens"""
+    clauses = []
+    for cjk, word in TOKEN_RE.findall(unicodedata.normalize('NFKC', query).lower()):
+        if word:
+            # Prefix match, like grep: "transcri" finds "transcription"
+            clauses.append(f'terms : {_quote(word)}*')
+        elif len(cjk) == 1:
+            clauses.append(f'chars : {_quote(cjk)}')
+        else:
+            clauses.extend(f'terms : {_quote(cjk[i:i + 2])}' for i in range(len(cjk) - 1))
+    return ' AND '.join(dict.fromkeys(clauses)) or None
+
+
+def _part_patterns(query):
+    """One regex per whitespace-separated query part; spaces and case inside the text are ignored"""
+    patterns = []
+    for part in query.split():
+        chars = [c for c in unicodedata.normalize('NFKC', part) if not c.isspace()]
+        patterns.append(re.compile(r'\s*'.join(re.escape(c) for c in chars), re.IGNORECASE))
+    return patterns
+
+
+def highlight(text, patterns, start_mark='<mark>', end_mark='</mark>', escape=html.escape):
+    """text with every query match wrapped in the marks (escape is applied to the text around them)"""
+    spans = sorted(m.span() for p in patterns for m in p.finditer(text) if m.end() > m.start())
+    out = []
+    pos = 0
+    for start, end in spans:
+        if start < pos:
+            start = pos
+        if end <= start:
+            continue
+        out.append(escape(text[pos:start]) + start_mark + escape(text[start:end]) + end_mark)
+        pos = end
+    out.append(escape(text[pos:]))
+    return ''.join(out)
+
+
+class SearchIndex:
+    """One connection per instance; open one per thread (SQLite connections are not shared)"""
+
+    def __init__(self, path=INDEX_PATH):
+        self.path = path
+        self.conn = sqlite3.connect(path, timeout=30)
+        self.conn.execute('PRAGMA journal_mode=WAL')
+        self.conn.executescript(SCHEMA)
+
+    def close(self):
+        self.conn.close()
+
+    def _remove(self, file_id):
+        self.conn.execute('DELETE FROM segments_fts WHERE rowid IN (SELECT id FROM segments WHERE file_id = ?)', (file_id,))
+        self.conn.execute('DELETE FROM segments WHERE file_id = ?', (file_id,))
+        self.conn.execute('DELETE FROM files WHERE id = ?', (file_id,))
+
+    def add_file(self, path, segments, job_id=None):
+        """
+        (Re)index one transcript: segments are dicts with start, end (None if unknown) and text.
+        The file's mtime and size are recorded so reindex() skips it while it is unchanged.
+        """
+        path = os.path.abspath(path)
+        try:
+            stat = os.stat(path)
+            mtime, size = stat.st_mtime, stat.st_size
+        except OSError:
+            mtime, size = None, None
+        with self.conn:
+            row = self.conn.execute('SELECT id FROM files WHERE path = ?', (path,)).fetchone()
+            if row:
+                self._remove(row[0])
+            file_id = self.conn.execute(
+                'INSERT INTO files (path, job_id, mtime, size, indexed_at) VALUES (?, ?, ?, ?, ?)',
+                (path, job_id, mtime, size, time.time())).lastrowid
+            for seq, seg in enumerate(segments):
+                text = (seg.get('text') or '').strip()
+                if not text:
+                    continue
+                seg_id = self.conn.execute(
+                    'INSERT INTO segments (file_id, seq, start, end, text) VALUES (?, ?, ?, ?, ?)',
+                    (file_id, seq, seg.get('start'), seg.get('end'), text)).lastrowid
+                terms, chars = tokenize(text)
+                self.conn.execute('INSERT INTO segments_fts (rowid, terms, chars) VALUES (?, ?, ?)',
+                                  (seg_id, ' '.join(terms), ' '.join(chars)))
+        return file_id
+
+    def remove_file(self, path):
+        with self.conn:
+            row = self.conn.execute('SELECT id FROM files WHERE path = ?', (os.path.abspath(path),)).fetchone()
+            if row:
+                self._remove(row[0])
+
+    def reindex(self, root=OUTPUTS_DIR):
+        """Index new or changed .srt/.txt files under root and drop files that were deleted; returns (added, removed)"""
+        known = {path: (mtime, size) for path, mtime, size in self.conn.execute('SELECT path, mtime, size FROM files')}
+        added = 0
+        seen = set()
+        for dirpath, _, filenames in os.walk(root):
+            for name in filenames:
+                ext = os.path.splitext(name)[1].lower()
+                if ext not in ('.srt', '.txt'):
+                    continue
+                path = os.path.abspath(os.path.join(dirpath, name))
+                seen.add(path)
+                stat = os.stat(path)
+                if known.get(path) == (stat.st_mtime, stat.st_size):
+                    continue
+                try:
+                    segments = read_transcript(path)
+                except (OSError, UnicodeDecodeError) as e:
+                    print(f"[ERROR] Could not read {path}: {e}")
+                    continue
+                self.add_file(path, segments)
+                added += 1
+        root = os.path.abspath(root)
+        removed = [p for p in known if p.startswith(root + os.sep) and p not in seen]
+        for path in removed:
+            self.remove_file(path)
+        return added, len(removed)
+
+    def search(self, query, limit=50):
+        """
+        Segments containing every part of the query, best match first. Each hit has file,
+        job_id, start, end, text, highlight (HTML with <mark>) and the neighbouring segments
+        as context_before/context_after.
+        """
+        expression = _match_expression(query)
+        if not expression:
+            return []
+        patterns = _part_patterns(query)
+        rows = self.conn.execute(
+            'SELECT s.id, s.file_id, s.seq, s.start, s.end, s.text, f.path, f.job_id '
+            'FROM segments_fts JOIN segments s ON s.id = segments_fts.rowid JOIN files f ON f.id = s.file_id '
+            'WHERE segments_fts MATCH ? ORDER BY bm25(segments_fts) LIMIT ?',
+            (expression, limit * CANDIDATE_FACTOR)).fetchall()
+        hits = []
+        for seg_id, file_id, seq, start, end, text, path, job_id in rows:
+            if not all(p.search(text) for p in patterns):
+                continue
+            context = dict(self.conn.execute(
+                'SELECT seq, text FROM segments WHERE file_id = ? AND seq IN (?, ?)', (file_id, seq - 1, seq + 1)).fetchall())
+            hits.append({
+                'file': path, 'job_id': job_id, 'start': start, 'end': end, 'text': text,
+                'highlight': highlight(text, patterns),
+                'context_before': context.get(seq - 1), 'context_after': context.get(seq + 1),
+            })
+            if len(hits) >= limit:
+                break
+        return hits
+
+    def stats(self):
+        files, = self.conn.execute('SELECT COUNT(*) FROM files').fetchone()
+        segments, = self.conn.execute('SELECT COUNT(*) FROM segments').fetchone()
+        return {'files': files, 'segments': segments}
+
+
+def _srt_seconds(h, m, s, ms):
+    return int(h) * 3600 + int(m) * 60 + int(s) + int(ms) / 1000
+
+
+def read_transcript(path):
+    """Segments of an .srt file (with timestamps) or a .txt file (one segment per line, no timestamps)"""
+    with open(path, 'r', encoding='utf-8-sig') as f:
+        content = f.read()
+    if not path.lower().endswith('.srt'):
+        return [{'start': None, 'end': None, 'text': line} for line in content.splitlines() if line.strip()]
+    segments = []
+    for block in re.split(r'\n\s*\n', content.replace('\r\n', '\n')):
+        lines = block.strip().split('\n')
+        for i, line in enumerate(lines):
+            m = SRT_TIME_RE.search(line)
+            if m:
+                g = m.groups()
+                segments.append({'start': _srt_seconds(*g[:4]), 'end': _srt_seconds(*g[4:]),
+                                 'text': ' '.join(lines[i + 1:]).strip()})
+                break
+    return segments
+
+
+def index_job(job_id, output_file, segments):
+    """Index a finished job's transcript (called from the worker when the job completes)"""
+    index = SearchIndex()
+    try:
+        index.add_file(output_file, segments, job_id=job_id)
+    finally:
+        index.close()
+
+
+def search(query, limit=50):
+    index = SearchIndex()
+    try:
+        return index.search(query, limit)
+    finally:
+        index.close()
+
+
+def _format_time(seconds):
+    if seconds is None:
+        return '--:--:--'
+    return f"{int(seconds // 3600):02}:{int(seconds % 3600 // 60):02}:{seconds % 60:06.3f}"
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Search finished transcripts")
+    sub = parser.add_subparsers(dest='command', required=True)
+    p_search = sub.add_parser('search', help="Find segments containing the query")
+    p_search.add_argument('query')
+    p_search.add_argument('--limit', type=int, default=20)
+    p_reindex = sub.add_parser('reindex', help="Index new or changed .srt/.txt files")
+    p_reindex.add_argument('root', nargs='?', default=OUTPUTS_DIR)
+    sub.add_parser('stats', help="Show the size of the index")
+    args = parser.parse_args()
+
+    index = SearchIndex()
+    try:
+        if args.command == 'reindex':
+            start = time.time()
+            added, removed = index.reindex(args.root)
+            print(f"Indexed {added} file(s), removed {removed}, in {time.time() - start:.1f}s ({index.stats()})")
+        elif args.command == 'stats':
+            print(index.stats())
+        else:
+            start = time.time()
+            hits = index.search(args.query, args.limit)
+            took = (time.time() - start) * 1000
+            bold = sys.stdout.isatty()
+            patterns = _part_patterns(args.query)
+            for hit in hits:
+                text = highlight(hit['text'], patterns, '\033[1;33m' if bold else '[', '\033[0m' if bold else ']', escape=str)
+                print(f"{hit['file']}  {_format_time(hit['start'])} --> {_format_time(hit['end'])}")
+                print(f"    {text}")
+            print(f"{len(hits)} hit(s) in {took:.1f} ms")
+    finally:
+        index.close()
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())